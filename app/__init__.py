@@ -5,15 +5,66 @@ from flask_login import LoginManager
 import cloudinary
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
+from app.routing import RoutingSession, replica_binds
 import os
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = 'nhom6@321'
-app.config["SQLALCHEMY_DATABASE_URI"] = "mysql+pymysql://root:%s@localhost/oufooddb?charset=utf8mb4" % quote("Admin@123")
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "DATABASE_URL", "mysql+pymysql://root:%s@localhost/oufooddb?charset=utf8mb4" % quote("Admin@123"))
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
+# Replica chỉ đọc, cách nhau bởi dấu phẩy; hàm DAO gắn routing.read_only sẽ đọc từ đây
+app.config["SQLALCHEMY_BINDS"] = replica_binds(os.environ.get("DATABASE_REPLICA_URLS", ""))
+app.config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 30))
+# Áp dụng cho primary và mọi replica; kích thước pool chỉ đặt khi có cấu hình
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "1") == "1",
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 280)),
+    **{option: int(os.environ[env]) for option, env in (("pool_size", "DB_POOL_SIZE"),
+                                                        ("max_overflow", "DB_MAX_OVERFLOW"),
+                                                        ("pool_timeout", "DB_POOL_TIMEOUT"))
+       if os.environ.get(env)}
+}
 app.config["PAGE_SIZE"] = 8
+app.config["REVIEW_PAGE_SIZE"] = 5
+app.config["ORDER_PAGE_SIZE"] = int(os.environ.get("ORDER_PAGE_SIZE", 20))
+app.config["HOME_CACHE_SIZE"] = int(os.environ.get("HOME_CACHE_SIZE", 256))
+app.config["HOME_CACHE_TTL"] = int(os.environ.get("HOME_CACHE_TTL", 300))
+app.config["SEARCH_REBUILD_INTERVAL"] = int(os.environ.get("SEARCH_REBUILD_INTERVAL", 600))
+app.config["STOCK_HOLD_TTL"] = int(os.environ.get("STOCK_HOLD_TTL", 900))
+app.config["STOCK_HOLD_SWEEP_INTERVAL"] = int(os.environ.get("STOCK_HOLD_SWEEP_INTERVAL", 60))
+app.config["CART_STORE"] = os.environ.get("CART_STORE", "sql")
+app.config["CART_TTL_DAYS"] = int(os.environ.get("CART_TTL_DAYS", 7))
+app.config["PAYMENT_WORKERS"] = int(os.environ.get("PAYMENT_WORKERS", 4))
+app.config["PAYMENT_CACHE_SIZE"] = int(os.environ.get("PAYMENT_CACHE_SIZE", 4096))
+app.config["PAYMENT_CACHE_TTL"] = int(os.environ.get("PAYMENT_CACHE_TTL", 600))
+app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 1024))
+app.config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 60))
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", 4))
+app.config["PASSWORD_HASH_TIMEOUT"] = float(os.environ.get("PASSWORD_HASH_TIMEOUT", 10))
+app.config["EVENT_BROKER"] = os.environ.get("EVENT_BROKER", "")
+app.config["EVENT_QUEUE_SIZE"] = int(os.environ.get("EVENT_QUEUE_SIZE", 100))
+app.config["EVENT_HEARTBEAT"] = int(os.environ.get("EVENT_HEARTBEAT", 15))
+app.config["MEDIA_STORAGE"] = os.environ.get("MEDIA_STORAGE", "cloudinary")
+app.config["MEDIA_ROOT"] = os.environ.get("MEDIA_ROOT", os.path.join(app.static_folder, "uploads"))
+app.config["MEDIA_URL"] = os.environ.get("MEDIA_URL", "/static/uploads")
+app.config["MEDIA_WORKERS"] = int(os.environ.get("MEDIA_WORKERS", 2))
+app.config["MEDIA_RETRIES"] = int(os.environ.get("MEDIA_RETRIES", 3))
+app.config["MEDIA_BACKOFF"] = float(os.environ.get("MEDIA_BACKOFF", 1))
+app.config["MEDIA_PLACEHOLDER"] = os.environ.get("MEDIA_PLACEHOLDER", "/static/img/placeholder.png")
+app.config["THUMB_WIDTHS"] = tuple(int(w) for w in os.environ.get("THUMB_WIDTHS", "160,320,640").split(","))
+app.config["THUMB_QUALITY"] = int(os.environ.get("THUMB_QUALITY", 80))
+app.config["THUMB_CACHE_DIR"] = os.environ.get("THUMB_CACHE_DIR", os.path.join(app.instance_path, "thumbs"))
+app.config["THUMB_CACHE_BYTES"] = int(os.environ.get("THUMB_CACHE_BYTES", 256 * 1024 * 1024))
+app.config["THUMB_MAX_AGE"] = int(os.environ.get("THUMB_MAX_AGE", 365 * 24 * 3600))
+app.config["THUMB_MAX_SOURCE_BYTES"] = int(os.environ.get("THUMB_MAX_SOURCE_BYTES", 10 * 1024 * 1024))
+app.config["THUMB_FETCH_TIMEOUT"] = float(os.environ.get("THUMB_FETCH_TIMEOUT", 5))
+app.config["THUMB_FAILURE_CACHE_SIZE"] = int(os.environ.get("THUMB_FAILURE_CACHE_SIZE", 1024))
+app.config["THUMB_FAILURE_TTL"] = int(os.environ.get("THUMB_FAILURE_TTL", 60))
 
 app.config['VNPAY_RETURN_URL'] = os.environ.get('VNPAY_RETURN_URL')
 app.config['VNPAY_PAYMENT_URL'] = os.environ.get('VNPAY_PAYMENT_URL')
@@ -24,10 +75,16 @@ app.config['MOMO_RETURN_URL'] = os.environ.get('MOMO_RETURN_URL')
 app.config['MOMO_PAYMENT_URL'] = os.environ.get('MOMO_PAYMENT_URL')
 app.config['MOMO_ACCESS_KEY'] = os.environ.get('MOMO_ACCESS_KEY')
 app.config['MOMO_SECRET_KEY'] = os.environ.get('MOMO_SECRET_KEY')
+app.config['MOMO_IPN_URL'] = os.environ.get('MOMO_IPN_URL', "https://webhook.site/b3088a6a-2d17-4f8d-a383-71389a6c600b")
+app.config['MOMO_CONNECT_TIMEOUT'] = float(os.environ.get('MOMO_CONNECT_TIMEOUT', 3))
+app.config['MOMO_READ_TIMEOUT'] = float(os.environ.get('MOMO_READ_TIMEOUT', 10))
+app.config['MOMO_RETRIES'] = int(os.environ.get('MOMO_RETRIES', 2))
+app.config['MOMO_BACKOFF'] = float(os.environ.get('MOMO_BACKOFF', 0.3))
+app.config['MOMO_POOL_SIZE'] = int(os.environ.get('MOMO_POOL_SIZE', 10))
 
 oauth = OAuth(app)
 
-db = SQLAlchemy(app=app)
+db = SQLAlchemy(app=app, session_options={"class_": RoutingSession})
 login = LoginManager(app=app)
 
 # Configuration
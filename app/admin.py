@@ -3,8 +3,8 @@ from flask import redirect, request
 from flask_admin import Admin, expose, AdminIndexView, BaseView
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user, logout_user
-from app import app, db, decorators
-from sqlalchemy import func
+from app import app, db, decorators, cache, dao, search, identity, passwords
+from sqlalchemy import func, inspect
 from models import *
 
 # Trang chủ admin
@@ -26,6 +26,16 @@ class AuthenticatedAdminView(ModelView):
     def inaccessible_callback(self, name, **kwargs):
         return redirect('/login')
 
+# Dữ liệu hiển thị ở trang chủ: sửa/xóa phải làm mới cache và chỉ mục tìm kiếm
+class CatalogAdminView(AuthenticatedAdminView):
+    def after_model_change(self, form, model, is_created):
+        search.index_model(model)
+        cache.bump_data_version()
+
+    def after_model_delete(self, model):
+        search.remove_model(model)
+        cache.bump_data_version()
+
 # View có xác thực chung
 class AuthenticatedView(BaseView):
     def is_accessible(self):
@@ -60,35 +70,14 @@ class StatsView(AuthenticatedView):
         if not restaurant_id and restaurants:
             restaurant_id = restaurants[0].id
 
-        # --- Lấy danh sách order_id của nhà hàng được chọn ---
-        order_ids_query = db.session.query(Order.id).join(Order.order_details) \
-            .join(OrderDetail.cuisine) \
-            .join(Cuisine.cuisine_type) \
-            .filter(CuisineType.restaurant_id == restaurant_id) \
-            .distinct()
-
-        order_ids = [oid[0] for oid in order_ids_query.all()]  # chuyển thành list[int]
-
-        # --- Truy vấn thống kê doanh thu theo ngày từ các Payment của các order trên ---
-        revenue_stats = []
-        if order_ids:
-            revenue_stats = db.session.query(
-                func.date(Payment.created_date).label('date'),
-                func.sum(Payment.total).label('total_revenue')
-            ).filter(
-                Payment.status == PaymentStatus.PAID,
-                Payment.order_id.in_(order_ids),
-                Payment.created_date >= from_date,
-                Payment.created_date <= to_date
-            ).group_by(func.date(Payment.created_date)) \
-            .order_by(func.date(Payment.created_date)) \
-            .all()
+        # --- Doanh thu theo ngày: quét khoảng (restaurant_id, date) trên bảng tổng hợp ---
+        revenue_stats = dao.get_daily_revenue(restaurant_id, from_date.date(), to_date.date())
 
         labels = [r.date.strftime('%Y-%m-%d') for r in revenue_stats]
-        values = [float(r.total_revenue) for r in revenue_stats]
+        values = [float(r.revenue) for r in revenue_stats]
 
-        # --- Đếm tổng số đơn hàng duy nhất ---
-        order_count = len(order_ids)
+        # --- Tổng số đơn hàng trong khoảng ngày ---
+        order_count = sum(r.order_count for r in revenue_stats)
 
         return self.render('admin/stats.html',
                            labels=labels,
@@ -106,7 +95,20 @@ class UserAdminView(AuthenticatedAdminView):
     column_filters = ['role']
     column_sortable_list = ['id', 'name', 'username', 'email', 'phone', 'role', 'created_date', 'updated_date']
 
-class CuisineAdminView(AuthenticatedAdminView):
+    # Mật khẩu gõ trong trang admin được băm trước khi lưu
+    def on_model_change(self, form, model, is_created):
+        if is_created or inspect(model).attrs.password.history.has_changes():
+            model.password = passwords.hash_password(model.password) if model.password \
+                else passwords.UNUSABLE_PASSWORD
+
+    # Danh tính trong cache của user_loader phải theo kịp thay đổi tên/quyền/ảnh đại diện
+    def after_model_change(self, form, model, is_created):
+        identity.invalidate(model.id)
+
+    def after_model_delete(self, model):
+        identity.invalidate(model.id)
+
+class CuisineAdminView(CatalogAdminView):
     column_list = ['id', 'name', 'price', 'image', 'description', 'status', 'count', 'cuisine_type', 'food_type', 'beverage_type', 'created_date', 'updated_date']
     form_columns = ['name', 'price', 'image', 'description', 'status', 'count',
                     'cuisine_type', 'food_type', 'beverage_type']
@@ -114,25 +116,43 @@ class CuisineAdminView(AuthenticatedAdminView):
     column_filters = ['status', 'food_type', 'beverage_type', 'cuisine_type_id']
     column_sortable_list = ['id', 'name', 'price', 'count', 'cuisine_type_id', 'created_date', 'updated_date']
 
-class CuisineTypeAdminView(AuthenticatedAdminView):
+class CuisineTypeAdminView(CatalogAdminView):
     column_list = ['id', 'name', 'restaurant', 'created_date', 'updated_date']
     form_columns = ['name', 'restaurant', 'created_date', 'updated_date']
     column_searchable_list = ['id', 'name']
     column_sortable_list = ['id', 'name', 'created_date', 'updated_date']
 
-class RestaurantAdminView(AuthenticatedAdminView):
+class RestaurantAdminView(CatalogAdminView):
     column_list = ['id', 'user', 'location', 'type', 'name', 'introduce', 'image', 'created_date', 'updated_date']
     form_columns = ['user', 'location', 'type', 'name', 'introduce', 'image', 'created_date', 'updated_date']
     column_searchable_list = ['id', 'name', 'location', 'type']
     column_sortable_list = ['id', 'name', 'type', 'location', 'created_date', 'updated_date']
 
-class ReviewAdminView(AuthenticatedAdminView):
+    def on_model_change(self, form, model, is_created):
+        if is_created:
+            self.session.flush()
+            dao.ensure_rating_summary(model.id)
+
+class ReviewAdminView(CatalogAdminView):
     column_list = ['id', 'content', 'rate', 'date', 'user', 'restaurant', 'created_date', 'updated_date']
     form_columns = ['content', 'rate', 'date', 'user', 'restaurant', 'created_date', 'updated_date']
     column_searchable_list = ['id', 'content']
     column_filters = ['rate', 'user_id', 'restaurant_id']
     column_sortable_list = ['id', 'rate', 'date', 'created_date', 'updated_date']
 
+    # Giữ bảng tổng hợp đánh giá khớp với Review trong cùng transaction
+    def on_model_change(self, form, model, is_created):
+        if not is_created:
+            # Đọc giá trị cũ từ DB: đổi quan hệ restaurant chưa nạp thì history của thuộc tính để trống
+            with db.session.no_autoflush:
+                old = db.session.query(Review.restaurant_id, Review.created_date, Review.rate) \
+                    .filter(Review.id == model.id).one()
+            dao.update_review_rollups(old.restaurant_id, old.created_date, old.rate, delta=-1)
+        dao.update_review_rollups(model.restaurant.id, model.created_date, model.rate)
+
+    def on_model_delete(self, model):
+        dao.update_review_rollups(model.restaurant_id, model.created_date, model.rate, delta=-1)
+
 class OrderAdminView(AuthenticatedAdminView):
     column_list = ['id', 'status', 'user', 'receiver_name', 'receiver_phone', 'receiver_address', 'created_date', 'updated_date']
     form_columns = ['status', 'user', 'receiver_name', 'receiver_phone', 'receiver_address', 'created_date', 'updated_date']
@@ -0,0 +1,89 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from app import app, momo
+from fake_momo import serve
+
+
+# So sánh kết nối mới mỗi lần (cách cũ) với client dùng pool kết nối, có timeout/thử lại:
+#   python bench/bench_momo.py --requests 400 --concurrency 16 --latency 20 --fail-rate 0.05
+def report(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"{name:<10} {len(latencies) / elapsed:8.1f} req/s  p50 {q[49] * 1000:7.1f} ms  "
+          f"p95 {q[94] * 1000:7.1f} ms  p99 {q[98] * 1000:7.1f} ms  lỗi {errors}")
+
+
+def run_threads(name, call, total, concurrency):
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            call(f"bench-{name}-{i}")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        except Exception:
+            with lock:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(total)))
+    report(name, latencies, errors, time.perf_counter() - start)
+
+
+async def run_async(total, concurrency):
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await momo.get_payment_url_async(f"bench-async-{i}", 10000)
+                latencies.append(time.perf_counter() - start)
+            except momo.MomoError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    report("async", latencies, errors, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=20, help="ms")
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--port", type=int, default=9099)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, fail_rate=args.fail_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    endpoint = f"http://127.0.0.1:{args.port}/v2/gateway/api/create"
+    app.config.update(MOMO_PAYMENT_URL=endpoint, MOMO_ACCESS_KEY="bench", MOMO_SECRET_KEY="bench",
+                      MOMO_RETURN_URL="http://localhost/momo_payment_return", MOMO_POOL_SIZE=args.concurrency)
+
+    def unpooled(order_id):
+        res = requests.post(endpoint, json=momo.build_request(order_id, 10000)).json()
+        return res["payUrl"]
+
+    with app.app_context():
+        run_threads("no-pool", unpooled, args.requests, args.concurrency)
+        run_threads("pooled", lambda order_id: momo.get_payment_url(order_id, 10000), args.requests,
+                    args.concurrency)
+        asyncio.run(run_async(args.requests, args.concurrency))
+    server.shutdown()
@@ -0,0 +1,35 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import app, passwords
+
+
+def rate(verify, total, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        assert all(pool.map(lambda _: verify(), range(total)))
+    return total / (time.perf_counter() - start)
+
+
+# Số lần đăng nhập (kiểm tra mật khẩu) mỗi giây ở chi phí băm đang chọn:
+#   python bench/bench_passwords.py --method scrypt:32768:8:1 --logins 40
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--method", default=app.config["PASSWORD_HASH_METHOD"])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=app.config["PASSWORD_HASH_WORKERS"])
+    args = parser.parse_args()
+
+    app.config.update(PASSWORD_HASH_METHOD=args.method, PASSWORD_HASH_WORKERS=args.workers,
+                      PASSWORD_HASH_TIMEOUT=600)
+    stored = passwords.hash_password("123456")
+
+    single = rate(lambda: passwords._check(stored, "123456"), args.logins, 1)
+    pooled = rate(lambda: passwords.verify(stored, "123456"), args.logins, args.workers * 4)
+    print(f"{args.method}: {single:.1f} đăng nhập/s trên 1 lõi, "
+          f"{pooled:.1f}/s qua pool {args.workers} luồng ({os.cpu_count()} CPU), "
+          f"{1000 / single:.0f} ms mỗi lần")
@@ -0,0 +1,64 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import argparse
+import hashlib
+import hmac
+import time
+import urllib.parse
+from app.vnpay import VnpayRequest, VnpayResponse
+
+SECRET = "BENCHSECRETKEY0123456789ABCDEFGH"
+PARAMS = {
+    "vnp_Version": "2.1.0", "vnp_Command": "pay", "vnp_TmnCode": "BENCH001", "vnp_Amount": 15000000,
+    "vnp_CurrCode": "VND", "vnp_TxnRef": "9f1c2d3e-4b5a-6789-abcd-ef0123456789",
+    "vnp_OrderInfo": "Thanh toan don hang OUFood", "vnp_OrderType": "billpayment", "vnp_Locale": "vn",
+    "vnp_CreateDate": "20241201120000", "vnp_IpAddr": "127.0.0.1",
+    "vnp_ReturnUrl": "http://localhost:8000/vnpay_payment_return"
+}
+
+
+# Cách cũ: nối chuỗi từng tham số, băm lại khóa mỗi lần, so sánh bằng ==
+def legacy_sign(params):
+    query = ''
+    for key, val in sorted(params.items()):
+        if query:
+            query = query + "&" + key + '=' + urllib.parse.quote_plus(str(val))
+        else:
+            query = key + '=' + urllib.parse.quote_plus(str(val))
+    return query, hmac.new(SECRET.encode('utf-8'), query.encode('utf-8'), hashlib.sha512).hexdigest()
+
+
+def legacy_verify(args):
+    args = dict(args)
+    secure_hash = args.pop('vnp_SecureHash')
+    return legacy_sign(args)[1] == secure_hash
+
+
+def rate(f, seconds):
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(200):
+            f()
+        count += 200
+    return count / (time.perf_counter() - start)
+
+
+# Số lần ký/kiểm tra mỗi giây trên một lõi:
+#   python bench/bench_vnpay.py --seconds 2
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2)
+    args = parser.parse_args()
+
+    query, secure_hash = legacy_sign(PARAMS)
+    response = {**{k: str(v) for k, v in PARAMS.items()}, "vnp_SecureHash": secure_hash}
+    assert VnpayResponse(response).validate(SECRET) and legacy_verify(response)
+
+    results = [
+        ("sign", lambda: legacy_sign(PARAMS), lambda: VnpayRequest(PARAMS).get_payment_url("https://pay", SECRET)),
+        ("verify", lambda: legacy_verify(response), lambda: VnpayResponse(response).validate(SECRET)),
+    ]
+    for name, old, new in results:
+        old_rate, new_rate = rate(old, args.seconds), rate(new, args.seconds)
+        print(f"{name:<7} cũ {old_rate:10.0f}/s   mới {new_rate:10.0f}/s   x{new_rate / old_rate:.2f}")
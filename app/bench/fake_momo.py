@@ -0,0 +1,65 @@
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# Cổng MoMo giả lập để đo độ trễ/lỗi khi không có mạng:
+#   python bench/fake_momo.py --port 9099 --latency 200 --fail-rate 0.1
+def make_handler(latency, jitter, fail_rate, hang_rate, hang):
+    class FakeMomoHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            roll = random.random()
+            if roll < hang_rate:
+                time.sleep(hang)
+            else:
+                time.sleep(max(latency + random.uniform(-jitter, jitter), 0) / 1000)
+
+            if roll < hang_rate + fail_rate:
+                self.reply(503, {"resultCode": 99, "message": "Service Unavailable"})
+            else:
+                self.reply(200, {
+                    "partnerCode": body.get("partnerCode"),
+                    "orderId": body.get("orderId"),
+                    "requestId": body.get("requestId"),
+                    "resultCode": 0,
+                    "payUrl": f"http://localhost/fake-momo/pay/{uuid.uuid4()}"
+                })
+
+        def reply(self, status, data):
+            raw = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeMomoHandler
+
+
+def serve(port=9099, latency=50, jitter=0, fail_rate=0, hang_rate=0, hang=30):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, jitter, fail_rate, hang_rate, hang))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9099)
+    parser.add_argument("--latency", type=float, default=50, help="ms")
+    parser.add_argument("--jitter", type=float, default=0, help="ms")
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--hang-rate", type=float, default=0)
+    parser.add_argument("--hang", type=float, default=30, help="s")
+    args = parser.parse_args()
+    print(f"Fake MoMo tại http://127.0.0.1:{args.port}/")
+    serve(args.port, args.latency, args.jitter, args.fail_rate, args.hang_rate, args.hang).serve_forever()
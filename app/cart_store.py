@@ -0,0 +1,345 @@
+import copy
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app import app, db
+from models import Cart, CartItem
+
+ITEM_FIELDS = ("name", "price", "image", "count")
+
+# Trạng thái giỏ hàng: đang mua, đã gửi sang cổng thanh toán, hoàn tất đơn thất bại
+OPEN, PENDING, FAILED = "OPEN", "PENDING", "FAILED"
+
+
+# Giỏ đã gửi sang cổng thanh toán: nội dung phải giữ nguyên đúng như số tiền khách đã trả
+class CartLockedError(Exception):
+    pass
+
+
+def _check_open(cart_id, status):
+    if (status or OPEN) != OPEN:
+        raise CartLockedError(f"Giỏ hàng {cart_id} đang thanh toán, không sửa được")
+
+
+def new_cart_id():
+    return str(uuid.uuid4())
+
+
+def _item(cuisine_id, data, quantity=1, note=""):
+    return {
+        "id": str(cuisine_id),
+        **{f: data.get(f) for f in ITEM_FIELDS},
+        "quantity": quantity,
+        "note": note
+    }
+
+
+def _price(price):
+    return float(price or 0)
+
+
+def _totals(total_quantity=0, total_amount=0):
+    return {"total_quantity": total_quantity, "total_amount": total_amount}
+
+
+def _sum(items):
+    return _totals(sum(int(i["quantity"]) for i in items),
+                   sum(int(i["quantity"]) * _price(i["price"]) for i in items))
+
+
+# Giỏ hàng trong bộ nhớ tiến trình: dùng khi phát triển/chạy thử, mất khi khởi động lại
+class MemoryCartStore:
+    def __init__(self):
+        self._carts = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+
+    def _new(self, cart_id):
+        return {"order_id": cart_id, "items": {}, "status": OPEN, **_totals()}
+
+    def _result(self, cart_id):
+        cart = self._carts.get(cart_id)
+        return _totals(cart["total_quantity"], cart["total_amount"]) if cart else _totals()
+
+    def get(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            return copy.deepcopy(cart) if cart else None
+
+    def exists(self, cart_id):
+        return cart_id in self._carts
+
+    def totals(self, cart_id):
+        with self._lock:
+            return self._result(cart_id)
+
+    def create(self, cart_id=None):
+        cart_id = cart_id or new_cart_id()
+        with self._lock:
+            self._carts.setdefault(cart_id, self._new(cart_id))
+            self._touched[cart_id] = datetime.now()
+        return cart_id
+
+    def add_item(self, cart_id, cuisine_id, data):
+        with self._lock:
+            cart = self._carts.setdefault(cart_id, self._new(cart_id))
+            _check_open(cart_id, cart.get("status"))
+            item = cart["items"].get(str(cuisine_id))
+            if item:
+                item["quantity"] += 1
+            else:
+                item = cart["items"][str(cuisine_id)] = _item(cuisine_id, data)
+            cart["total_quantity"] += 1
+            cart["total_amount"] += _price(item["price"])
+            self._touched[cart_id] = datetime.now()
+            return self._result(cart_id)
+
+    def update_item(self, cart_id, cuisine_id, quantity=None, note=None):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart:
+                _check_open(cart_id, cart.get("status"))
+            item = cart["items"].get(str(cuisine_id)) if cart else None
+            if item:
+                if quantity is not None:
+                    cart["total_quantity"] += quantity - item["quantity"]
+                    cart["total_amount"] += (quantity - item["quantity"]) * _price(item["price"])
+                    item["quantity"] = quantity
+                if note is not None:
+                    item["note"] = note
+                self._touched[cart_id] = datetime.now()
+            return self._result(cart_id)
+
+    def remove_item(self, cart_id, cuisine_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart:
+                _check_open(cart_id, cart.get("status"))
+            item = cart["items"].pop(str(cuisine_id), None) if cart else None
+            if item:
+                cart["total_quantity"] -= item["quantity"]
+                cart["total_amount"] -= item["quantity"] * _price(item["price"])
+            return self._result(cart_id)
+
+    def checkout(self, cart_id, receiver, user_id):
+        with self._lock:
+            if cart_id in self._carts:
+                self._carts[cart_id].update(receiver=dict(receiver), user_id=user_id, status=PENDING)
+
+    def mark_failed(self, cart_id, errors):
+        with self._lock:
+            if cart_id in self._carts:
+                self._carts[cart_id].update(status=FAILED, errors=list(errors))
+
+    def reopen(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart and cart.get("status") == PENDING:
+                cart["status"] = OPEN
+                self._touched[cart_id] = datetime.now()
+
+    def recalculate(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart:
+                cart.update(_sum(cart["items"].values()))
+            return self._result(cart_id)
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+            self._touched.pop(cart_id, None)
+
+    def import_cart(self, cart):
+        cart_id = cart.get("order_id") or new_cart_id()
+        cart = {"status": OPEN, **copy.deepcopy(cart), "order_id": cart_id}
+        cart.update(_sum(cart["items"].values()))
+        with self._lock:
+            self._carts[cart_id] = cart
+            self._touched[cart_id] = datetime.now()
+        return cart_id
+
+    def purge(self, before):
+        with self._lock:
+            stale = [k for k, t in self._touched.items() if t < before]
+            for k in stale:
+                self._carts.pop(k, None)
+                del self._touched[k]
+        return len(stale)
+
+
+# Giỏ hàng trong bảng cart/cart_item (SQLite/MySQL): mỗi thao tác chỉ sửa một dòng món
+# và cộng dồn tổng số lượng/tổng tiền trên dòng giỏ hàng trong cùng transaction
+class SqlCartStore:
+    def get(self, cart_id):
+        rows = db.session.query(Cart, CartItem) \
+            .outerjoin(CartItem, CartItem.cart_id == Cart.id) \
+            .filter(Cart.id == cart_id).all()
+        if not rows:
+            return None
+
+        c = rows[0][0]
+        cart = {"order_id": cart_id, "items": {}, "user_id": c.user_id, "status": c.status or OPEN,
+                **_totals(c.total_quantity, c.total_amount)}
+        if c.receiver:
+            cart["receiver"] = c.receiver
+        if c.errors:
+            cart["errors"] = c.errors
+        for _, i in rows:
+            if i is not None:
+                cart["items"][str(i.cuisine_id)] = _item(i.cuisine_id, {f: getattr(i, f) for f in ITEM_FIELDS},
+                                                               i.quantity, i.note or "")
+        return cart
+
+    def exists(self, cart_id):
+        return db.session.execute(select(Cart.id).where(Cart.id == cart_id)).first() is not None
+
+    def totals(self, cart_id):
+        row = db.session.execute(select(Cart.total_quantity, Cart.total_amount).where(Cart.id == cart_id)).first()
+        return _totals(*row) if row else _totals()
+
+    def _run(self, f):
+        try:
+            result = f()
+            db.session.commit()
+            return result
+        except (SQLAlchemyError, CartLockedError) as e:
+            db.session.rollback()
+            raise e
+
+    # Khóa dòng giỏ hàng để các thao tác song song trên cùng giỏ không làm lệch tổng
+    def _locked(self, cart_id, cuisine_id):
+        cart = db.session.get(Cart, cart_id, with_for_update=True)
+        if cart:
+            _check_open(cart_id, cart.status)
+        item = db.session.get(CartItem, (cart_id, int(cuisine_id))) if cart else None
+        return cart, item
+
+    def create(self, cart_id=None):
+        cart_id = cart_id or new_cart_id()
+        self._run(lambda: db.session.add(Cart(id=cart_id, total_quantity=0, total_amount=0)))
+        return cart_id
+
+    def add_item(self, cart_id, cuisine_id, data):
+        def add():
+            cart, item = self._locked(cart_id, cuisine_id)
+            if cart is None:
+                cart = Cart(id=cart_id, total_quantity=0, total_amount=0)
+                db.session.add(cart)
+            if item:
+                item.quantity += 1
+            else:
+                item = CartItem(cart_id=cart_id, cuisine_id=int(cuisine_id), quantity=1, note="",
+                                **{f: data.get(f) for f in ITEM_FIELDS})
+                db.session.add(item)
+            cart.total_quantity += 1
+            cart.total_amount += _price(item.price)
+            db.session.flush()
+            return _totals(cart.total_quantity, cart.total_amount)
+
+        try:
+            return self._run(add)
+        except IntegrityError:
+            # Hai request thêm cùng món một lúc (SQLite không khóa dòng): chạy lại, lần này dòng đã có
+            return self._run(add)
+
+    def update_item(self, cart_id, cuisine_id, quantity=None, note=None):
+        def change():
+            cart, item = self._locked(cart_id, cuisine_id)
+            if item:
+                if quantity is not None:
+                    cart.total_quantity += quantity - item.quantity
+                    cart.total_amount += (quantity - item.quantity) * _price(item.price)
+                    item.quantity = quantity
+                if note is not None:
+                    item.note = note
+            return _totals(cart.total_quantity, cart.total_amount) if cart else _totals()
+
+        return self._run(change)
+
+    def remove_item(self, cart_id, cuisine_id):
+        def remove():
+            cart, item = self._locked(cart_id, cuisine_id)
+            if item:
+                cart.total_quantity -= item.quantity
+                cart.total_amount -= item.quantity * _price(item.price)
+                db.session.delete(item)
+            return _totals(cart.total_quantity, cart.total_amount) if cart else _totals()
+
+        return self._run(remove)
+
+    def checkout(self, cart_id, receiver, user_id):
+        self._run(lambda: db.session.execute(update(Cart).where(Cart.id == cart_id)
+                                             .values(receiver=dict(receiver), user_id=user_id, status=PENDING,
+                                                     updated_date=datetime.now())))
+
+    def mark_failed(self, cart_id, errors):
+        self._run(lambda: db.session.execute(update(Cart).where(Cart.id == cart_id)
+                                             .values(status=FAILED, errors=list(errors),
+                                                     updated_date=datetime.now())))
+
+    def reopen(self, cart_id):
+        self._run(lambda: db.session.execute(update(Cart).where(Cart.id == cart_id, Cart.status == PENDING)
+                                             .values(status=OPEN, updated_date=datetime.now())))
+
+    def recalculate(self, cart_id):
+        def change():
+            cart = db.session.get(Cart, cart_id, with_for_update=True)
+            if cart is None:
+                return _totals()
+            totals = _sum([{"quantity": i.quantity, "price": i.price}
+                           for i in CartItem.query.filter(CartItem.cart_id == cart_id)])
+            cart.total_quantity, cart.total_amount = totals["total_quantity"], totals["total_amount"]
+            return totals
+
+        return self._run(change)
+
+    def delete(self, cart_id):
+        def remove():
+            db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+            db.session.execute(delete(Cart).where(Cart.id == cart_id))
+
+        self._run(remove)
+
+    def import_cart(self, cart):
+        cart_id = cart.get("order_id") or new_cart_id()
+        totals = _sum(cart.get("items", {}).values())
+
+        def add():
+            db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+            db.session.merge(Cart(id=cart_id, receiver=cart.get("receiver"), **totals))
+            db.session.add_all([CartItem(cart_id=cart_id, cuisine_id=int(cuisine_id),
+                                         quantity=int(i.get("quantity", 1)), note=i.get("note") or "",
+                                         **{f: i.get(f) for f in ITEM_FIELDS})
+                                for cuisine_id, i in cart.get("items", {}).items()])
+
+        self._run(add)
+        return cart_id
+
+    def purge(self, before):
+        def remove():
+            # Giỏ hàng bị bỏ quên: cả giỏ và mọi món trong giỏ đều không đổi từ trước mốc thời gian
+            active = select(CartItem.cart_id).where(CartItem.updated_date >= before)
+            stale = select(Cart.id).where(Cart.updated_date < before, Cart.id.not_in(active))
+            stale_ids = [cart_id for (cart_id,) in db.session.execute(stale)]
+            if stale_ids:
+                db.session.execute(delete(CartItem).where(CartItem.cart_id.in_(stale_ids)))
+                db.session.execute(delete(Cart).where(Cart.id.in_(stale_ids)))
+            return len(stale_ids)
+
+        return self._run(remove)
+
+
+STORES = {
+    "memory": MemoryCartStore,
+    "sql": SqlCartStore
+}
+
+store = STORES[app.config["CART_STORE"]]()
+
+
+def purge_stale(days=None):
+    days = app.config["CART_TTL_DAYS"] if days is None else days
+    return store.purge(datetime.now() - timedelta(days=days))
@@ -1,31 +1,41 @@
-import hashlib
-import cloudinary.uploader
 from sqlalchemy.exc import SQLAlchemyError
-from datetime import  datetime, timedelta
-from app import app, db
+from datetime import  datetime, timedelta, date
+from app import app, db, cache, search, utils, reservation, identity, passwords, events, routing, media
 
 from models import User, Order, Payment, OrderDetail, Cuisine, OrderStatus, Restaurant, CuisineType, Review, \
-    PaymentStatus, Plan, Tenant, Subscription, SaasPayment
-from sqlalchemy import func, DateTime
+    PaymentStatus, Plan, Tenant, Subscription, SaasPayment, RestaurantRating, FoodType, BeverageType, Role, \
+    DailyRevenue, MonthlyReview
+from sqlalchemy import func, DateTime, update, insert, bindparam, case, cast, Float, or_, and_, false
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
 
 def auth_user(username, password, role=None):
-    password = str(hashlib.md5(password.encode('utf-8')).hexdigest())
-    u = User.query.filter(User.username.__eq__(username),
-                          User.password.__eq__(password))
+    u = User.query.filter(User.username.__eq__(username))
 
     if role:
         u = u.filter(User.role.__eq__(role))
 
-    return u.first()
+    u = u.first()
+    password = password or ''
+    if u is None:
+        return passwords.verify_dummy(password) or None
+    if not passwords.verify(u.password, password):
+        return None
+
+    # Mật khẩu MD5 cũ (hoặc chi phí băm đã đổi) được băm lại ngay khi đăng nhập đúng
+    if passwords.needs_rehash(u.password):
+        u.password = passwords.hash_password(password)
+        db.session.commit()
+    return u
 
 
 def get_user_by_id(id):
     return User.query.get(id)
 
 
-def add_user(name, username, password, email, phone, role, address=None, avatar=None):
-    password = hashlib.md5(password.encode('utf-8')).hexdigest()
+def add_user(name, username, password, email, phone, role=None, address=None, avatar=None):
+    password = passwords.hash_password(password) if password else passwords.UNUSABLE_PASSWORD
 
     u = User(
         name=name,
@@ -34,49 +44,77 @@ def add_user(name, username, password, email, phone, role, address=None, avatar=
         email=email,
         phone=phone,
         address=address,
-        role=role
+        role=role or Role.CUSTOMER
     )
 
-    if avatar:
-        res = cloudinary.uploader.upload(avatar)
-        u.avatar = res.get('secure_url')
-
     db.session.add(u)
     db.session.commit()
+    identity.invalidate(u.id)
+    # Ảnh đại diện mặc định cho tới khi tải xong ở nền
+    media.upload_later(User, u.id, 'avatar', avatar)
     return u.id
 
 def get_user_by_email(email):
     return User.query.filter_by(email=email).first()
 
 
-def get_order(user_id):
-    return (db.session.query(
+OPEN_ORDER_STATUSES = (OrderStatus.NEWORDER, OrderStatus.PROCESSING)
+
+
+def parse_order_statuses(names):
+    statuses = [OrderStatus[n] for n in names if n in OrderStatus.__members__]
+    return statuses or list(OPEN_ORDER_STATUSES)
+
+
+# Hàng đợi đơn của chủ quán: lọc trạng thái/ngày và phân trang keyset theo chỉ mục
+# (restaurant_id, status, created_date, id); đơn nhiều nhà hàng (restaurant_id NULL) kiểm tra qua order_detail
+@routing.read_only
+def get_order(user_id, statuses=None, from_date=None, to_date=None, cursor=None, page_size=None):
+    page_size = page_size or app.config["ORDER_PAGE_SIZE"]
+    statuses = statuses or list(OPEN_ORDER_STATUSES)
+    restaurant_ids = db.session.query(Restaurant.id).filter(Restaurant.user_id == user_id).scalar_subquery()
+    item_count = (db.session.query(func.count(OrderDetail.id))
+                  .filter(OrderDetail.order_id == Order.id)
+                  .correlate(Order).scalar_subquery())
+    mixed = (db.session.query(OrderDetail.id)
+             .filter(OrderDetail.order_id == Order.id, OrderDetail.restaurant_id.in_(restaurant_ids))
+             .correlate(Order).exists())
+
+    query = (db.session.query(
         Order.id,
         User.name,
         Order.created_date,
         Payment.total,
         Order.status,
-        func.Count(OrderDetail.id).label("count")
+        item_count.label("count")
     ).join(
         Payment, Payment.order_id == Order.id
     ).join(
         User, User.id == Order.user_id
-    ).join(
-        OrderDetail, OrderDetail.order_id == Order.id
-    ).join(
-        Cuisine, Cuisine.id == OrderDetail.cuisine_id
-    ).join(
-            CuisineType, CuisineType.id == Cuisine.cuisine_type_id
-    ).join(
-            Restaurant, Restaurant.id == CuisineType.restaurant_id
-    ).filter(Restaurant.user_id == user_id)
-    .group_by(Order.id,
-              User.name,
-                Order.created_date,
-                Payment.total,
-                Order.status))
-
-
+    ).filter(
+        or_(Order.restaurant_id.in_(restaurant_ids), and_(Order.restaurant_id.is_(None), mixed)),
+        Order.status.in_(statuses)
+    ))
+
+    if from_date:
+        query = query.filter(Order.created_date >= from_date)
+    if to_date:
+        query = query.filter(Order.created_date < to_date + timedelta(days=1))
+
+    after = utils.decode_cursor(cursor, 'order', datetime.fromisoformat, int)
+    if after:
+        date, last_id = after
+        query = query.filter(or_(Order.created_date < date, and_(Order.created_date == date, Order.id < last_id)))
+
+    orders = query.order_by(Order.created_date.desc(), Order.id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        next_cursor = utils.encode_cursor('order', orders[-1].created_date.isoformat(), orders[-1].id)
+    return orders, next_cursor
+
+
+@routing.read_only
 def get_order_detail(order_id):
     return (
         db.session.query(
@@ -101,6 +139,13 @@ def get_order_detail(order_id):
     )
 
 
+def order_restaurant_ids(order):
+    if order.restaurant_id is not None:
+        return [order.restaurant_id]
+    return [r for (r,) in db.session.query(OrderDetail.restaurant_id)
+            .filter(OrderDetail.order_id == order.id).distinct()]
+
+
 def update_order(order_id, status):
     order = Order.query.filter(order_id == Order.id).first()
     if order:
@@ -108,11 +153,15 @@ def update_order(order_id, status):
             order.status = OrderStatus.PROCESSING
         else:
             order.status = OrderStatus.COMPLETE
+        restaurant_ids = order_restaurant_ids(order)
+        event = events.order_event(events.ORDER_STATUS, order)
         db.session.commit()
+        events.publish(restaurant_ids, event)
         return True
     return False
 
 
+@routing.read_only
 def get_cuisine(user_id):
     return (
         db.session.query(
@@ -141,10 +190,13 @@ def delete_cuisine(cuisine_id):
     if cuisine:
         db.session.delete(cuisine)
         db.session.commit()
+        search.catalog.remove_cuisine(cuisine_id)
+        cache.bump_data_version()
         return True
     return False
 
 
+@routing.read_only
 def get_cuisine_type(restaurant_id):
     return (
         db.session.query(
@@ -166,11 +218,13 @@ def cuisine_add(name, price, image, description, cuisine_type):
         cuisine_type_id=cuisine_type
     )
     if image:
-        res = cloudinary.uploader.upload(image)
-        cuisine.image = res.get('secure_url')
+        cuisine.image = app.config["MEDIA_PLACEHOLDER"]
 
     db.session.add(cuisine)
     db.session.commit()
+    search.index_model(cuisine)
+    cache.bump_data_version()
+    media.upload_later(Cuisine, cuisine.id, 'image', image)
 
 
 def update_quantity(cuisine_id, quantity):
@@ -182,25 +236,131 @@ def update_quantity(cuisine_id, quantity):
     return False
 
 
+# Điểm trung bình theo tháng của các nhà hàng thuộc chủ quán, đọc theo khóa (restaurant_id, month) của bảng tổng hợp
+@routing.read_only
 def get_review(user_id):
     return (
         db.session.query(
-            func.date_format(Review.created_date, "%Y-%m").label('month'),
-            func.avg(Review.rate).label('avg_rate')
+            MonthlyReview.month,
+            (cast(func.sum(MonthlyReview.total), Float) / func.sum(MonthlyReview.count)).label('avg_rate')
         )
-        .join(Restaurant, Restaurant.id == Review.restaurant_id)
-        .join(User, User.id == Restaurant.user_id)
-        .filter(User.id == user_id)
-        .group_by(func.date_format(Review.created_date, "%Y-%m"))
-        .order_by(func.date_format(Review.created_date, "%Y-%m"))
+        .filter(MonthlyReview.restaurant_id.in_(
+            db.session.query(Restaurant.id).filter(Restaurant.user_id == user_id)))
+        .group_by(MonthlyReview.month)
+        .having(func.sum(MonthlyReview.count) > 0)
+        .order_by(MonthlyReview.month)
         .all()
     )
 
 
+class CheckoutError(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _cart_quantities(cart_items):
+    quantities = {}
+    for item in cart_items:
+        cuisine_id = int(item['id'])
+        quantities[cuisine_id] = quantities.get(cuisine_id, 0) + int(item.get('quantity'))
+    return quantities
+
+
+# Một truy vấn IN cho cả giỏ hàng; khóa dòng theo thứ tự id để tránh deadlock
+def load_cart_cuisines(cart_items, lock=False):
+    ids = sorted(_cart_quantities(cart_items))
+    if not ids:
+        return {}
+
+    query = Cuisine.query.filter(Cuisine.id.in_(ids)).order_by(Cuisine.id)
+    if lock:
+        query = query.with_for_update()
+    return {c.id: c for c in query.all()}
+
+
+def cuisine_restaurants(cuisine_ids):
+    if not cuisine_ids:
+        return {}
+    return dict(db.session.query(Cuisine.id, CuisineType.restaurant_id)
+                .join(CuisineType, CuisineType.id == Cuisine.cuisine_type_id)
+                .filter(Cuisine.id.in_(cuisine_ids)).all())
+
+
+# Cộng dồn vào bảng tổng hợp theo khóa chính: thêm dòng nếu chưa có, có rồi thì cộng các cột đếm.
+# Upsert một câu nên hai giao dịch đầu tiên cùng khóa không giẫm lên nhau
+def _upsert_counters(model, rows, counters):
+    table = model.__table__
+    now = datetime.now()
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update(updated_date=now, **{c: table.c[c] + stmt.inserted[c] for c in counters})
+    else:
+        stmt = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=list(table.primary_key.columns),
+                                          set_={'updated_date': now,
+                                                **{c: table.c[c] + stmt.excluded[c] for c in counters}})
+    db.session.execute(stmt, rows)
+
+
+# Không commit: cộng dồn doanh thu/số đơn trong cùng transaction với đơn hàng
+def add_daily_revenue(day, revenue):
+    rows = [{'restaurant_id': restaurant_id, 'date': day, 'revenue': amount, 'order_count': 1}
+            for restaurant_id, amount in sorted(revenue.items())]
+    if rows:
+        _upsert_counters(DailyRevenue, rows, ('revenue', 'order_count'))
+
+
+def rebuild_daily_revenue():
+    day = func.date(Order.created_date)
+    rows = (db.session.query(
+        OrderDetail.restaurant_id,
+        day,
+        func.sum(OrderDetail.price * OrderDetail.quantity),
+        func.count(func.distinct(OrderDetail.order_id))
+    ).join(Order, Order.id == OrderDetail.order_id)
+     .join(Payment, Payment.order_id == Order.id)
+     .filter(Payment.status == PaymentStatus.PAID, OrderDetail.restaurant_id.isnot(None))
+     .group_by(OrderDetail.restaurant_id, day).all())
+
+    try:
+        DailyRevenue.query.delete()
+        db.session.add_all([
+            # SQLite trả date() dạng chuỗi
+            DailyRevenue(restaurant_id=r[0], date=r[1] if isinstance(r[1], date) else date.fromisoformat(r[1]),
+                         revenue=r[2] or 0, order_count=r[3])
+            for r in rows
+        ])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+    return len(rows)
+
+
+@routing.read_only
+def get_daily_revenue(restaurant_id, from_date, to_date):
+    return (DailyRevenue.query
+            .filter(DailyRevenue.restaurant_id == restaurant_id,
+                    DailyRevenue.date >= from_date, DailyRevenue.date <= to_date)
+            .order_by(DailyRevenue.date)
+            .all())
+
+
 def add_order(user_id, cart_items, receiver, payment_ref):
     try:
+        cuisines = load_cart_cuisines(cart_items, lock=True)
+        held = reservation.held_quantities(cuisines, exclude_ref=payment_ref)
+        errors = validate_cart_items(cart_items, cuisines, check_price=False, held=held)
+        if errors:
+            raise CheckoutError(errors)
+
+        restaurants = cuisine_restaurants(list(cuisines))
+        restaurant_ids = set(restaurants.values())
         new_order = Order(
             user_id=user_id,
+            restaurant_id=restaurant_ids.pop() if len(restaurant_ids) == 1 else None,
             status=OrderStatus.NEWORDER,
             receiver_name=receiver['receiver_name'],
             receiver_phone=receiver['receiver_phone'],
@@ -209,23 +369,36 @@ def add_order(user_id, cart_items, receiver, payment_ref):
         db.session.add(new_order)
         db.session.flush()
 
-        total = 0
+        db.session.execute(insert(OrderDetail), [{
+            'order_id': new_order.id,
+            'cuisine_id': int(item['id']),
+            'restaurant_id': restaurants[int(item['id'])],
+            'price': cuisines[int(item['id'])].price,
+            'quantity': int(item.get('quantity')),
+            'note': item.get('note', '')
+        } for item in cart_items])
+
+        # Trừ kho có điều kiện: không bao giờ bán vượt số lượng còn lại
+        quantities = _cart_quantities(cart_items)
+        cuisine_table = Cuisine.__table__
+        result = db.session.execute(
+            update(cuisine_table)
+            .where(cuisine_table.c.id == bindparam('b_id'), cuisine_table.c.count >= bindparam('b_quantity'))
+            .values(count=cuisine_table.c.count - bindparam('b_quantity')),
+            [{'b_id': cuisine_id, 'b_quantity': quantity} for cuisine_id, quantity in quantities.items()]
+        )
+        if db.engine.dialect.supports_sane_multi_rowcount and result.rowcount != len(quantities):
+            raise CheckoutError(["Món ăn vừa hết hàng, vui lòng thử lại."])
+        # Hàng đã giữ chuyển thành trừ kho thật
+        reservation.convert(payment_ref)
 
-        for item in cart_items:
-            cuisine = db.session.get(Cuisine, item['id'])
-            quantity = item.get('quantity')
-            note = item.get('note', '')
-
-            detail = OrderDetail(
-                order_id=new_order.id,
-                cuisine_id=cuisine.id,
-                quantity=quantity,
-                note=note
-            )
-            db.session.add(detail)
+        total = sum(cuisines[cuisine_id].price * quantity for cuisine_id, quantity in quantities.items())
 
-            cuisine.count -= quantity
-            total += cuisine.price * quantity
+        revenue = {}
+        for cuisine_id, quantity in quantities.items():
+            restaurant_id = restaurants[cuisine_id]
+            revenue[restaurant_id] = revenue.get(restaurant_id, 0) + cuisines[cuisine_id].price * quantity
+        add_daily_revenue(new_order.created_date.date(), revenue)
 
         payment = Payment(
             order_id=new_order.id,
@@ -234,27 +407,40 @@ def add_order(user_id, cart_items, receiver, payment_ref):
             payment_ref=payment_ref
         )
         db.session.add(payment)
+        event = events.order_event(events.NEW_ORDER, new_order)
         db.session.commit()
+        events.publish(restaurants.values(), event)
 
         return new_order
 
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, CheckoutError) as e:
         db.session.rollback()
         raise e
 
 
-def validate_cart_items(cart_items):
+def validate_cart_items(cart_items, cuisines=None, check_price=True, held=None):
+    if cuisines is None:
+        cuisines = load_cart_cuisines(cart_items)
+    held = held or {}
+
     errors = []
-    for item in cart_items:
-        cuisine = db.session.get(Cuisine, item['id'])
+    for cuisine_id, quantity in _cart_quantities(cart_items).items():
+        cuisine = cuisines.get(cuisine_id)
         if not cuisine:
-            errors.append(f"Món ăn ID {item['id']} không tồn tại.")
+            errors.append(f"Món ăn ID {cuisine_id} không tồn tại.")
             continue
-        quantity = item.get('quantity')
-        if quantity > cuisine.count:
-            errors.append(f"Số lượng '{cuisine.name}' vượt quá tồn kho ({cuisine.count}).")
+        remaining = cuisine.count - held.get(cuisine_id, 0)
+        if quantity > remaining:
+            errors.append(f"Số lượng '{cuisine.name}' vượt quá tồn kho ({max(remaining, 0)}).")
+
+    if check_price:
+        for item in cart_items:
+            cuisine = cuisines.get(int(item['id']))
+            if cuisine and item.get('price') is not None and float(item['price']) != cuisine.price:
+                errors.append(f"Giá của '{cuisine.name}' đã thay đổi, vui lòng cập nhật giỏ hàng.")
     return errors
 
+@routing.read_only
 def get_order_history(user_id):
     return (db.session.query(
         Order.created_date,
@@ -273,17 +459,10 @@ def get_order_history(user_id):
     .filter(User.id == user_id).all())
 
 def get_restaurant(order_detail_id):
-    return db.session.query(
-        Restaurant.id
-    ).join(
-        CuisineType, CuisineType.restaurant_id == Restaurant.id
-    ).join(
-        Cuisine, Cuisine.cuisine_type_id == CuisineType.id
-    ).join(
-        OrderDetail, OrderDetail.cuisine_id == Cuisine.id
-    ).filter(order_detail_id == OrderDetail.id).first()
+    return db.session.query(OrderDetail.restaurant_id).filter(OrderDetail.id == order_detail_id).first()
 
 def add_review(restaurant_id, star, content, user_id):
+    star = int(star)
     review = Review(
         content = content,
         rate = star,
@@ -293,10 +472,290 @@ def add_review(restaurant_id, star, content, user_id):
         created_date=datetime.now(),
         updated_date = datetime.now()
     )
-    db.session.add(review)
-    db.session.commit()
+    try:
+        db.session.add(review)
+        update_review_rollups(restaurant_id, review.created_date, star)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+    cache.bump_data_version()
+
+
+def review_month(created_date):
+    return (created_date or datetime.now()).date().replace(day=1)
+
+
+# Không commit: chạy chung transaction với thao tác trên Review
+def update_monthly_review(restaurant_id, month, rate, delta=1):
+    rate = int(rate)
+    if rate < 1 or rate > 5:
+        raise ValueError(f"Số sao không hợp lệ: {rate}")
+
+    star = f"star_{rate}"
+    if delta > 0:
+        _upsert_counters(MonthlyReview, [{'restaurant_id': restaurant_id, 'month': month, 'count': delta,
+                                          'total': rate * delta, star: delta}], ('count', 'total', star))
+        return
+
+    db.session.execute(
+        update(MonthlyReview)
+        .where(MonthlyReview.restaurant_id == restaurant_id, MonthlyReview.month == month)
+        .values({
+            MonthlyReview.count: MonthlyReview.count + delta,
+            MonthlyReview.total: MonthlyReview.total + rate * delta,
+            getattr(MonthlyReview, star): getattr(MonthlyReview, star) + delta
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_review_rollups(restaurant_id, created_date, rate, delta=1):
+    update_rating_summary(restaurant_id, rate, delta)
+    update_monthly_review(restaurant_id, review_month(created_date), rate, delta)
+
+
+def rebuild_monthly_review():
+    # Gom theo tháng phía Python để không phụ thuộc hàm ngày tháng của từng DB
+    months = {}
+    rows = db.session.query(Review.restaurant_id, Review.created_date, Review.rate) \
+        .execution_options(yield_per=1000)
+    for restaurant_id, created_date, rate in rows:
+        key = (restaurant_id, review_month(created_date))
+        m = months.get(key)
+        if m is None:
+            m = months[key] = MonthlyReview(restaurant_id=key[0], month=key[1], count=0, total=0, star_1=0,
+                                            star_2=0, star_3=0, star_4=0, star_5=0)
+        m.count += 1
+        m.total += rate
+        setattr(m, f"star_{rate}", getattr(m, f"star_{rate}") + 1)
+
+    try:
+        MonthlyReview.query.delete()
+        db.session.add_all(months.values())
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+    return len(months)
+
+
+def update_rating_summary(restaurant_id, rate, delta=1):
+    # Không commit: chạy chung transaction với thao tác trên Review
+    rate = int(rate)
+    if rate < 1 or rate > 5:
+        raise ValueError(f"Số sao không hợp lệ: {rate}")
+
+    star = f"star_{rate}"
+    if delta > 0:
+        # Upsert: hai đánh giá đầu tiên cùng lúc không chèn trùng khóa chính
+        _upsert_counters(RestaurantRating, [{'restaurant_id': restaurant_id, 'count': delta, 'total': rate * delta,
+                                             'avg_rate': rate, star: delta}], ('count', 'total', star))
+    else:
+        db.session.execute(
+            update(RestaurantRating)
+            .where(RestaurantRating.restaurant_id == restaurant_id)
+            .values({
+                RestaurantRating.count: RestaurantRating.count + delta,
+                RestaurantRating.total: RestaurantRating.total + rate * delta,
+                getattr(RestaurantRating, star): getattr(RestaurantRating, star) + delta
+            })
+            .execution_options(synchronize_session=False)
+        )
 
+    # Câu lệnh riêng: MySQL đọc giá trị mới của count/total, các DB khác đọc giá trị cũ trong cùng SET
+    db.session.execute(
+        update(RestaurantRating)
+        .where(RestaurantRating.restaurant_id == restaurant_id)
+        .values({
+            RestaurantRating.avg_rate: case((RestaurantRating.count > 0,
+                                             cast(RestaurantRating.total, Float) / RestaurantRating.count),
+                                            else_=0)
+        })
+        .execution_options(synchronize_session=False)
+    )
+
+
+def ensure_rating_summary(restaurant_id):
+    if db.session.get(RestaurantRating, restaurant_id) is None:
+        db.session.add(RestaurantRating(restaurant_id=restaurant_id))
+
+
+@routing.read_only
+def get_restaurants(keyword=None, type_filter=None, location=None, cuisine_type_id=None,
+                    sort='id', cursor=None, page_size=None):
+    page_size = page_size or app.config["PAGE_SIZE"]
+    query = Restaurant.query
+
+    if type_filter:
+        query = query.filter(Restaurant.type == type_filter)
+    if location:
+        query = query.filter(Restaurant.location == location)
+    if cuisine_type_id:
+        query = query.join(Restaurant.cuisine_types).filter(CuisineType.id == cuisine_type_id)
+
+    # Có từ khóa: thứ tự theo độ liên quan; con trỏ là (điểm, id) của dòng cuối, cùng điểm thì id tăng dần
+    if keyword:
+        ranked = search.rank_restaurants(keyword)
+        after = utils.decode_cursor(cursor, 'score', float, int)
+        if after:
+            last_score, last_id = after
+            ranked = [(rid, score) for rid, score in ranked
+                      if score < last_score or (score == last_score and rid > last_id)]
+        matched = {rid for (rid,) in query.filter(Restaurant.id.in_([rid for rid, _ in ranked]))
+                   .with_entities(Restaurant.id)}
+        ranked = [(rid, score) for rid, score in ranked if rid in matched]
+
+        page = ranked[:page_size]
+        by_id = {r.id: r for r in Restaurant.query.filter(Restaurant.id.in_([rid for rid, _ in page]))}
+        next_cursor = None
+        if len(ranked) > page_size:
+            last_id, last_score = page[-1]
+            next_cursor = utils.encode_cursor('score', last_score, last_id)
+        return [by_id[rid] for rid, _ in page], next_cursor
+
+    if sort == 'rating':
+        query = query.join(RestaurantRating, RestaurantRating.restaurant_id == Restaurant.id) \
+            .options(contains_eager(Restaurant.rating))
+        after = utils.decode_cursor(cursor, 'rating', float, int)
+        if after:
+            avg_rate, last_id = after
+            query = query.filter(or_(RestaurantRating.avg_rate < avg_rate,
+                                     and_(RestaurantRating.avg_rate == avg_rate, Restaurant.id < last_id)))
+        query = query.order_by(RestaurantRating.avg_rate.desc(), Restaurant.id.desc())
+    else:
+        after = utils.decode_cursor(cursor, 'id', int)
+        if after:
+            query = query.filter(Restaurant.id > after[0])
+        query = query.order_by(Restaurant.id)
+
+    restaurants = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(restaurants) > page_size:
+        restaurants = restaurants[:page_size]
+        last = restaurants[-1]
+        next_cursor = utils.encode_cursor('rating', last.rating.avg_rate, last.id) if sort == 'rating' \
+            else utils.encode_cursor('id', last.id)
+    return restaurants, next_cursor
+
+
+@routing.read_only
+def get_restaurant_with_rating(restaurant_id):
+    return (Restaurant.query
+            .options(joinedload(Restaurant.rating))
+            .filter(Restaurant.id == restaurant_id)
+            .first())
+
+
+def _enum_filter(column, enum, name):
+    if not name:
+        return column.isnot(None)
+    if name not in enum.__members__:
+        return false()
+    return column == enum[name]
+
+
+@routing.read_only
+def get_menu(restaurant_id, keyword=None, food_type=None, beverage_type=None):
+    query = (Cuisine.query
+             .join(CuisineType, CuisineType.id == Cuisine.cuisine_type_id)
+             .filter(CuisineType.restaurant_id == restaurant_id)
+             .filter(or_(_enum_filter(Cuisine.food_type, FoodType, food_type),
+                         _enum_filter(Cuisine.beverage_type, BeverageType, beverage_type))))
+
+    rank = None
+    if keyword:
+        rank = {cid: i for i, cid in enumerate(search.search_cuisines(keyword, restaurant_id=restaurant_id))}
+        if not rank:
+            return [], []
+        query = query.filter(Cuisine.id.in_(list(rank)))
+
+    cuisines = query.order_by(Cuisine.id).all()
+    if rank is not None:
+        cuisines.sort(key=lambda c: rank[c.id])
+
+    foods = [c for c in cuisines if c.food_type and (not food_type or c.food_type.name == food_type)]
+    beverages = [c for c in cuisines if c.beverage_type and (not beverage_type or c.beverage_type.name == beverage_type)]
+    return foods, beverages
+
+
+@routing.read_only
+def get_reviews(restaurant_id, star=None, cursor=None, page_size=None):
+    page_size = page_size or app.config["REVIEW_PAGE_SIZE"]
+    query = (Review.query
+             .options(joinedload(Review.user))
+             .filter(Review.restaurant_id == restaurant_id))
+
+    # Lọc theo số sao vẫn đi theo chỉ mục (restaurant_id, rate, date, id)
+    if star:
+        query = query.filter(Review.rate == star)
+
+    after = utils.decode_cursor(cursor, 'review', datetime.fromisoformat, int)
+    if after:
+        date, last_id = after
+        query = query.filter(or_(Review.date < date, and_(Review.date == date, Review.id < last_id)))
+
+    reviews = query.order_by(Review.date.desc(), Review.id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(reviews) > page_size:
+        reviews = reviews[:page_size]
+        next_cursor = utils.encode_cursor('review', reviews[-1].date.isoformat(), reviews[-1].id)
+    return reviews, next_cursor
+
+
+@routing.read_only
+def get_rating_summary(restaurant_id):
+    return db.session.get(RestaurantRating, restaurant_id)
+
+
+# Chủ có thể có nhiều nhà hàng: cộng dồn tổng hợp của tất cả, trả về dòng tạm (không gắn session) cho template
+@routing.read_only
+def get_rating_summary_by_owner(user_id):
+    counters = ('count', 'total', 'star_1', 'star_2', 'star_3', 'star_4', 'star_5')
+    row = (db.session.query(*(func.coalesce(func.sum(getattr(RestaurantRating, c)), 0) for c in counters))
+           .join(Restaurant, Restaurant.id == RestaurantRating.restaurant_id)
+           .filter(Restaurant.user_id == user_id)
+           .one())
+    return RestaurantRating(**{c: int(v) for c, v in zip(counters, row)})
+
+
+@routing.read_only
+def get_rating_map(restaurant_ids):
+    if not restaurant_ids:
+        return {}
+
+    summaries = RestaurantRating.query.filter(RestaurantRating.restaurant_id.in_(restaurant_ids),
+                                              RestaurantRating.count > 0).all()
+    return {s.restaurant_id: s.average for s in summaries}
+
+
+def rebuild_rating_summary():
+    # Mọi nhà hàng đều có một dòng, kể cả khi chưa có đánh giá
+    rows = db.session.query(
+        Restaurant.id,
+        func.count(Review.id),
+        func.coalesce(func.sum(Review.rate), 0),
+        *[func.coalesce(func.sum(case((Review.rate == i, 1), else_=0)), 0) for i in range(1, 6)]
+    ).outerjoin(Review, Review.restaurant_id == Restaurant.id).group_by(Restaurant.id).all()
 
+    try:
+        RestaurantRating.query.delete()
+        db.session.add_all([
+            RestaurantRating(restaurant_id=r[0], count=r[1], total=r[2],
+                             star_1=r[3], star_2=r[4], star_3=r[5], star_4=r[6], star_5=r[7],
+                             avg_rate=r[2] / r[1] if r[1] else 0)
+            for r in rows
+        ])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+
+    cache.bump_data_version()
+    return len(rows)
+
+
+@routing.read_only
 def get_packages():
     return db.session.query(Plan).all()
 
@@ -338,13 +797,15 @@ def add_infor_restaurant(name, type, location, introduce, categories, owner_rest
     )
 
     if avatar:
-        res = cloudinary.uploader.upload(avatar)
-        restaurant.avatar = res.get('secure_url')
+        restaurant.image = app.config["MEDIA_PLACEHOLDER"]
 
     if restaurant:
 
         db.session.add(restaurant)
+        db.session.flush()
+        ensure_rating_summary(restaurant.id)
         db.session.commit()
+        search.index_model(restaurant)
 
         for category in categories:
             cuisine_type = CuisineType(
@@ -355,8 +816,15 @@ def add_infor_restaurant(name, type, location, introduce, categories, owner_rest
                 db.session.add(cuisine_type)
                 db.session.commit()
 
+        cache.bump_data_version()
+        media.upload_later(Restaurant, restaurant.id, 'image', avatar)
         add_tenant(owner_restaurant_id, 1)
         return True
 
 def get_restaurant_id(user_id):
-    return db.session.query(Restaurant.id).filter(Restaurant.user_id == user_id).first()
\ No newline at end of file
+    return db.session.query(Restaurant.id).filter(Restaurant.user_id == user_id).first()
+
+
+@routing.read_only
+def get_restaurant_ids(user_id):
+    return [r for (r,) in db.session.query(Restaurant.id).filter(Restaurant.user_id == user_id)]
@@ -0,0 +1,223 @@
+import json
+import queue
+import socket
+import socketserver
+import threading
+from app import app
+
+NEW_ORDER, ORDER_STATUS = "new_order", "order_status"
+# Kênh nội bộ giữa các worker: báo xóa danh tính người dùng khỏi cache (identity.py)
+IDENTITY = "identity"
+# Sự kiện đặc biệt báo client tải lại vì hàng đợi của nó đã tràn
+RESYNC = "resync"
+
+
+class Subscription:
+    def __init__(self, channels, maxsize):
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+# Pub/sub trong tiến trình: mỗi kênh (id nhà hàng) giữ tập subscriber, publish chỉ đẩy vào hàng đợi của từng kết nối
+class LocalBus:
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._channels = {}
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels):
+        sub = Subscription(channels, self.maxsize)
+        with self._lock:
+            for channel in sub.channels:
+                self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    # Hàm gọi lại chạy ngay trong luồng giao sự kiện, dùng cho việc nhẹ trong tiến trình (xóa cache)
+    def listen(self, channel, callback):
+        with self._lock:
+            self._listeners.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._channels.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._channels[channel]
+
+    def deliver(self, channel, event):
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+            listeners = list(self._listeners.get(channel, ()))
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception:
+                app.logger.exception("Lỗi xử lý sự kiện kênh %s", channel)
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                # Kết nối chậm không được giữ chân người publish: bỏ sự kiện, báo client tải lại
+                sub.lagged = True
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._channels.values())
+
+
+# Nhiều worker: publish gửi qua broker cục bộ (run_broker), broker phát lại cho mọi worker kể cả worker gửi
+class BrokerBus(LocalBus):
+    def __init__(self, host, port, maxsize=100):
+        super().__init__(maxsize)
+        self.address = (host, port)
+        self._sock = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        if self._sock is None:
+            sock = socket.create_connection(self.address, timeout=2)
+            sock.settimeout(None)
+            self._sock = sock
+            threading.Thread(target=self._read, args=(sock,), daemon=True, name="event-broker").start()
+        return self._sock
+
+    def _read(self, sock):
+        try:
+            for line in sock.makefile('rb'):
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                self.deliver(message['channel'], message['event'])
+        except OSError:
+            pass
+        finally:
+            with self._send_lock:
+                if self._sock is sock:
+                    self._sock = None
+
+    def _listen_broker(self):
+        try:
+            with self._send_lock:
+                self._connect()
+        except OSError:
+            app.logger.warning("Không kết nối được broker %s:%s", *self.address)
+
+    # Worker chỉ có dashboard/listener mà không publish cũng phải nghe broker: kết nối (và chạy luồng đọc) ngay
+    def subscribe(self, channels):
+        sub = super().subscribe(channels)
+        self._listen_broker()
+        return sub
+
+    def listen(self, channel, callback):
+        super().listen(channel, callback)
+        self._listen_broker()
+
+    def publish(self, channel, event):
+        data = (json.dumps({'channel': channel, 'event': event}, separators=(',', ':')) + "\n").encode('utf-8')
+        try:
+            with self._send_lock:
+                self._connect().sendall(data)
+        except OSError:
+            # Broker không chạy: vẫn giao cho dashboard đang kết nối vào worker này
+            app.logger.warning("Không gửi được sự kiện tới broker %s:%s", *self.address)
+            with self._send_lock:
+                self._sock = None
+            self.deliver(channel, event)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        clients = self.server.clients
+        with self.server.lock:
+            clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                with self.server.lock:
+                    for wfile in list(clients):
+                        try:
+                            wfile.write(line)
+                            wfile.flush()
+                        except OSError:
+                            clients.discard(wfile)
+        finally:
+            with self.server.lock:
+                clients.discard(self.wfile)
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _BrokerHandler)
+        self.clients = set()
+        self.lock = threading.Lock()
+
+
+def run_broker(host, port):
+    with BrokerServer((host, port)) as server:
+        server.serve_forever()
+
+
+def _make_bus():
+    maxsize = app.config["EVENT_QUEUE_SIZE"]
+    broker = app.config["EVENT_BROKER"]
+    if broker:
+        host, port = broker.rsplit(":", 1)
+        return BrokerBus(host, int(port), maxsize)
+    return LocalBus(maxsize)
+
+
+bus = _make_bus()
+
+
+def publish(restaurant_ids, event):
+    for restaurant_id in set(restaurant_ids):
+        if restaurant_id is not None:
+            bus.publish(restaurant_id, event)
+
+
+def order_event(kind, order):
+    return {
+        'type': kind,
+        'order_id': order.id,
+        'status': order.status.name,
+        'created_date': order.created_date.isoformat() if order.created_date else None
+    }
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+# Luồng SSE của một dashboard: chỉ thức dậy khi có sự kiện hoặc tới nhịp heartbeat, không chạm DB
+def stream(restaurant_ids, heartbeat=None):
+    heartbeat = heartbeat or app.config["EVENT_HEARTBEAT"]
+    sub = bus.subscribe(restaurant_ids)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            event = sub.get(timeout=heartbeat)
+            if sub.lagged:
+                sub.lagged = False
+                yield format_sse({'type': RESYNC})
+            elif event is None:
+                yield ": ping\n\n"
+            else:
+                yield format_sse(event)
+    finally:
+        bus.unsubscribe(sub)
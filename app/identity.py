@@ -0,0 +1,53 @@
+from flask_login import UserMixin
+from app import app, db, cache, events
+from models import User
+
+IDENTITY_FIELDS = ("id", "name", "username", "email", "phone", "address", "avatar", "role")
+
+
+# Thông tin người dùng đăng nhập dùng cho current_user: chỉ các cột cần hiển thị/phân quyền, không gắn session DB
+class UserIdentity(UserMixin):
+    def __init__(self, **values):
+        for f in IDENTITY_FIELDS:
+            setattr(self, f, values.get(f))
+
+    def __str__(self):
+        return f"{self.id} - {self.name}"
+
+
+# Thay đổi tên/quyền/xóa tài khoản được báo cho mọi worker qua events (broker khi chạy nhiều worker).
+# Worker lỡ thông báo (mất kết nối broker) vẫn chỉ giữ danh tính cũ tối đa USER_CACHE_TTL giây
+identities = cache.TTLCache(maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"])
+
+
+def load(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    identity = identities.get(user_id)
+    if identity is None:
+        row = db.session.query(*(getattr(User, f) for f in IDENTITY_FIELDS)).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        identity = UserIdentity(**row._mapping)
+        identities.set(user_id, identity)
+    return identity
+
+
+def invalidate(user_id):
+    if user_id is not None:
+        identities.pop(int(user_id))
+        events.bus.publish(events.IDENTITY, {'type': events.IDENTITY, 'user_id': int(user_id)})
+
+
+def _on_invalidate(event):
+    identities.pop(int(event['user_id']))
+
+
+events.bus.listen(events.IDENTITY, _on_invalidate)
+
+
+def stats():
+    return identities.stats()
@@ -3,13 +3,13 @@ sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
 
 from flask_login import logout_user, login_user, current_user, login_required
 from sqlalchemy import func
-from app import app, login, dao, google, admin, utils, decorators, db, momo
-from flask import render_template, redirect, flash, request, url_for, session, jsonify
+from app import app, login, dao, google, admin, utils, decorators, db, momo, cache, search, migrations, reservation, \
+    cart_store, payments, identity, passwords, events, thumbnails, routing
+from flask import render_template, redirect, flash, request, url_for, session, jsonify, abort, Response, send_file
 from datetime import datetime
-from app.vnpay import vnpay
-from models import Restaurant, CuisineType, Role, Cuisine, Review
+from app.vnpay import VnpayRequest, VnpayResponse
+from models import Restaurant, CuisineType, Role, Cuisine, Review, OrderStatus
 from dao import add_user
-import uuid
 
 
 @app.errorhandler(401)
@@ -22,75 +22,128 @@ def error_403(error):
     return render_template("error/403.html"), 403
 
 
-@app.route("/")
-def home():
-    keyword = request.args.get('keyword', '')
-    type_filter = request.args.get('type')
-    location_filter = request.args.get('location')
-    cuisine_type_id = request.args.get('cuisine_type')
+home_cache = cache.TTLCache(maxsize=app.config["HOME_CACHE_SIZE"], ttl=app.config["HOME_CACHE_TTL"])
 
-    query = Restaurant.query
 
-    if keyword:
-        query = query.filter(Restaurant.name.ilike(f'%{keyword}%'))
-    if type_filter:
-        query = query.filter(Restaurant.type == type_filter)
-    if location_filter:
-        query = query.filter(Restaurant.location == location_filter)
-    if cuisine_type_id:
-        query = query.join(Restaurant.cuisine_types).filter(CuisineType.id == cuisine_type_id)
+def home_filters():
+    return {
+        'keyword': ' '.join(search.tokenize(request.args.get('keyword', ''))),
+        'type_filter': request.args.get('type') or None,
+        'location': request.args.get('location') or None,
+        'cuisine_type_id': request.args.get('cuisine_type') or None,
+        'sort': 'rating' if request.args.get('sort') == 'rating' else 'id',
+        'cursor': request.args.get('cursor') or None
+    }
 
-    restaurants = query.all()
 
-    # Tính trung bình đánh giá cho từng nhà hàng
-    avg_ratings = db.session.query(
-        Review.restaurant_id,
-        func.avg(Review.rate).label('avg_rate')
-    ).group_by(Review.restaurant_id).all()
+# Cache giữ dict các trường cần hiển thị, không giữ đối tượng ORM (sẽ bị tách khỏi session và dùng chung giữa các luồng)
+def restaurant_card(r):
+    return {
+        'id': r.id,
+        'name': r.name,
+        'type': r.type,
+        'location': r.location,
+        'introduce': r.introduce,
+        'image': r.image or app.config["MEDIA_PLACEHOLDER"]
+    }
 
-    rating_map = {rid: round(avg, 1) for rid, avg in avg_ratings}  # Map restaurant_id -> avg_rate
 
-    types = [r.type for r in Restaurant.query.with_entities(Restaurant.type).distinct()]
-    locations = [r.location for r in Restaurant.query.with_entities(Restaurant.location).distinct()]
-    cuisine_types = CuisineType.query.all()
+def load_restaurant_page(filters):
+    key = ('page', cache.data_version(), *sorted(filters.items()))
+    page = home_cache.get(key)
+    if page is None:
+        restaurants, next_cursor = dao.get_restaurants(**filters)
+        page = {
+            'restaurants': [restaurant_card(r) for r in restaurants],
+            'next_cursor': next_cursor,
+            # Đọc trung bình đánh giá từ bảng tổng hợp
+            'rating_map': dao.get_rating_map([r.id for r in restaurants])  # Map restaurant_id -> avg_rate
+        }
+        home_cache.set(key, page)
+    return page
+
+
+def load_filter_options():
+    key = ('options', cache.data_version())
+    options = home_cache.get(key)
+    if options is None:
+        options = {
+            'types': [r.type for r in Restaurant.query.with_entities(Restaurant.type).distinct()],
+            'locations': [r.location for r in Restaurant.query.with_entities(Restaurant.location).distinct()],
+            'cuisine_types': [{'id': ct.id, 'name': ct.name}
+                              for ct in CuisineType.query.with_entities(CuisineType.id, CuisineType.name)]
+        }
+        home_cache.set(key, options)
+    return options
+
 
+@app.route("/")
+def home():
+    filters = home_filters()
     return render_template('index.html',
-                           restaurants=restaurants,
-                           types=types,
-                           locations=locations,
-                           cuisine_types=cuisine_types,
-                           rating_map=rating_map)
+                           **load_filter_options(),
+                           **load_restaurant_page(filters),
+                           sort=filters['sort'])
+
+
+@app.route("/api/restaurants")
+def restaurant_page_api():
+    page = load_restaurant_page(home_filters())
+    return jsonify({
+        'restaurants': [{
+            **r,
+            'image_srcset': {fmt: thumbnails.srcset(r['image'], fmt) for fmt in thumbnails.FORMATS},
+            'avg_rate': page['rating_map'].get(r['id'])
+        } for r in page['restaurants']],
+        'next_cursor': page['next_cursor']
+    })
+
+
+app.jinja_env.globals.update(thumb_url=thumbnails.thumb_url, srcset=thumbnails.srcset)
+
+
+# Ảnh thu nhỏ theo bề rộng cố định; chữ ký chặn việc dùng route này tải ảnh tùy ý
+@app.route('/img/<sig>/<int:width>.<fmt>')
+def thumbnail(sig, width, fmt):
+    src = request.args.get('src', '')
+    if fmt not in thumbnails.FORMATS or width not in app.config["THUMB_WIDTHS"] \
+            or not thumbnails.supported(src) or not thumbnails.verify(src, sig):
+        abort(404)
+
+    etag = thumbnails.cache_key(src, width, fmt)
+    if request.if_none_match.contains(etag):
+        res = Response(status=304)
+    else:
+        try:
+            path = thumbnails.get_thumbnail(src, width, fmt)
+        except thumbnails.ThumbnailError:
+            app.logger.warning("Không tạo được ảnh thu nhỏ cho %s", src, exc_info=True)
+            return redirect(src)
+        res = send_file(path, mimetype=thumbnails.FORMATS[fmt][1], etag=False, conditional=False)
+
+    res.set_etag(etag)
+    res.cache_control.public = True
+    res.cache_control.max_age = app.config["THUMB_MAX_AGE"]
+    res.cache_control.immutable = True
+    return res
 
 
 @app.route('/restaurant/<int:restaurant_id>')
 def restaurant_detail(restaurant_id):
-    r = Restaurant.query.get_or_404(restaurant_id)
+    r = dao.get_restaurant_with_rating(restaurant_id)
+    if r is None:
+        abort(404)
 
-    # Lấy các cuisine từ tất cả cuisine_type liên kết
-    cuisines = []
-    for ct in r.cuisine_types:
-        cuisines.extend(ct.cuisines)
-
-    keyword = request.args.get('keyword', '').strip().lower()
+    keyword = request.args.get('keyword', '').strip()
     food_type = request.args.get('food_type')
     beverage_type = request.args.get('beverage_type')
 
-    food_cuisines = [
-        c for c in cuisines
-        if c.food_type and
-           (not keyword or keyword in c.name.lower()) and
-           (not food_type or c.food_type.name == food_type)
-    ]
-
-    beverage_cuisines = [
-        c for c in cuisines
-        if c.beverage_type and
-           (not keyword or keyword in c.name.lower()) and
-           (not beverage_type or c.beverage_type.name == beverage_type)
-    ]
+    # Lọc món trong SQL, một truy vấn cho cả món ăn và nước uống
+    food_cuisines, beverage_cuisines = dao.get_menu(r.id, keyword, food_type, beverage_type)
+    available = reservation.available(food_cuisines + beverage_cuisines)
 
-    # Lấy danh sách đánh giá
-    reviews = Review.query.filter_by(restaurant_id=r.id).order_by(Review.date.desc()).all()
+    # Chỉ lấy trang đánh giá đầu tiên, phần còn lại tải qua API khi cuộn
+    reviews, next_review_cursor = dao.get_reviews(r.id)
 
     return render_template('restaurant_cuisine.html',
                            restaurant=r,
@@ -99,7 +152,29 @@ def restaurant_detail(restaurant_id):
                            keyword=keyword,
                            food_type=food_type,
                            beverage_type=beverage_type,
-                           reviews=reviews)
+                           reviews=reviews,
+                           next_review_cursor=next_review_cursor,
+                           available=available,
+                           rating=r.rating)
+
+
+@app.route('/api/restaurants/<int:restaurant_id>/reviews')
+def restaurant_reviews(restaurant_id):
+    star = request.args.get('star', type=int)
+    reviews, next_cursor = dao.get_reviews(restaurant_id, star=star, cursor=request.args.get('cursor'))
+    return jsonify({
+        'reviews': [{
+            'id': review.id,
+            'user_name': review.user.name,
+            'date': review.date.strftime('%d/%m/%Y %H:%M'),
+            'content': review.content,
+            'rate': review.rate
+        } for review in reviews],
+        'next_cursor': next_cursor
+    })
+
+
+PASSWORD_BUSY_MESSAGE = "Hệ thống đang bận, vui lòng thử đăng nhập lại sau giây lát"
 
 
 @app.route("/login", methods=['get', 'post'])
@@ -108,7 +183,11 @@ def login_process():
     if request.method.__eq__('POST'):
         username = request.form.get('username')
         password = request.form.get('password')
-        u = dao.auth_user(username=username, password=password)
+        try:
+            u = dao.auth_user(username=username, password=password)
+        except passwords.PasswordBusy:
+            flash(PASSWORD_BUSY_MESSAGE, "warning")
+            return render_template('login.html'), 503
         if u:
             login_user(u)
             if u.role == Role.MANAGER:
@@ -124,7 +203,11 @@ def login_process():
 def login_admin_process():
     username = request.form.get('username')
     password = request.form.get('password')
-    u = dao.auth_user(username=username, password=password)
+    try:
+        u = dao.auth_user(username=username, password=password)
+    except passwords.PasswordBusy:
+        flash(PASSWORD_BUSY_MESSAGE, "warning")
+        return redirect('/admin')
     if u:
         login_user(u)
     else:
@@ -132,9 +215,10 @@ def login_admin_process():
     return redirect('/admin')
 
 
+# Mỗi request đã đăng nhập đọc danh tính từ cache thay vì truy vấn bảng user
 @login.user_loader
 def get_user(user_id):
-    return dao.get_user_by_id(user_id)
+    return identity.load(user_id)
 
 
 @app.route("/logout")
@@ -177,7 +261,10 @@ def register_process():
                 'role': request.form.get('role')
             }
             avatar = request.files.get('avatar')
-            user_id = add_user(avatar=avatar, **data)
+            try:
+                user_id = add_user(avatar=avatar, **data)
+            except passwords.PasswordBusy:
+                return render_template('register.html', err_msg=PASSWORD_BUSY_MESSAGE), 503
             session['user_id'] = user_id
             if data["role"] == "MANAGER":
                 return redirect('/infor/restaurant')
@@ -202,98 +289,119 @@ def auth():
     user_info = google.get('userinfo').json()
     session['user'] = user_info
     print(user_info)
-    if dao.get_user_by_email(user_info['email']) is None:
-        add_user(name=user_info['name'], username=user_info['email'], password="123456", email=user_info['email'],
+    # Chỉ tin email Google đã xác thực; chỉ tự liên kết với tài khoản được tạo qua Google (không có mật khẩu),
+    # tài khoản đăng ký bằng mật khẩu phải đăng nhập bằng mật khẩu
+    if not user_info.get('email_verified'):
+        flash("Email Google chưa được xác thực", "danger")
+        return redirect('/login')
+    u = dao.get_user_by_email(user_info['email'])
+    if u is None:
+        add_user(name=user_info['name'], username=user_info['email'], password=None, email=user_info['email'],
                  phone=datetime.now().strftime("%H%M%S"))
+        u = dao.get_user_by_email(user_info['email'])
+    elif u.password != passwords.UNUSABLE_PASSWORD:
+        flash("Email này đã đăng ký bằng mật khẩu, vui lòng đăng nhập bằng tên đăng nhập và mật khẩu", "warning")
+        return redirect('/login')
 
-    u = dao.auth_user(username=user_info['email'], password="123456")
     if u:
         login_user(u)
         return redirect('/')
     return render_template("/register")
 
 
+# Session chỉ giữ id giỏ hàng; giỏ hàng cũ còn nằm trong cookie được chuyển sang kho phía server
+def current_cart_id():
+    legacy = session.pop('cart', None)
+    if legacy and legacy.get('items'):
+        session['cart_id'] = cart_store.store.import_cart(legacy)
+    return session.get('cart_id')
+
+
+def current_cart():
+    cart_id = current_cart_id()
+    return cart_store.store.get(cart_id) if cart_id else None
+
+
+def clear_cart(cart_id=None):
+    session_cart_id = session.pop('cart_id', None)
+    cart_id = cart_id or session_cart_id
+    if cart_id:
+        cart_store.store.delete(cart_id)
+
+
+def checked_cart():
+    cart = current_cart()
+    if cart and not utils.cart_totals_match(cart):
+        app.logger.warning("Tổng giỏ hàng %s lệch với các món, tính lại", cart['order_id'])
+        cart.update(cart_store.store.recalculate(cart['order_id']))
+    return cart
+
+
 @app.context_processor
 def common_response():
+    cart_id = current_cart_id()
     return {
         'cart_stats': {
-            'total_quantity': utils.stats_cart_quantity(session.get('cart'))
+            'total_quantity': cart_store.store.totals(cart_id)['total_quantity'] if cart_id else 0
         }
     }
 
 
 @app.route('/cart')
 def cart():
-    context = common_response()
-    context['cart_stats'].update({
-        'total_amount': utils.stats_cart_amount(session.get('cart'))
-    })
-    return render_template('cart.html', **context)
+    cart = checked_cart()
+    return render_template('cart.html', cart=cart, cart_stats=utils.cart_totals(cart))
 
 
 @app.route("/api/carts", methods=['post'])
 def add_to_cart():
-    cart = session.get('cart')
-    if not cart:
-        cart = {
-            "order_id": str(uuid.uuid4()),
-            "items": {}
-        }
+    cart_id = current_cart_id()
+    if not cart_id or not cart_store.store.exists(cart_id):
+        cart_id = cart_store.store.create()
+        session['cart_id'] = cart_id
 
-    id = str(request.json.get('id'))
-    name = request.json.get('name')
-    price = request.json.get('price')
-    image = request.json.get('image')
-    count = request.json.get('count')
+    try:
+        totals = cart_store.store.add_item(cart_id, request.json.get('id'), request.json)
+    except cart_store.CartLockedError:
+        # Giỏ cũ đang ở cổng thanh toán (ví dụ tab khác): mua tiếp trên giỏ mới
+        cart_id = session['cart_id'] = cart_store.store.create()
+        totals = cart_store.store.add_item(cart_id, request.json.get('id'), request.json)
+    return jsonify(totals['total_quantity'])
 
-    if id in cart['items']:
-        cart['items'][id]['quantity'] = cart['items'][id]['quantity'] + 1
-    else:
-        cart['items'][id] = {
-            "id": id,
-            "name": name,
-            "price": price,
-            "image": image,
-            "count": count,
-            "quantity": 1,
-            "note": ""
-        }
 
-    session['cart'] = cart
-    return jsonify(utils.stats_cart_quantity(cart))
+CART_LOCKED_MESSAGE = "Giỏ hàng đang được thanh toán, không thể thay đổi"
 
 
 @app.route('/api/carts/<product_id>', methods=['put'])
 def update_cart(product_id):
-    cart = session.get('cart')
+    cart_id = current_cart_id()
     note = request.json.get('note')
     quantity = request.json.get('quantity')
 
-    if note is not None:
-        if cart and product_id in cart['items']:
-            cart['items'][product_id]['note'] = note
-            session['cart'] = cart
+    totals = utils.cart_totals(None)
+    if cart_id:
+        try:
+            totals = cart_store.store.update_item(cart_id, product_id,
+                                                  quantity=None if quantity is None else int(quantity), note=note)
+        except cart_store.CartLockedError:
+            return jsonify({'error': CART_LOCKED_MESSAGE}), 409
 
-    if quantity is not None:
-        if cart and product_id in cart['items']:
-            cart['items'][product_id]['quantity'] = int(quantity)
-            session['cart'] = cart
-
-    return jsonify(utils.stats_cart(cart))
+    return jsonify(totals)
 
 
 @app.route('/api/carts/<product_id>', methods=['delete'])
 def delete_product_in_cart(product_id):
-    cart = session.get('cart')
-    if cart and product_id in cart['items']:
-        del cart['items'][product_id]
-
-        if cart['items']:
-            session['cart'] = cart
-        else:
-            session.pop('cart', None)
+    cart_id = current_cart_id()
+    totals = utils.cart_totals(None)
+    if cart_id:
+        try:
+            totals = cart_store.store.remove_item(cart_id, product_id)
+        except cart_store.CartLockedError:
+            return jsonify({'error': CART_LOCKED_MESSAGE}), 409
+        if not totals['total_quantity']:
+            clear_cart(cart_id)
 
-    return jsonify(utils.stats_cart(cart))
+    return jsonify(totals)
 
 
 def get_client_ip(request):
@@ -309,98 +417,126 @@ def get_client_ip(request):
 @login_required
 def payment():
     if request.method == "GET":
-        context = common_response()
-        context['cart_stats'].update({
-            'total_amount': utils.stats_cart_amount(session.get('cart'))
-        })
-        return render_template("payment.html", **context, user=current_user)
+        cart = checked_cart()
+        return render_template("payment.html", cart=cart, cart_stats=utils.cart_totals(cart), user=current_user)
     else:
-        cart = session.get('cart')
+        cart = checked_cart()
+        if not cart or not cart['items']:
+            return redirect("/cart")
 
         items = list(cart['items'].values())
         validation_errors = dao.validate_cart_items(items)
         if validation_errors:
-            session.pop('cart', None)
+            clear_cart()
             return render_template("payment.html", title="Lỗi", result="Không thể xử lý đơn hàng",
                                    errors=validation_errors)
 
-        receiver_name = request.form.get("person")
-        receiver_phone = request.form.get("phone")
-        receiver_address = request.form.get("address")
-
-        cart = {
-            **cart,
-            "receiver": {
-                "receiver_name": receiver_name,
-                "receiver_phone": receiver_phone,
-                "receiver_address": receiver_address
-            }
+        receiver = {
+            "receiver_name": request.form.get("person"),
+            "receiver_phone": request.form.get("phone"),
+            "receiver_address": request.form.get("address")
         }
-        session['cart'] = cart
 
-        order_id = request.form.get("order_id")
-        amount = float(request.form.get("amount"))
+        order_id = cart['order_id']
+        amount = cart['total_amount']
         order_type = request.form.get("order_type")
         order_desc = request.form.get("order_desc")
         bank_code = request.form.get("bank_code")
         language = request.form.get("language")
         ipaddr = get_client_ip(request)
 
+        # Giữ hàng trong lúc khách ở cổng thanh toán, tránh hai người cùng trả tiền cho món cuối
+        hold_errors = reservation.hold(order_id, items)
+        if hold_errors:
+            return render_template("payment.html", title="Lỗi", result="Không thể xử lý đơn hàng",
+                                   errors=hold_errors)
+
         if request.form.get("pay") == "vnpay":
-            vnp = vnpay()
-            vnp.requestData["vnp_Version"] = "2.1.0"
-            vnp.requestData["vnp_Command"] = "pay"
-            vnp.requestData["vnp_TmnCode"] = app.config["VNPAY_TMN_CODE"]
-            vnp.requestData["vnp_Amount"] = int(amount * 100)
-            vnp.requestData["vnp_CurrCode"] = "VND"
-            vnp.requestData["vnp_TxnRef"] = order_id
-            vnp.requestData["vnp_OrderInfo"] = order_desc
-            vnp.requestData["vnp_OrderType"] = order_type
-            if language and language != "":
-                vnp.requestData["vnp_Locale"] = language
-            else:
-                vnp.requestData["vnp_Locale"] = "vn"
-            if bank_code and bank_code != "":
-                vnp.requestData["vnp_BankCode"] = bank_code
-
-            vnp.requestData["vnp_CreateDate"] = datetime.now().strftime("%Y%m%d%H%M%S")
-            vnp.requestData["vnp_IpAddr"] = ipaddr
-            vnp.requestData["vnp_ReturnUrl"] = app.config["VNPAY_RETURN_URL"]
-            vnpay_payment_url = vnp.get_payment_url(
+            vnp = VnpayRequest(
+                vnp_Version="2.1.0",
+                vnp_Command="pay",
+                vnp_TmnCode=app.config["VNPAY_TMN_CODE"],
+                vnp_Amount=int(amount * 100),
+                vnp_CurrCode="VND",
+                vnp_TxnRef=order_id,
+                vnp_OrderInfo=order_desc,
+                vnp_OrderType=order_type,
+                vnp_Locale=language or "vn",
+                vnp_BankCode=bank_code,
+                vnp_CreateDate=datetime.now().strftime("%Y%m%d%H%M%S"),
+                vnp_IpAddr=ipaddr,
+                vnp_ReturnUrl=app.config["VNPAY_RETURN_URL"]
+            )
+            payment_url = vnp.get_payment_url(
                 app.config["VNPAY_PAYMENT_URL"], app.config["VNPAY_HASH_SECRET_KEY"]
             )
-            return redirect(vnpay_payment_url)
         elif request.form.get("pay") == "momo":
-            return redirect(momo.get_payment_url(order_id, amount))
+            try:
+                payment_url = momo.get_payment_url(order_id, amount)
+            except momo.MomoError as e:
+                app.logger.warning("Tạo thanh toán MoMo thất bại cho %s: %s", order_id, e)
+                reservation.release(order_id)
+                return render_template("payment.html", title="Lỗi", result="Không thể kết nối MoMo",
+                                       errors=["Cổng thanh toán MoMo đang bận, vui lòng thử lại sau."])
+        else:
+            reservation.release(order_id)
+            return redirect("/cart")
+
+        # Giỏ hàng giữ người nhận và người mua để IPN hoàn tất đơn kể cả khi khách đã đóng trình duyệt.
+        # Từ đây giỏ bị khóa và rời khỏi session: món thêm sau đó vào giỏ mới, không lọt vào đơn đã trả tiền
+        cart_store.store.checkout(order_id, receiver, current_user.id)
+        session.pop('cart_id', None)
+        return redirect(payment_url)
 
     return redirect("/cart")
 
 
+OUT_OF_STOCK_MESSAGE = "Món ăn đã hết hàng trong lúc thanh toán, vui lòng liên hệ nhà hàng để được hoàn tiền"
+
+
+# amount: số tiền đã kiểm tra chữ ký trên trang trả về, đơn chỉ được tạo khi khớp tổng giỏ hàng
+def finish_checkout(order_id, amount):
+    if session.get('cart_id') == order_id:
+        session.pop('cart_id', None)
+    # Đơn được ghi ở IPN hoặc pool nền, ngoài phiên của người mua: tự giữ người mua trên primary
+    # để trang lịch sử ngay sau đó thấy đơn vừa tạo
+    routing.stick_to_primary()
+
+    state = payments.status(order_id)
+    if state == payments.PENDING:
+        # Dự phòng khi IPN chưa tới (hoặc không tới được, ví dụ chạy trên localhost)
+        payments.submit(order_id, amount)
+    elif state == payments.FAILED:
+        cart = cart_store.store.get(order_id) or {}
+        return state, render_template("payment.html", title="Lỗi", result=OUT_OF_STOCK_MESSAGE,
+                                      errors=cart.get('errors', []))
+    return state, None
+
+
+# Khách hủy hoặc thanh toán lỗi (đã kiểm tra chữ ký): trả hàng giữ và mở lại giỏ cho chính người mua
+def cancel_checkout(order_id):
+    reservation.release(order_id)
+    cart = cart_store.store.get(order_id)
+    if cart and current_user.is_authenticated and cart.get('user_id') == current_user.id \
+            and not session.get('cart_id'):
+        cart_store.store.reopen(order_id)
+        session['cart_id'] = order_id
+
+
 @app.route("/vnpay_payment_return", methods=["GET"])
 def vnpay_payment_return():
     inputData = request.args
     if inputData:
-        vnp = vnpay()
-        vnp.responseData = dict(inputData)
+        vnp = VnpayResponse(inputData)
         order_id = inputData.get("vnp_TxnRef")
         amount = int(inputData.get("vnp_Amount")) / 100
         vnp_ResponseCode = inputData.get("vnp_ResponseCode")
 
-        if vnp.validate_response(app.config["VNPAY_HASH_SECRET_KEY"]):
+        if vnp.validate(app.config["VNPAY_HASH_SECRET_KEY"]):
             if vnp_ResponseCode == "00":
-                cart = session.get('cart')
-
-                items = list(cart['items'].values())
-                receiver = cart['receiver']
-
-                order = dao.add_order(
-                    user_id=current_user.id,
-                    cart_items=items,
-                    receiver=receiver,
-                    payment_ref=order_id
-                )
-
-                session.pop('cart', None)
+                state, failed_page = finish_checkout(order_id, amount)
+                if failed_page:
+                    return failed_page
 
                 return render_template(
                     "vnpay_payment_return.html",
@@ -409,9 +545,11 @@ def vnpay_payment_return():
                     order_id=order_id,
                     amount=amount,
                     vnp_ResponseCode=vnp_ResponseCode,
+                    pending=state != payments.DONE
                 )
 
             elif vnp_ResponseCode == "24":
+                cancel_checkout(order_id)
 
                 return render_template(
                     "vnpay_payment_return.html",
@@ -422,6 +560,7 @@ def vnpay_payment_return():
                     vnp_ResponseCode=vnp_ResponseCode,
                 )
             else:
+                cancel_checkout(order_id)
                 return render_template(
                     "vnpay_payment_return.html",
                     title="Lỗi thanh toán",
@@ -453,20 +592,11 @@ def momo_payment_return():
         amount = int(data.get("amount"))
         result_code = data.get("resultCode")
 
-        if result_code == '0':
-            cart = session.get('cart')
-
-            items = list(cart['items'].values())
-            receiver = cart['receiver']
-
-            order = dao.add_order(
-                user_id=current_user.id,
-                cart_items=items,
-                receiver=receiver,
-                payment_ref=order_id
-            )
-
-            session.pop('cart', None)
+        verified = momo.verify_result(data)
+        if result_code == '0' and verified:
+            state, failed_page = finish_checkout(order_id, amount)
+            if failed_page:
+                return failed_page
 
             return render_template(
                 "momo_payment_return.html",
@@ -475,8 +605,12 @@ def momo_payment_return():
                 order_id=order_id,
                 amount=amount,
                 result_code=result_code,
+                pending=state != payments.DONE
             )
         else:
+            # Tham số chưa ký đúng thì không được động tới hàng đang giữ của người khác
+            if verified and result_code != '0':
+                cancel_checkout(order_id)
             return render_template(
                 "momo_payment_return.html",
                 title="Lỗi thanh toán",
@@ -490,12 +624,95 @@ def momo_payment_return():
     )
 
 
+# IPN: cổng thanh toán gọi thẳng server, chỉ kiểm tra chữ ký/số tiền rồi đưa việc tạo đơn sang pool nền
+@app.route("/vnpay_ipn", methods=["GET"])
+def vnpay_ipn():
+    vnp = VnpayResponse(request.args)
+    if not vnp.validate(app.config["VNPAY_HASH_SECRET_KEY"]):
+        return jsonify({"RspCode": "97", "Message": "Invalid Checksum"})
+
+    order_id = vnp.get("vnp_TxnRef")
+    if payments.is_paid(order_id):
+        return jsonify({"RspCode": "02", "Message": "Order already confirmed"})
+    if not cart_store.store.exists(order_id):
+        return jsonify({"RspCode": "01", "Message": "Order not found"})
+    if abs(int(vnp.get("vnp_Amount", 0)) / 100 - cart_store.store.totals(order_id)['total_amount']) >= 1:
+        return jsonify({"RspCode": "04", "Message": "Invalid amount"})
+
+    if vnp.get("vnp_ResponseCode") == "00" and vnp.get("vnp_TransactionStatus", "00") == "00":
+        payments.submit(order_id, int(vnp.get("vnp_Amount")) / 100)
+    else:
+        reservation.release(order_id)
+    return jsonify({"RspCode": "00", "Message": "Confirm Success"})
+
+
+@app.route("/momo_ipn", methods=["POST"])
+def momo_ipn():
+    data = request.get_json(silent=True) or {}
+    if not momo.verify_result(data):
+        return jsonify({"message": "Invalid signature"}), 400
+
+    order_id = str(data.get("orderId"))
+    if str(data.get("resultCode")) == "0":
+        if not payments.is_paid(order_id) and cart_store.store.exists(order_id):
+            if abs(int(data.get("amount", 0)) - cart_store.store.totals(order_id)['total_amount']) >= 1:
+                app.logger.warning("IPN MoMo sai số tiền cho đơn %s", order_id)
+            else:
+                payments.submit(order_id, int(data.get("amount")))
+    else:
+        reservation.release(order_id)
+    return "", 204
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def order_queue_filters():
+    return {
+        'statuses': dao.parse_order_statuses(request.args.getlist('status')),
+        'from_date': parse_date(request.args.get('from_date')),
+        'to_date': parse_date(request.args.get('to_date')),
+        'cursor': request.args.get('cursor') or None
+    }
+
+
 @app.route("/manager/view/order")
 @decorators.manager_required
 def view_order():
-    current_user_id = current_user.id
-    orders = dao.get_order(current_user_id)
-    return render_template("manager/order_accept.html", orders=orders)
+    filters = order_queue_filters()
+    orders, next_cursor = dao.get_order(current_user.id, **filters)
+    return render_template("manager/order_accept.html", orders=orders, next_cursor=next_cursor,
+                           statuses=OrderStatus, filters=filters)
+
+
+@app.route("/api/manager/orders")
+@decorators.manager_required
+def order_queue_api():
+    orders, next_cursor = dao.get_order(current_user.id, **order_queue_filters())
+    return jsonify({
+        'orders': [{
+            'id': o.id,
+            'name': o.name,
+            'created_date': o.created_date.isoformat(),
+            'count': o.count,
+            'total': o.total,
+            'status': o.status.name
+        } for o in orders],
+        'next_cursor': next_cursor
+    })
+
+
+# Đẩy đơn mới/đổi trạng thái cho dashboard; session DB được trả lại ngay khi bắt đầu stream
+@app.route("/manager/orders/stream")
+@decorators.manager_required
+def order_stream():
+    restaurant_ids = dao.get_restaurant_ids(current_user.id)
+    return Response(events.stream(restaurant_ids), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/manager/view/oder_detail/<order_id>")
@@ -567,8 +784,8 @@ def update_quantity_cuisine():
 def reputation_statistics():
     if current_user.is_authenticated:
         reviews = dao.get_review(current_user.id)
-        print(reviews)
-    return render_template("manager/reputation_statistics.html", reviews=reviews)
+        rating = dao.get_rating_summary_by_owner(current_user.id)
+    return render_template("manager/reputation_statistics.html", reviews=reviews, rating=rating)
 
 
 @app.route("/history")
@@ -595,5 +812,48 @@ def packages():
     plan_packages = dao.get_packages()
     return render_template("packages.html", packages=plan_packages)
 
+@app.route("/api/admin/cache-stats")
+@decorators.admin_required
+def cache_stats():
+    return jsonify({
+        "home": home_cache.stats(),
+        "users": identity.stats(),
+        "payments": payments.paid_orders.stats()
+    })
+
+
+@app.cli.command("upgrade-db")
+def upgrade_db():
+    for version, description in migrations.upgrade():
+        print(f"Đã áp dụng migration {version}: {description}")
+
+
+@app.cli.command("rebuild-ratings")
+def rebuild_ratings():
+    count = dao.rebuild_rating_summary()
+    print(f"Đã tính lại đánh giá cho {count} nhà hàng")
+    count = dao.rebuild_monthly_review()
+    print(f"Đã tính lại đánh giá theo tháng cho {count} tháng-nhà hàng")
+
+
+@app.cli.command("rebuild-revenue")
+def rebuild_revenue():
+    count = dao.rebuild_daily_revenue()
+    print(f"Đã tính lại doanh thu cho {count} ngày-nhà hàng")
+
+
+@app.cli.command("purge-carts")
+def purge_carts():
+    count = cart_store.purge_stale()
+    print(f"Đã xóa {count} giỏ hàng bỏ quên")
+
+
+@app.cli.command("event-broker")
+def event_broker():
+    host, port = (app.config["EVENT_BROKER"] or "127.0.0.1:5678").rsplit(":", 1)
+    print(f"Broker sự kiện đang chạy tại {host}:{port}")
+    events.run_broker(host, int(port))
+
+
 if __name__ == "__main__":
     app.run(host="localhost", port=8000, debug=True)
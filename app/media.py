@@ -0,0 +1,102 @@
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import cloudinary.uploader
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+from app import app, db, cache, identity
+from models import User
+
+
+class LocalStorage:
+    # Thay cho Cloudinary khi chạy máy cá nhân/test: lưu file vào thư mục static
+    def __init__(self, root=None, base_url=None):
+        self.root = root or app.config["MEDIA_ROOT"]
+        self.base_url = (base_url or app.config["MEDIA_URL"]).rstrip("/")
+
+    def save(self, data, filename):
+        os.makedirs(self.root, exist_ok=True)
+        ext = os.path.splitext(secure_filename(filename or ""))[1].lower()
+        key = f"{uuid.uuid4().hex}{ext}"
+        with open(os.path.join(self.root, key), "wb") as f:
+            f.write(data)
+        return f"{self.base_url}/{key}"
+
+
+class CloudinaryStorage:
+    def save(self, data, filename):
+        res = cloudinary.uploader.upload(io.BytesIO(data), filename=filename)
+        return res["secure_url"]
+
+
+STORAGES = {"local": LocalStorage, "cloudinary": CloudinaryStorage}
+
+_storage = None
+_executor = None
+_lock = threading.Lock()
+
+
+def storage():
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = STORAGES[app.config["MEDIA_STORAGE"]]()
+    return _storage
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app.config["MEDIA_WORKERS"], thread_name_prefix="media")
+    return _executor
+
+
+def upload_with_retry(data, filename, backend=None):
+    backend = backend or storage()
+    retries = app.config["MEDIA_RETRIES"]
+    for attempt in range(retries + 1):
+        try:
+            return backend.save(data, filename)
+        except Exception:
+            if attempt == retries:
+                raise
+            app.logger.warning("Tải ảnh %s lỗi, thử lại lần %d", filename, attempt + 1)
+            time.sleep(app.config["MEDIA_BACKOFF"] * 2 ** attempt)
+
+
+def _run(model, record_id, field, data, filename, backend):
+    with app.app_context():
+        try:
+            url = upload_with_retry(data, filename, backend)
+            db.session.execute(update(model).where(model.id == record_id).values({field: url})
+                               .execution_options(synchronize_session=False))
+            db.session.commit()
+        except Exception:
+            # Bản ghi giữ ảnh tạm, không làm hỏng thao tác của người dùng
+            app.logger.exception("Không tải được ảnh cho %s %s", model.__tablename__, record_id)
+            raise
+        finally:
+            db.session.remove()
+
+        if model is User:
+            identity.invalidate(record_id)
+        else:
+            cache.bump_data_version()
+        return url
+
+
+# Đọc nội dung file ngay trong request (stream đóng khi request kết thúc), tải lên ở pool nền
+# rồi ghi URL vào cột field của bản ghi đã lưu
+def upload_later(model, record_id, field, file, backend=None):
+    if not file:
+        return None
+    data = file.read()
+    if not data:
+        return None
+    return executor().submit(_run, model, record_id, field, data, getattr(file, "filename", None), backend)
@@ -0,0 +1,241 @@
+import hashlib
+from datetime import date, datetime
+from sqlalchemy import inspect, text, update, select, func
+from app import app, db
+from models import SchemaVersion, RestaurantRating, Review, Cart, User, Order, OrderDetail, Cuisine, \
+    CuisineType, Payment, Restaurant, Subscription
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        return f
+
+    return decorator
+
+
+# Các bước đều kiểm tra trước nên chạy được cả trên DB mới tạo bằng create_all
+def add_column(model, name, default=None):
+    table = model.__tablename__
+    if name in {c['name'] for c in inspect(db.engine).get_columns(table)}:
+        return
+
+    column = model.__table__.c[name]
+    ddl = f"ALTER TABLE {db.engine.dialect.identifier_preparer.quote(table)} " \
+          f"ADD COLUMN {name} {column.type.compile(dialect=db.engine.dialect)}"
+    if default is not None:
+        ddl += f" NOT NULL DEFAULT {default}"
+    db.session.execute(text(ddl))
+
+
+def create_index(model, name):
+    if name in {i['name'] for i in inspect(db.engine).get_indexes(model.__tablename__)}:
+        return
+
+    index = next(i for i in model.__table__.indexes if i.name == name)
+    index.create(db.session.connection())
+
+
+# Nới độ dài cột VARCHAR; SQLite không giới hạn độ dài nên bỏ qua
+def widen_column(model, name):
+    column = model.__table__.c[name]
+    current = next(c for c in inspect(db.engine).get_columns(model.__tablename__) if c['name'] == name)
+    if getattr(current['type'], 'length', None) is None or current['type'].length >= column.type.length:
+        return
+
+    dialect = db.engine.dialect
+    table = dialect.identifier_preparer.quote(model.__tablename__)
+    type_ = column.type.compile(dialect=dialect)
+    if dialect.name == 'mysql':
+        db.session.execute(text(f"ALTER TABLE {table} MODIFY COLUMN {name} {type_} "
+                                f"{'NULL' if column.nullable else 'NOT NULL'}"))
+    elif dialect.name == 'postgresql':
+        db.session.execute(text(f"ALTER TABLE {table} ALTER COLUMN {name} TYPE {type_}"))
+
+
+# Chuyển cột sang NOT NULL sau khi đã điền giá trị; SQLite không đổi được ràng buộc cột nên bỏ qua
+def set_not_null(model, name):
+    column = model.__table__.c[name]
+    dialect = db.engine.dialect
+    table = dialect.identifier_preparer.quote(model.__tablename__)
+    if dialect.name == 'mysql':
+        db.session.execute(text(f"ALTER TABLE {table} MODIFY COLUMN {name} "
+                                f"{column.type.compile(dialect=dialect)} NOT NULL"))
+    elif dialect.name == 'postgresql':
+        db.session.execute(text(f"ALTER TABLE {table} ALTER COLUMN {name} SET NOT NULL"))
+
+
+def applied_versions():
+    return {v for (v,) in db.session.query(SchemaVersion.version)}
+
+
+def upgrade():
+    # Bảng mới được tạo trực tiếp; migration chỉ xử lý cột/chỉ mục trên bảng đã có
+    db.create_all()
+    done = applied_versions()
+    applied = []
+    for version, description, f in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        try:
+            f()
+            db.session.add(SchemaVersion(version=version, description=description))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+@migration(1, "restaurant_rating.avg_rate for rating-ordered pagination")
+def add_restaurant_rating_avg():
+    add_column(RestaurantRating, 'avg_rate', default=0)
+    create_index(RestaurantRating, 'ix_restaurant_rating_avg_rate')
+    # SQL theo schema tại phiên bản này, không qua dao/model: mọi nhà hàng đều có một dòng, kể cả khi chưa có đánh giá
+    stars = ", ".join(f"COALESCE(SUM(CASE WHEN v.rate = {i} THEN 1 ELSE 0 END), 0)" for i in range(1, 6))
+    db.session.execute(text("DELETE FROM restaurant_rating"))
+    db.session.execute(text(
+        "INSERT INTO restaurant_rating (restaurant_id, count, total, star_1, star_2, star_3, star_4, star_5, "
+        "avg_rate, created_date, updated_date) "
+        f"SELECT r.id, COUNT(v.id), COALESCE(SUM(v.rate), 0), {stars}, "
+        "CASE WHEN COUNT(v.id) > 0 THEN 1.0 * SUM(v.rate) / COUNT(v.id) ELSE 0 END, :now, :now "
+        "FROM restaurant r LEFT JOIN review v ON v.restaurant_id = r.id GROUP BY r.id"), {"now": datetime.now()})
+
+
+@migration(2, "review keyset indexes for the paginated review feed")
+def add_review_feed_indexes():
+    create_index(Review, 'ix_review_restaurant_date')
+    create_index(Review, 'ix_review_restaurant_rate_date')
+
+
+@migration(3, "cart running totals")
+def add_cart_totals():
+    add_column(Cart, 'total_quantity', default=0)
+    add_column(Cart, 'total_amount', default=0)
+
+
+@migration(4, "cart checkout state for IPN order finalization")
+def add_cart_checkout_state():
+    add_column(Cart, 'user_id')
+    add_column(Cart, 'status', default="'OPEN'")
+    add_column(Cart, 'errors')
+
+
+@migration(5, "user.password wide enough for scrypt/pbkdf2 hashes")
+def widen_user_password():
+    widen_column(User, 'password')
+
+
+@migration(6, "restaurant_id on order/order_detail for manager and stats queries")
+def add_order_restaurant():
+    add_column(OrderDetail, 'restaurant_id')
+    add_column(Order, 'restaurant_id')
+    create_index(OrderDetail, 'ix_order_detail_restaurant_order')
+    create_index(Order, 'ix_order_restaurant_date')
+
+    detail = OrderDetail.__table__
+    cuisine = Cuisine.__table__
+    cuisine_type = CuisineType.__table__
+    order = Order.__table__
+    db.session.execute(update(detail).values(
+        restaurant_id=select(cuisine_type.c.restaurant_id)
+        .select_from(cuisine.join(cuisine_type, cuisine_type.c.id == cuisine.c.cuisine_type_id))
+        .where(cuisine.c.id == detail.c.cuisine_id).scalar_subquery()))
+    # Đơn nhiều nhà hàng giữ NULL
+    db.session.execute(update(order).values(
+        restaurant_id=select(func.min(detail.c.restaurant_id))
+        .where(detail.c.order_id == order.c.id)
+        .having(func.count(func.distinct(detail.c.restaurant_id)) == 1).scalar_subquery()))
+
+
+@migration(7, "order queue index for the paginated manager view")
+def add_order_queue_index():
+    create_index(Order, 'ix_order_restaurant_status_date')
+
+
+# Migration 8, 9 viết SQL trực tiếp theo schema tại phiên bản đó: đổi model/dao sau này không làm hỏng chúng
+@migration(8, "order_detail.price and daily_revenue rollup for the admin stats view")
+def add_daily_revenue_rollup():
+    add_column(OrderDetail, 'price')
+    # Đơn cũ không lưu giá lúc đặt: lấy giá hiện tại của món
+    db.session.execute(text(
+        "UPDATE order_detail SET price = (SELECT cuisine.price FROM cuisine WHERE cuisine.id = order_detail.cuisine_id) "
+        "WHERE price IS NULL"))
+    order = db.engine.dialect.identifier_preparer.quote('order')
+    db.session.execute(text("DELETE FROM daily_revenue"))
+    db.session.execute(text(
+        "INSERT INTO daily_revenue (restaurant_id, date, revenue, order_count, created_date, updated_date) "
+        "SELECT d.restaurant_id, DATE(o.created_date), COALESCE(SUM(d.price * d.quantity), 0), "
+        "COUNT(DISTINCT d.order_id), :now, :now "
+        f"FROM order_detail d JOIN {order} o ON o.id = d.order_id JOIN payment p ON p.order_id = o.id "
+        "WHERE p.status = 'PAID' AND d.restaurant_id IS NOT NULL "
+        "GROUP BY d.restaurant_id, DATE(o.created_date)"), {"now": datetime.now()})
+
+
+@migration(9, "monthly_review rollup for the manager reputation page")
+def add_monthly_review_rollup():
+    # Gom theo tháng phía Python để không phụ thuộc hàm ngày tháng của từng DB
+    months = {}
+    for restaurant_id, created_date, rate in db.session.execute(
+            text("SELECT restaurant_id, created_date, rate FROM review")):
+        # SQLite trả chuỗi ngày giờ, MySQL/PostgreSQL trả datetime: cả hai đều bắt đầu bằng YYYY-MM-DD
+        day = date.fromisoformat(str(created_date)[:10]) if created_date else date.today()
+        key = (restaurant_id, day.replace(day=1))
+        m = months.setdefault(key, {"restaurant_id": key[0], "month": key[1], "count": 0, "total": 0,
+                                    **{f"star_{i}": 0 for i in range(1, 6)}})
+        m["count"] += 1
+        m["total"] += rate
+        m[f"star_{rate}"] += 1
+
+    db.session.execute(text("DELETE FROM monthly_review"))
+    if months:
+        now = datetime.now()
+        db.session.execute(text(
+            "INSERT INTO monthly_review (restaurant_id, month, count, total, star_1, star_2, star_3, star_4, star_5, "
+            "created_date, updated_date) VALUES (:restaurant_id, :month, :count, :total, :star_1, :star_2, :star_3, "
+            ":star_4, :star_5, :now, :now)"), [{**m, "now": now} for m in months.values()])
+
+
+# Chỉ mục theo đúng dạng truy vấn trong dao/index/admin (test/test_query_plans.py kiểm tra bằng EXPLAIN)
+@migration(10, "secondary indexes for the hot dao query paths")
+def add_hot_path_indexes():
+    create_index(Restaurant, 'ix_restaurant_user')
+    create_index(Restaurant, 'ix_restaurant_type')
+    create_index(Restaurant, 'ix_restaurant_location')
+    create_index(CuisineType, 'ix_cuisine_type_restaurant')
+    create_index(Cuisine, 'ix_cuisine_cuisine_type')
+    create_index(Order, 'ix_order_user_date')
+    create_index(OrderDetail, 'ix_order_detail_order')
+    create_index(OrderDetail, 'ix_order_detail_cuisine')
+    create_index(Payment, 'ix_payment_order')
+    create_index(Subscription, 'ix_subscription_tenant')
+
+
+@migration(11, "review.date NOT NULL for the review feed cursor")
+def review_date_not_null():
+    review = Review.__table__
+    db.session.execute(update(review).where(review.c.date.is_(None))
+                       .values(date=func.coalesce(review.c.created_date, func.now())))
+    set_not_null(Review, 'date')
+
+
+# Migration 3 chỉ thêm cột (đọc giỏ hàng qua model hiện tại sẽ hỏng vì cart.user_id/status/errors có từ migration 4):
+# tính tổng cho giỏ hàng có sẵn bằng một câu UPDATE chỉ đụng tới bảng cart/cart_item
+@migration(12, "recompute cart running totals in SQL")
+def recompute_cart_totals():
+    db.session.execute(text(
+        "UPDATE cart SET "
+        "total_quantity = (SELECT COALESCE(SUM(i.quantity), 0) FROM cart_item i WHERE i.cart_id = cart.id), "
+        "total_amount = (SELECT COALESCE(SUM(i.quantity * i.price), 0) FROM cart_item i WHERE i.cart_id = cart.id)"))
+
+
+# Đăng nhập Google cũ tạo tài khoản với mật khẩu cố định "123456" (MD5): ai biết email là đăng nhập được.
+# Chuyển sang giá trị không khớp mật khẩu nào (passwords.UNUSABLE_PASSWORD) để chỉ còn đăng nhập qua Google
+@migration(13, "unusable password for accounts created by the old Google login")
+def disable_legacy_google_passwords():
+    user = db.engine.dialect.identifier_preparer.quote('user')
+    db.session.execute(text(f"UPDATE {user} SET password = '!' WHERE password = :legacy"),
+                       {"legacy": hashlib.md5("123456".encode('utf-8')).hexdigest()})
@@ -1,4 +1,4 @@
-import hashlib
+from werkzeug.security import generate_password_hash
 from email.policy import default
 from pydoc import describe
 
@@ -56,7 +56,7 @@ class User(BaseModel, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     username = db.Column(db.String(50), nullable=False, unique=True)
-    password = db.Column(db.String(50), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(100), nullable=False, unique=True)
     phone = db.Column(db.String(10), nullable=False, unique=True)
     address = db.Column(db.String(255), nullable=True)
@@ -69,12 +69,16 @@ class User(BaseModel, UserMixin):
 
 class Review(BaseModel):
     __tablename__ = 'review'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_review_restaurant_date', 'restaurant_id', 'date', 'id'),
+        db.Index('ix_review_restaurant_rate_date', 'restaurant_id', 'rate', 'date', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String(255), nullable=False)
     rate = db.Column(db.Integer, nullable=False)
-    date = db.Column(db.DateTime, default=datetime.now)
+    date = db.Column(db.DateTime, nullable=False, default=datetime.now)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
@@ -88,7 +92,12 @@ class Review(BaseModel):
 
 class Order(BaseModel):
     __tablename__ = 'order'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_order_restaurant_date', 'restaurant_id', 'created_date', 'id'),
+        db.Index('ix_order_restaurant_status_date', 'restaurant_id', 'status', 'created_date', 'id'),
+        db.Index('ix_order_user_date', 'user_id', 'created_date', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.Enum(OrderStatus), default=OrderStatus.NEWORDER)
@@ -98,6 +107,8 @@ class Order(BaseModel):
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref='orders')
+    # Ghi lúc đặt hàng; để trống khi đơn gồm món của nhiều nhà hàng (khi đó xem restaurant_id của OrderDetail)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'))
 
 
     def __str__(self):
@@ -106,7 +117,12 @@ class Order(BaseModel):
 
 class OrderDetail(BaseModel):
     __tablename__ = 'order_detail'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_order_detail_restaurant_order', 'restaurant_id', 'order_id'),
+        db.Index('ix_order_detail_order', 'order_id', 'id'),
+        db.Index('ix_order_detail_cuisine', 'cuisine_id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, default=1)
@@ -114,6 +130,10 @@ class OrderDetail(BaseModel):
 
     cuisine_id = db.Column(db.Integer, db.ForeignKey('cuisine.id'), nullable=False)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    # Giá món lúc đặt, doanh thu không đổi khi nhà hàng sửa giá sau này
+    price = db.Column(db.Float)
+    # Nhà hàng của món tại thời điểm đặt, tránh join Cuisine -> CuisineType khi thống kê
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'))
 
     cuisine = db.relationship('Cuisine', backref='order_details')
     order = db.relationship('Order', backref='order_details')
@@ -124,7 +144,10 @@ class OrderDetail(BaseModel):
 
 class Payment(BaseModel):
     __tablename__ = 'payment'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_payment_order', 'order_id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     total = db.Column(db.Float, default=0)
@@ -140,7 +163,10 @@ class Payment(BaseModel):
 
 class CuisineType(BaseModel):
     __tablename__ = 'cuisine_type'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_cuisine_type_restaurant', 'restaurant_id', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -154,7 +180,10 @@ class CuisineType(BaseModel):
 
 class Cuisine(BaseModel):
     __tablename__ = 'cuisine'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_cuisine_cuisine_type', 'cuisine_type_id', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -175,7 +204,12 @@ class Cuisine(BaseModel):
 
 class Restaurant(BaseModel):
     __tablename__ = 'restaurant'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_restaurant_user', 'user_id', 'id'),
+        db.Index('ix_restaurant_type', 'type', 'id'),
+        db.Index('ix_restaurant_location', 'location', 'id'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     location = db.Column(db.String(255))
@@ -190,6 +224,135 @@ class Restaurant(BaseModel):
     def __str__(self):
         return f"{self.id} - {self.name}"
 
+# Tổng hợp đánh giá theo nhà hàng, cập nhật cùng transaction với Review
+class RestaurantRating(BaseModel):
+    __tablename__ = 'restaurant_rating'
+    __table_args__ = (
+        db.Index('ix_restaurant_rating_avg_rate', 'avg_rate', 'restaurant_id'),
+        {'extend_existing': True}
+    )
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    star_1 = db.Column(db.Integer, nullable=False, default=0)
+    star_2 = db.Column(db.Integer, nullable=False, default=0)
+    star_3 = db.Column(db.Integer, nullable=False, default=0)
+    star_4 = db.Column(db.Integer, nullable=False, default=0)
+    star_5 = db.Column(db.Integer, nullable=False, default=0)
+    avg_rate = db.Column(db.Float(precision=53), nullable=False, default=0)
+
+    restaurant = db.relationship('Restaurant', backref=backref('rating', uselist=False))
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 1) if self.count else None
+
+    @property
+    def histogram(self):
+        return [self.star_1, self.star_2, self.star_3, self.star_4, self.star_5]
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.average} ({self.count})"
+
+# Đánh giá theo tháng của từng nhà hàng (tháng = ngày đầu tháng của Review.created_date), cập nhật cùng Review
+class MonthlyReview(BaseModel):
+    __tablename__ = 'monthly_review'
+    __table_args__ = {'extend_existing': True}
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    star_1 = db.Column(db.Integer, nullable=False, default=0)
+    star_2 = db.Column(db.Integer, nullable=False, default=0)
+    star_3 = db.Column(db.Integer, nullable=False, default=0)
+    star_4 = db.Column(db.Integer, nullable=False, default=0)
+    star_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def average(self):
+        return round(self.total / self.count, 1) if self.count else None
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.month:%Y-%m}: {self.average} ({self.count})"
+
+# Doanh thu theo ngày của từng nhà hàng, cộng dồn cùng transaction với add_order (xem dao.add_daily_revenue)
+class DailyRevenue(BaseModel):
+    __tablename__ = 'daily_revenue'
+    __table_args__ = {'extend_existing': True}
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __str__(self):
+        return f"{self.restaurant_id} - {self.date}: {self.revenue} ({self.order_count})"
+
+# Giữ hàng tạm thời trong lúc khách thanh toán qua cổng VNPay/MoMo
+class StockHold(BaseModel):
+    __tablename__ = 'stock_hold'
+    __table_args__ = (
+        db.Index('ix_stock_hold_cuisine_expires', 'cuisine_id', 'expires_at', 'quantity'),
+        db.Index('ix_stock_hold_ref', 'hold_ref'),
+        db.Index('ix_stock_hold_expires', 'expires_at'),
+        {'extend_existing': True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    hold_ref = db.Column(db.String(255), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    cuisine_id = db.Column(db.Integer, db.ForeignKey('cuisine.id', ondelete='CASCADE'), nullable=False)
+
+    def __str__(self):
+        return f"{self.hold_ref} - {self.cuisine_id} x {self.quantity}"
+
+# Giỏ hàng phía server: cookie chỉ giữ id giỏ hàng (cũng là mã hóa đơn gửi cổng thanh toán)
+class Cart(BaseModel):
+    __tablename__ = 'cart'
+    __table_args__ = (
+        db.Index('ix_cart_updated', 'updated_date'),
+        {'extend_existing': True}
+    )
+
+    id = db.Column(db.String(36), primary_key=True)
+    receiver = db.Column(db.JSON)
+    # Tổng cộng dồn khi thêm/sửa/xóa món, trang chỉ cần đọc hai số này
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    # Thông tin để hoàn tất đơn khi cổng thanh toán báo về (IPN), không cần session của khách
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), nullable=False, default='OPEN')
+    errors = db.Column(db.JSON)
+
+    items = db.relationship('CartItem', backref='cart', cascade='all, delete-orphan')
+
+
+class CartItem(BaseModel):
+    __tablename__ = 'cart_item'
+    __table_args__ = {'extend_existing': True}
+
+    cart_id = db.Column(db.String(36), db.ForeignKey('cart.id', ondelete='CASCADE'), primary_key=True)
+    cuisine_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100))
+    price = db.Column(db.Float, nullable=False, default=0)
+    image = db.Column(db.String(255))
+    count = db.Column(db.Integer)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    note = db.Column(db.String(255), default='')
+
+# Phiên bản schema đã áp dụng (xem migrations.py)
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    __table_args__ = {'extend_existing': True}
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(255), nullable=False)
+    applied_date = db.Column(db.DateTime, default=datetime.now)
+
 # Thue
 class Tenant(BaseModel):
     __tablename__ = "tenant"
@@ -215,7 +378,10 @@ class Plan(BaseModel):
 # Goi dang ki
 class Subscription(BaseModel):
     __tablename__ = 'subscription'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_subscription_tenant', 'tenant_id', 'end_date'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     end_date = db.Column(db.DateTime)
@@ -247,7 +413,7 @@ if __name__ == '__main__':
         admin = User(
             name='Admin',
             username='admin',
-            password=str(hashlib.md5('123456'.encode('utf-8')).hexdigest()),
+            password=generate_password_hash('123456', app.config["PASSWORD_HASH_METHOD"]),
             email='admin@example.com',
             phone='0909000000',
             address='123 Admin St',
@@ -258,7 +424,7 @@ if __name__ == '__main__':
         manager = User(
             name='manager',
             username='ThanhDan',
-            password=str(hashlib.md5('123456'.encode('utf-8')).hexdigest()),
+            password=generate_password_hash('123456', app.config["PASSWORD_HASH_METHOD"]),
             email='ThanhDan@example.com',
             phone='0909000001',
             address='123 Admin Stree',
@@ -269,7 +435,7 @@ if __name__ == '__main__':
         manager2 = User(
             name='manager2',
             username='ThanhDan2',
-            password=str(hashlib.md5('123456'.encode('utf-8')).hexdigest()),
+            password=generate_password_hash('123456', app.config["PASSWORD_HASH_METHOD"]),
             email='ThanhDan2@example.com',
             phone='0909000002',
             address='123 Admin Stree',
@@ -352,10 +518,22 @@ if __name__ == '__main__':
         r1 = Review(content='Ngon tuyệt!', rate=5, user_id=admin.id, restaurant_id=res1.id)
         r2 = Review(content='Ổn, giá hợp lý', rate=4, user_id=admin.id, restaurant_id=res2.id)
         db.session.add_all([r1, r2])
+        db.session.add_all([
+            RestaurantRating(restaurant_id=res1.id, count=1, total=5, star_5=1, avg_rate=5),
+            RestaurantRating(restaurant_id=res2.id, count=1, total=4, star_4=1, avg_rate=4)
+        ])
+        db.session.flush()
+        db.session.add_all([
+            MonthlyReview(restaurant_id=res1.id, month=r1.created_date.date().replace(day=1), count=1, total=5,
+                          star_5=1),
+            MonthlyReview(restaurant_id=res2.id, month=r2.created_date.date().replace(day=1), count=1, total=4,
+                          star_4=1)
+        ])
 
         # Tạo đơn hàng gắn với restaurant (quan trọng!)
         order = Order(
             user_id=admin.id,
+            restaurant_id=res1.id,
             created_date=datetime.now(),
             status=OrderStatus.PROCESSING,
             receiver_name="batman",
@@ -364,6 +542,7 @@ if __name__ == '__main__':
         )
         order2 = Order(
             user_id=admin.id,
+            restaurant_id=res2.id,
             created_date=datetime.now(),
             status=OrderStatus.PROCESSING,
             receiver_name="batman",
@@ -374,16 +553,24 @@ if __name__ == '__main__':
         db.session.flush()
 
         # Chi tiết đơn hàng
-        detail1 = OrderDetail(order_id=order.id, cuisine_id=c1.id, quantity=2, note='Ít cay')
-        detail2 = OrderDetail(order_id=order.id, cuisine_id=c2.id, quantity=1, note='Ít đá')
-        detail3 = OrderDetail(order_id=order2.id, cuisine_id=c3.id, quantity=2, note='Ít cay')
-        detail4 = OrderDetail(order_id=order2.id, cuisine_id=c4.id, quantity=1, note='Ít đá')
+        detail1 = OrderDetail(order_id=order.id, cuisine_id=c1.id, restaurant_id=res1.id, price=c1.price, quantity=2,
+                              note='Ít cay')
+        detail2 = OrderDetail(order_id=order.id, cuisine_id=c2.id, restaurant_id=res1.id, price=c2.price, quantity=1,
+                              note='Ít đá')
+        detail3 = OrderDetail(order_id=order2.id, cuisine_id=c3.id, restaurant_id=res2.id, price=c3.price, quantity=2,
+                              note='Ít cay')
+        detail4 = OrderDetail(order_id=order2.id, cuisine_id=c4.id, restaurant_id=res2.id, price=c4.price, quantity=1,
+                              note='Ít đá')
         db.session.add_all([detail1, detail2, detail3, detail4])
 
         # Tạo thanh toán
         payment = Payment(order_id=order.id, total=105000, status=PaymentStatus.PAID, payment_ref="abc")
         payment2 = Payment(order_id=order2.id, total=100000, status=PaymentStatus.PAID, payment_ref="abcd")
         db.session.add_all([payment, payment2])
+        db.session.add_all([
+            DailyRevenue(restaurant_id=res1.id, date=order.created_date.date(), revenue=105000, order_count=1),
+            DailyRevenue(restaurant_id=res2.id, date=order2.created_date.date(), revenue=105000, order_count=1)
+        ])
 
 
         #Tạo Plan
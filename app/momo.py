@@ -1,59 +1,130 @@
-import json
-import uuid
-import requests
+import asyncio
 import hmac
 import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from app import app
 
+SIGNATURE_FIELDS = ("accessKey", "amount", "extraData", "ipnUrl", "orderId", "orderInfo", "partnerCode",
+                    "redirectUrl", "requestId", "requestType")
+# Chữ ký MoMo gửi kèm IPN và tham số trang trả về
+RESULT_SIGNATURE_FIELDS = ("accessKey", "amount", "extraData", "message", "orderId", "orderInfo", "orderType",
+                           "partnerCode", "payType", "requestId", "responseTime", "resultCode", "transId")
+
+
+class MomoError(Exception):
+    def __init__(self, message, result_code=None):
+        super().__init__(message)
+        self.result_code = result_code
 
-def get_payment_url(order_id, amount):
-    endpoint = app.config['MOMO_PAYMENT_URL']
-    accessKey = app.config['MOMO_ACCESS_KEY']
-    secretKey = app.config['MOMO_SECRET_KEY']
-    orderInfo = "abcdefghijklmnopqrstuvwxyz"
-    partnerCode = "MOMO"
-    redirectUrl = app.config['MOMO_RETURN_URL']
-    ipnUrl = "https://webhook.site/b3088a6a-2d17-4f8d-a383-71389a6c600b"
-    amount = str(int(amount))
-    orderId = str(order_id)
-    requestId = str(uuid.uuid4())
-    extraData = ""
-    partnerName = "MoMo Payment"
-    requestType = "payWithMethod"
-    storeId = "Test Store"
-    orderGroupId = ""
-    autoCapture = True
-    lang = "vi"
-    orderGroupId = ""
-
-    rawSignature = "accessKey=" + accessKey + "&amount=" + amount + "&extraData=" + extraData + "&ipnUrl=" + ipnUrl + "&orderId=" + orderId \
-                   + "&orderInfo=" + orderInfo + "&partnerCode=" + partnerCode + "&redirectUrl=" + redirectUrl \
-                   + "&requestId=" + requestId + "&requestType=" + requestType
-
-    h = hmac.new(bytes(secretKey, 'ascii'), bytes(rawSignature, 'ascii'), hashlib.sha256)
-    signature = h.hexdigest()
 
+def sign(data, secret_key, fields=SIGNATURE_FIELDS):
+    raw = "&".join(f"{k}={data.get(k, '')}" for k in fields)
+    return hmac.new(secret_key.encode('utf-8'), raw.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def verify_result(data):
+    expected = sign({**data, 'accessKey': app.config['MOMO_ACCESS_KEY']}, app.config['MOMO_SECRET_KEY'],
+                    RESULT_SIGNATURE_FIELDS)
+    return hmac.compare_digest(expected, str(data.get('signature', '')))
+
+
+def build_request(order_id, amount):
     data = {
-        'partnerCode': partnerCode,
-        'orderId': orderId,
-        'partnerName': partnerName,
-        'storeId': storeId,
-        'ipnUrl': ipnUrl,
-        'amount': amount,
-        'lang': lang,
-        'requestType': requestType,
-        'redirectUrl': redirectUrl,
-        'autoCapture': autoCapture,
-        'orderInfo': orderInfo,
-        'requestId': requestId,
-        'extraData': extraData,
-        'signature': signature,
-        'orderGroupId': orderGroupId
+        'accessKey': app.config['MOMO_ACCESS_KEY'],
+        'partnerCode': "MOMO",
+        'orderId': str(order_id),
+        'partnerName': "MoMo Payment",
+        'storeId': "Test Store",
+        'ipnUrl': app.config['MOMO_IPN_URL'],
+        'amount': str(int(amount)),
+        'lang': "vi",
+        'requestType': "payWithMethod",
+        'redirectUrl': app.config['MOMO_RETURN_URL'],
+        'autoCapture': True,
+        'orderInfo': "abcdefghijklmnopqrstuvwxyz",
+        # Giữ nguyên requestId khi thử lại để MoMo nhận ra yêu cầu trùng
+        'requestId': str(uuid.uuid4()),
+        'extraData': "",
+        'orderGroupId': ""
     }
-    data = json.dumps(data)
+    data['signature'] = sign(data, app.config['MOMO_SECRET_KEY'])
+    del data['accessKey']
+    return data
+
+
+class MomoClient:
+    def __init__(self, endpoint, connect_timeout=3, read_timeout=10, retries=2, backoff=0.3, pool_size=10):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset({"POST"}), raise_on_status=False)
+        # Giữ kết nối tới MoMo giữa các lần thanh toán thay vì mở kết nối mới mỗi lần
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def create_payment(self, data):
+        try:
+            response = self.session.post(self.endpoint, json=data, timeout=self.timeout)
+            res = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise MomoError(f"Không kết nối được MoMo: {e}") from e
+
+        if not res.get('payUrl'):
+            raise MomoError(res.get('message', "MoMo không trả về đường dẫn thanh toán"), res.get('resultCode'))
+        return res
+
+    def get_payment_url(self, order_id, amount):
+        return self.create_payment(build_request(order_id, amount))['payUrl']
+
+
+_client = None
+_client_lock = threading.Lock()
+_executor = None
+
+
+def client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MomoClient(app.config['MOMO_PAYMENT_URL'],
+                                     connect_timeout=app.config['MOMO_CONNECT_TIMEOUT'],
+                                     read_timeout=app.config['MOMO_READ_TIMEOUT'],
+                                     retries=app.config['MOMO_RETRIES'],
+                                     backoff=app.config['MOMO_BACKOFF'],
+                                     pool_size=app.config['MOMO_POOL_SIZE'])
+    return _client
+
+
+def get_payment_url(order_id, amount):
+    return client().get_payment_url(order_id, amount)
+
+
+# Bản asyncio: chạy client đồng bộ trên pool luồng riêng, giới hạn bởi MOMO_POOL_SIZE
+# để vòng lặp sự kiện không bị chặn khi MoMo chậm
+async def get_payment_url_async(order_id, amount):
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app.config['MOMO_POOL_SIZE'],
+                                               thread_name_prefix="momo")
 
-    clen = len(data)
-    response = requests.post(endpoint, data=data,
-                             headers={'Content-Type': 'application/json', 'Content-Length': str(clen)})
-    res = response.json()
+    c = client()
+    data = build_request(order_id, amount)
+    deadline = (sum(c.timeout) + c.backoff * 2 ** c.retries) * (c.retries + 1)
+    loop = asyncio.get_running_loop()
+    try:
+        res = await asyncio.wait_for(loop.run_in_executor(_executor, c.create_payment, data), deadline)
+    except asyncio.TimeoutError as e:
+        raise MomoError("MoMo phản hồi quá thời gian") from e
     return res['payUrl']
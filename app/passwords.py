@@ -0,0 +1,84 @@
+import hashlib
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import app
+
+# Tài khoản đăng nhập bằng Google không có mật khẩu: giá trị này không khớp với bất kỳ mật khẩu nào
+UNUSABLE_PASSWORD = "!"
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+# scrypt/pbkdf2 của hashlib nhả GIL nên pool luồng chạy song song thật; số luồng giới hạn CPU dành cho băm
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = app.config["PASSWORD_HASH_WORKERS"]
+                _slots = threading.BoundedSemaphore(workers * app.config["PASSWORD_HASH_QUEUE"])
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+    return _executor
+
+
+# Đợt đăng nhập dồn dập chỉ chiếm tối đa số slot cho phép, hết slot thì báo bận ngay thay vì xếp hàng.
+# Slot chỉ trả khi băm xong: request hết thời gian chờ không làm vượt giới hạn trong khi phép băm vẫn chạy
+def _run(f, *args):
+    pool = _pool()
+    if not _slots.acquire(blocking=False):
+        raise PasswordBusy()
+    try:
+        future = pool.submit(f, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=app.config["PASSWORD_HASH_TIMEOUT"])
+    except TimeoutError as e:
+        raise PasswordBusy() from e
+
+
+def is_legacy(stored):
+    return bool(stored) and len(stored) == 32 and '$' not in stored
+
+
+def needs_rehash(stored):
+    return is_legacy(stored) or not stored.startswith(app.config["PASSWORD_HASH_METHOD"] + "$")
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, app.config["PASSWORD_HASH_METHOD"])
+
+
+def _check(stored, password):
+    if not stored or stored == UNUSABLE_PASSWORD:
+        return False
+    if is_legacy(stored):
+        return hmac.compare_digest(stored, hashlib.md5(password.encode('utf-8')).hexdigest())
+    return check_password_hash(stored, password)
+
+
+def verify(stored, password):
+    return _run(_check, stored, password)
+
+
+_dummy_hash = None
+
+
+# Tên đăng nhập không tồn tại vẫn tốn một lần băm để thời gian phản hồi không lộ tài khoản
+def verify_dummy(password):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("dummy-password")
+    verify(_dummy_hash, password)
+    return False
@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+from app import app, db, dao, cache, cart_store, reservation
+from models import Payment
+
+DONE, PENDING, FAILED, MISSING = "DONE", "PENDING", "FAILED", "MISSING"
+AMOUNT_MISMATCH = "Số tiền đã thanh toán không khớp với giỏ hàng"
+
+_executor = None
+_inflight = {}
+_lock = threading.Lock()
+
+# payment_ref -> id đơn đã tạo; chỉ lưu kết quả đã hoàn tất nên không bao giờ cũ
+paid_orders = cache.TTLCache(maxsize=app.config["PAYMENT_CACHE_SIZE"], ttl=app.config["PAYMENT_CACHE_TTL"])
+
+
+# Gọi lại trang trả về/IPN cho đơn đã tạo: đọc cache, hụt thì một truy vấn theo chỉ mục unique payment_ref
+def paid_order_id(order_id):
+    paid = paid_orders.get(order_id)
+    if paid is None:
+        paid = db.session.query(Payment.order_id).filter(Payment.payment_ref == order_id).scalar()
+        if paid is not None:
+            paid_orders.set(order_id, paid)
+    return paid
+
+
+def is_paid(order_id):
+    return paid_order_id(order_id) is not None
+
+
+# Tra cứu nhẹ cho trang trả về: đơn đã tạo, đang chờ hoàn tất hay thất bại
+def status(order_id):
+    if is_paid(order_id):
+        return DONE
+
+    cart = cart_store.store.get(order_id)
+    if not cart:
+        return MISSING
+    return FAILED if cart.get("status") == cart_store.FAILED else PENDING
+
+
+# Tạo đơn từ giỏ hàng lưu phía server theo mã đơn; gọi nhiều lần (IPN, trang trả về) vẫn chỉ ra một đơn.
+# amount là số tiền cổng thanh toán đã ký xác nhận
+def finalize(order_id, amount=None):
+    if is_paid(order_id):
+        return DONE
+
+    cart = cart_store.store.get(order_id)
+    if not cart or not cart["items"] or cart.get("user_id") is None or not cart.get("receiver"):
+        return MISSING
+
+    if amount is not None and abs(float(amount) - cart["total_amount"]) >= 1:
+        app.logger.warning("Số tiền %s không khớp giỏ hàng %s (%s)", amount, order_id, cart["total_amount"])
+        cart_store.store.mark_failed(order_id, [AMOUNT_MISMATCH])
+        reservation.release(order_id)
+        return FAILED
+
+    try:
+        order = dao.add_order(user_id=cart["user_id"], cart_items=list(cart["items"].values()),
+                              receiver=cart["receiver"], payment_ref=order_id)
+    except IntegrityError:
+        # payment_ref là unique: một luồng khác vừa tạo đơn này
+        return DONE
+    except dao.CheckoutError as e:
+        if is_paid(order_id):
+            return DONE
+        cart_store.store.mark_failed(order_id, e.errors)
+        reservation.release(order_id)
+        return FAILED
+
+    paid_orders.set(order_id, order.id)
+    cart_store.store.delete(order_id)
+    return DONE
+
+
+def _run(order_id, amount):
+    with app.app_context():
+        try:
+            return finalize(order_id, amount)
+        except Exception:
+            app.logger.exception("Không hoàn tất được đơn %s", order_id)
+            raise
+        finally:
+            db.session.remove()
+            with _lock:
+                _inflight.pop(order_id, None)
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app.config["PAYMENT_WORKERS"],
+                                               thread_name_prefix="payment")
+    return _executor
+
+
+# Đưa việc tạo đơn sang pool nền; cùng một mã đơn đang chạy thì dùng lại future cũ
+def submit(order_id, amount=None):
+    pool = executor()
+    with _lock:
+        future = _inflight.get(order_id)
+        if future is None:
+            future = _inflight[order_id] = pool.submit(_run, order_id, amount)
+    return future
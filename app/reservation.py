@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from app import app, db
+from models import StockHold, Cuisine
+
+
+def _active_holds(cuisine_ids, exclude_ref=None):
+    query = db.session.query(StockHold.cuisine_id, func.sum(StockHold.quantity)) \
+        .filter(StockHold.cuisine_id.in_(cuisine_ids), StockHold.expires_at > datetime.now())
+    if exclude_ref:
+        query = query.filter(StockHold.hold_ref != exclude_ref)
+    return dict(query.group_by(StockHold.cuisine_id).all())
+
+
+def held_quantities(cuisine_ids, exclude_ref=None):
+    if not cuisine_ids:
+        return {}
+    return _active_holds(list(cuisine_ids), exclude_ref)
+
+
+# Số lượng còn bán được = tồn kho - hàng đang giữ; chỉ đọc, không khóa dòng
+def available(cuisines, exclude_ref=None):
+    held = held_quantities([c.id for c in cuisines], exclude_ref)
+    return {c.id: max(c.count - held.get(c.id, 0), 0) for c in cuisines}
+
+
+def hold(hold_ref, cart_items, ttl=None):
+    ttl = app.config["STOCK_HOLD_TTL"] if ttl is None else ttl
+    quantities = {}
+    for item in cart_items:
+        quantities[int(item['id'])] = quantities.get(int(item['id']), 0) + int(item.get('quantity'))
+
+    try:
+        cuisines = Cuisine.query.filter(Cuisine.id.in_(sorted(quantities))) \
+            .order_by(Cuisine.id).with_for_update().all()
+        held = held_quantities(quantities, exclude_ref=hold_ref)
+
+        errors = []
+        by_id = {c.id: c for c in cuisines}
+        for cuisine_id, quantity in quantities.items():
+            cuisine = by_id.get(cuisine_id)
+            if not cuisine:
+                errors.append(f"Món ăn ID {cuisine_id} không tồn tại.")
+            elif quantity > cuisine.count - held.get(cuisine_id, 0):
+                errors.append(f"Số lượng '{cuisine.name}' vượt quá số còn lại "
+                              f"({max(cuisine.count - held.get(cuisine_id, 0), 0)}).")
+        if errors:
+            db.session.rollback()
+            return errors
+
+        # Thanh toán lại cùng giỏ hàng thì thay thế lần giữ cũ
+        StockHold.query.filter(StockHold.hold_ref == hold_ref).delete(synchronize_session=False)
+        expires_at = datetime.now() + timedelta(seconds=ttl)
+        db.session.add_all([StockHold(hold_ref=hold_ref, cuisine_id=cuisine_id, quantity=quantity,
+                                      expires_at=expires_at)
+                            for cuisine_id, quantity in quantities.items()])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+
+    start_sweeper()
+    return []
+
+
+# Gọi trong transaction của add_order, không commit
+def convert(hold_ref):
+    StockHold.query.filter(StockHold.hold_ref == hold_ref).delete(synchronize_session=False)
+
+
+def release(hold_ref):
+    try:
+        convert(hold_ref)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+
+
+def sweep():
+    try:
+        count = StockHold.query.filter(StockHold.expires_at <= datetime.now()).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        raise e
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _sweep_forever(interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                sweep()
+            except SQLAlchemyError:
+                app.logger.exception("Không dọn được hàng giữ đã hết hạn")
+            finally:
+                db.session.remove()
+
+
+# Luồng nền dọn các lần giữ hàng hết hạn (hàng hết hạn đã bị bỏ qua khi đọc, đây chỉ là dọn dẹp)
+def start_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        return
+
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, args=(app.config["STOCK_HOLD_SWEEP_INTERVAL"],),
+                                        name="stock-hold-sweeper", daemon=True)
+            _sweeper.start()
@@ -0,0 +1,65 @@
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_PREFIX = "replica_"
+# Khóa trong cookie phiên: tới thời điểm này mọi lệnh đọc của người dùng vẫn đi về primary
+STICKY_KEY = "_db_primary_until"
+
+_read_only = ContextVar("read_only", default=False)
+
+
+def replica_binds(urls):
+    return {f"{REPLICA_PREFIX}{i}": url for i, url in enumerate(u.strip() for u in urls.split(",") if u.strip())}
+
+
+# Đánh dấu hàm DAO chỉ đọc: truy vấn bên trong được phép chạy trên replica
+def read_only(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+def stick_to_primary(seconds=None):
+    if has_request_context():
+        seconds = current_app.config["REPLICA_STICKY_SECONDS"] if seconds is None else seconds
+        flask_session[STICKY_KEY] = time.time() + seconds
+
+
+def _sticky():
+    return has_request_context() and flask_session.get(STICKY_KEY, 0) > time.time()
+
+
+class RoutingSession(Session):
+    def replicas(self):
+        return [engine for key, engine in self._db.engines.items() if key and key.startswith(REPLICA_PREFIX)]
+
+    # Đọc qua hàm read_only đi replica, trừ khi phiên này vừa ghi hoặc người dùng còn trong cửa sổ đọc-lại-của-mình
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _read_only.get() and not self._flushing and not self.info.get("wrote") \
+                and not _sticky():
+            replicas = self.replicas()
+            if replicas:
+                return random.choice(replicas)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.get("wrote") and session.replicas():
+        stick_to_primary()
@@ -0,0 +1,235 @@
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from app import app, db
+from models import Restaurant, Cuisine, CuisineType
+
+TOKEN_RE = re.compile(r"\w+")
+NAME_WEIGHT = 3
+TEXT_WEIGHT = 1
+DISH_FACTOR = 0.5
+MAX_PREFIX_TERMS = 50
+
+
+# Bỏ dấu tiếng Việt: "Bún Bò" -> "bun bo"
+def fold(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings = {}  # token -> {doc_id: weight}
+        self.docs = {}  # doc_id -> (tokens, payload)
+        self._vocab = None
+
+    def add(self, doc_id, fields, payload=None):
+        self.remove(doc_id)
+
+        weights = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0) + weight
+
+        for token, weight in weights.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                self._vocab = None
+            self.postings[token][doc_id] = weight
+        self.docs[doc_id] = (tuple(weights), payload)
+
+    def remove(self, doc_id):
+        entry = self.docs.pop(doc_id, None)
+        if entry is None:
+            return
+
+        for token in entry[0]:
+            posting = self.postings[token]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[token]
+                self._vocab = None
+
+    def payload(self, doc_id):
+        entry = self.docs.get(doc_id)
+        return entry[1] if entry else None
+
+    def _terms(self, token, prefix):
+        if not prefix:
+            return [token] if token in self.postings else []
+
+        if self._vocab is None:
+            self._vocab = sorted(self.postings)
+        terms = []
+        i = bisect.bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token) and len(terms) < MAX_PREFIX_TERMS:
+            terms.append(self._vocab[i])
+            i += 1
+        return terms
+
+    def search(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        total = len(self.docs)
+        scores = None
+        # Mọi từ phải khớp; từ cuối cùng được khớp theo tiền tố ("bun b" -> "bun bo")
+        for i, token in enumerate(tokens):
+            token_scores = {}
+            for term in self._terms(token, prefix=i == len(tokens) - 1):
+                posting = self.postings[term]
+                idf = math.log(1 + total / len(posting))
+                for doc_id, weight in posting.items():
+                    token_scores[doc_id] = max(token_scores.get(doc_id, 0), idf * weight)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {d: s + token_scores[d] for d, s in scores.items() if d in token_scores}
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+
+class CatalogSearch:
+    def __init__(self, rebuild_interval):
+        self.rebuild_interval = rebuild_interval
+        self.restaurants = InvertedIndex()
+        self.cuisines = InvertedIndex()
+        self._built_at = None
+        self._generation = 0
+        # Cập nhật đến trong lúc đang dựng lại: áp lại lên chỉ mục mới trước khi thay
+        self._pending = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.RLock()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+            self._generation += 1
+
+    def _fresh(self):
+        return self._built_at is not None and time.monotonic() - self._built_at <= self.rebuild_interval
+
+    def rebuild(self):
+        with self._build_lock:
+            with self._lock:
+                generation = self._generation
+                self._pending = []
+
+            try:
+                restaurants, cuisines = InvertedIndex(), InvertedIndex()
+                for r in db.session.query(Restaurant.id, Restaurant.name, Restaurant.introduce):
+                    restaurants.add(r.id, [(r.name, NAME_WEIGHT), (r.introduce, TEXT_WEIGHT)])
+
+                for c in db.session.query(Cuisine.id, Cuisine.name, Cuisine.description, CuisineType.restaurant_id) \
+                        .join(CuisineType, CuisineType.id == Cuisine.cuisine_type_id):
+                    cuisines.add(c.id, [(c.name, NAME_WEIGHT), (c.description, TEXT_WEIGHT)],
+                                 payload=c.restaurant_id)
+
+                with self._lock:
+                    for apply in self._pending:
+                        apply(restaurants, cuisines)
+                    self.restaurants, self.cuisines = restaurants, cuisines
+                    # Bị invalidate giữa chừng: dữ liệu vừa đọc có thể đã cũ, lần tìm sau dựng lại
+                    self._built_at = time.monotonic() if self._generation == generation else None
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    # Kiểm tra và dựng lại trong khóa: nhiều request cùng lúc chỉ dựng một lần
+    def _ensure_built(self):
+        if self._fresh():
+            return
+        with self._build_lock:
+            if not self._fresh():
+                self.rebuild()
+
+    # Danh sách (id nhà hàng, điểm) theo điểm giảm dần, cùng điểm thì id tăng dần
+    def rank_restaurants(self, query):
+        self._ensure_built()
+        with self._lock:
+            scores = dict(self.restaurants.search(query))
+            # Nhà hàng có món khớp từ khóa cũng được trả về, điểm thấp hơn khớp theo tên
+            for cuisine_id, score in self.cuisines.search(query):
+                restaurant_id = self.cuisines.payload(cuisine_id)
+                scores[restaurant_id] = max(scores.get(restaurant_id, 0), score * DISH_FACTOR)
+
+        return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+    def search_restaurants(self, query):
+        return [rid for rid, _ in self.rank_restaurants(query)]
+
+    def search_cuisines(self, query, restaurant_id=None):
+        self._ensure_built()
+        with self._lock:
+            ranked = self.cuisines.search(query)
+            return [cid for cid, _ in ranked
+                    if restaurant_id is None or self.cuisines.payload(cid) == restaurant_id]
+
+    def _apply(self, apply):
+        with self._lock:
+            apply(self.restaurants, self.cuisines)
+            if self._pending is not None:
+                self._pending.append(apply)
+
+    def index_restaurant(self, r):
+        doc_id, fields = r.id, [(r.name, NAME_WEIGHT), (r.introduce, TEXT_WEIGHT)]
+        self._apply(lambda restaurants, cuisines: restaurants.add(doc_id, fields))
+
+    def index_cuisine(self, c):
+        restaurant_id = c.cuisine_type.restaurant_id if c.cuisine_type else None
+        doc_id, fields = c.id, [(c.name, NAME_WEIGHT), (c.description, TEXT_WEIGHT)]
+        self._apply(lambda restaurants, cuisines: cuisines.add(doc_id, fields, payload=restaurant_id))
+
+    def remove_restaurant(self, restaurant_id):
+        self._apply(lambda restaurants, cuisines: restaurants.remove(restaurant_id))
+
+    def remove_cuisine(self, cuisine_id):
+        self._apply(lambda restaurants, cuisines: cuisines.remove(cuisine_id))
+
+
+catalog = CatalogSearch(rebuild_interval=app.config["SEARCH_REBUILD_INTERVAL"])
+
+
+def search_restaurants(query):
+    return catalog.search_restaurants(query)
+
+
+def rank_restaurants(query):
+    return catalog.rank_restaurants(query)
+
+
+def search_cuisines(query, restaurant_id=None):
+    return catalog.search_cuisines(query, restaurant_id)
+
+
+def index_model(model):
+    if isinstance(model, Restaurant):
+        catalog.index_restaurant(model)
+    elif isinstance(model, Cuisine):
+        catalog.index_cuisine(model)
+    elif isinstance(model, CuisineType):
+        # Đổi loại món có thể đổi nhà hàng của nhiều món: dựng lại toàn bộ
+        catalog.invalidate()
+
+
+def remove_model(model):
+    if isinstance(model, Restaurant):
+        catalog.invalidate()
+    elif isinstance(model, Cuisine):
+        catalog.remove_cuisine(model.id)
+    elif isinstance(model, CuisineType):
+        catalog.invalidate()
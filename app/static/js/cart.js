@@ -88,6 +88,11 @@ function updateCart(productId, obj) {
             "Content-Type": "application/json"
         }
     }).then(res => res.json()).then(data => {
+        if (data.error) {
+            alert(data.error);
+            location.reload();
+            return;
+        }
         updateCartCounterUI(data.total_quantity);
         updateCartAmountUI(data.total_amount);
 
@@ -120,6 +125,11 @@ function deleteProductInCart(productId) {
             method: "DELETE"
         }).then(res => res.json())
             .then(data => {
+                if (data.error) {
+                    alert(data.error);
+                    location.reload();
+                    return;
+                }
                 updateCartCounterUI(data.total_quantity);
                 updateCartAmountUI(data.total_amount);
 
@@ -0,0 +1,86 @@
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.innerText = value == null ? '' : value;
+    return div.innerHTML;
+}
+
+const CARD_SIZES = '(min-width: 1200px) 25vw, (min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw';
+
+// Giống macro responsive_img: có srcset thì dùng <picture> WebP, trình duyệt cũ lấy JPEG
+function restaurantImage(r) {
+    const img = `<img src="${escapeHtml(r.image)}"
+                      ${r.image_srcset && r.image_srcset.jpeg ? `srcset="${escapeHtml(r.image_srcset.jpeg)}" sizes="${CARD_SIZES}"` : ''}
+                      loading="lazy" class="img-fluid rounded-top" alt="${escapeHtml(r.name)}"
+                      style="height: 200px; width: 100%; object-fit: cover;">`;
+    if (!r.image_srcset || !r.image_srcset.webp) return img;
+    return `<picture class="d-block">
+                <source type="image/webp" srcset="${escapeHtml(r.image_srcset.webp)}" sizes="${CARD_SIZES}">
+                ${img}
+            </picture>`;
+}
+
+function restaurantCard(r) {
+    let rating = 'Chưa có đánh giá';
+    if (r.avg_rate) {
+        let stars = '';
+        for (let i = 1; i <= 5; i++)
+            stars += `<i class="fa fa-star ${i <= Math.floor(r.avg_rate) ? 'text-warning' : 'text-muted'}"></i>`;
+        rating = `⭐ ${r.avg_rate} <span>${stars}</span>`;
+    }
+
+    return `
+        <div class="col-md-6 col-lg-4 col-xl-3">
+            <div class="rounded shadow border border-secondary h-100">
+                <div class="p-4">
+                    ${restaurantImage(r)}
+                    <h5 class="text-primary mt-3">${escapeHtml(r.name)}</h5>
+                    <p><strong>Loại hình:</strong> ${escapeHtml(r.type)}</p>
+                    <p><strong>Địa điểm:</strong> ${escapeHtml(r.location)}</p>
+                    <p><strong>Giới thiệu:</strong> ${escapeHtml(r.introduce)}</p>
+                    <p>${rating}</p>
+                    <a href="/restaurant/${r.id}" class="btn btn-outline-primary rounded-pill">Xem chi tiết</a>
+                </div>
+            </div>
+        </div>`;
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const btn = document.getElementById('load-more-restaurants');
+    const list = document.getElementById('restaurant-list');
+    if (!btn || !list) return;
+
+    let loading = false;
+
+    function loadMore() {
+        if (loading || !btn.dataset.cursor) return;
+        loading = true;
+
+        const params = new URLSearchParams(window.location.search);
+        params.set('cursor', btn.dataset.cursor);
+
+        fetch(`/api/restaurants?${params.toString()}`)
+            .then(res => res.json())
+            .then(data => {
+                list.insertAdjacentHTML('beforeend', data.restaurants.map(restaurantCard).join(''));
+                if (data.next_cursor) {
+                    btn.dataset.cursor = data.next_cursor;
+                } else {
+                    btn.dataset.cursor = '';
+                    btn.style.display = 'none';
+                }
+            })
+            .finally(() => loading = false);
+    }
+
+    btn.addEventListener('click', e => {
+        e.preventDefault();
+        loadMore();
+    });
+
+    // Tự tải trang kế tiếp khi cuộn tới cuối danh sách
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) loadMore();
+        }, {rootMargin: '200px'}).observe(btn);
+    }
+});
@@ -46,6 +46,16 @@ document.addEventListener("DOMContentLoaded", function () {
         })
     }
 
+    //Cap nhat hang doi don hang khi co don moi/doi trang thai (SSE)
+    const order_table = document.getElementById("order-table")
+    if(order_table && order_table.dataset.live === "true" && window.EventSource){
+        const source = new EventSource(order_table.dataset.streamUrl)
+        const reload = () => refreshOrderRows()
+        source.addEventListener("new_order", reload)
+        source.addEventListener("order_status", reload)
+        source.addEventListener("resync", reload)
+    }
+
     //Xu ly quay lai
     const button_comeback = document.getElementById("btn_comeback")
     if(button_comeback){
@@ -56,6 +66,40 @@ document.addEventListener("DOMContentLoaded", function () {
 })
 
 
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.innerText = value == null ? '' : value;
+    return div.innerHTML;
+}
+
+const ORDER_STATUS_LABELS = {
+    "NEWORDER": "Đơn hàng mới",
+    "PROCESSING": "Đang xử lý",
+    "COMPLETE": "Đã xử lý"
+}
+
+function refreshOrderRows(){
+    fetch(`/api/manager/orders${window.location.search}`)
+        .then(res => res.json())
+        .then(data => {
+            document.getElementById("order-rows").innerHTML = data.orders.map(o => `
+                <tr>
+                    <td>${o.id}</td>
+                    <td>${escapeHtml(o.name)}</td>
+                    <td>${o.created_date.replace("T", " ")}</td>
+                    <td>${o.count}</td>
+                    <td>${Math.round(o.total).toLocaleString("en-US")} VND</td>
+                    <td>Thanh toán online</td>
+                    <td>${ORDER_STATUS_LABELS[o.status]}</td>
+                    <td>
+                        <div>
+                            <a href="/manager/view/oder_detail/${o.id}">Xem</a>
+                        </div>
+                    </td>
+                </tr>`).join("")
+        })
+}
+
 function cuisineRemove(cuisine_id){
     if(confirm("Bạn có chắc là xóa món ăn này không?") === true){
         fetch("/api/manager/delete/cuisine", {
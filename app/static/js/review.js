@@ -1,10 +1,59 @@
+function reviewCard(review) {
+    const div = document.createElement('div');
+    div.className = 'card mb-3 review-item';
+
+    let stars = '';
+    for (let i = 1; i <= 5; i++)
+        stars += i <= review.rate ? '<i class="fa fa-star text-warning"></i>' : '<i class="fa fa-star" style="color: #ddd;"></i>';
+
+    div.innerHTML = `
+        <div class="card-body">
+            <h6 class="mb-1"><strong></strong> – ${review.date}</h6>
+            <p class="mb-2"></p>
+            <div>${stars}</div>
+        </div>`;
+    div.querySelector('strong').innerText = review.user_name;
+    div.querySelector('p').innerText = review.content;
+    return div;
+}
+
 document.addEventListener('DOMContentLoaded', () => {
+    const list = document.getElementById('review-list');
     const btn = document.getElementById('load-more-btn');
-    if (!btn) return;
-
-    btn.addEventListener('click', () => {
-        const hiddenReviews = document.querySelectorAll('.review-item[style*="display: none"]');
-        hiddenReviews.forEach(item => item.style.display = 'block');
-        btn.style.display = 'none'; // Ẩn nút sau khi nhấn
-    });
-});
\ No newline at end of file
+    const starFilter = document.getElementById('review-star-filter');
+    const empty = document.getElementById('review-empty');
+    if (!list || !btn) return;
+
+    let loading = false;
+
+    function loadReviews(reset) {
+        if (loading || (!reset && !btn.dataset.cursor)) return;
+        loading = true;
+
+        const params = new URLSearchParams();
+        if (!reset) params.set('cursor', btn.dataset.cursor);
+        if (starFilter && starFilter.value) params.set('star', starFilter.value);
+
+        fetch(`/api/restaurants/${list.dataset.restaurantId}/reviews?${params.toString()}`)
+            .then(res => res.json())
+            .then(data => {
+                if (reset) list.innerHTML = '';
+                data.reviews.forEach(r => list.appendChild(reviewCard(r)));
+
+                btn.dataset.cursor = data.next_cursor || '';
+                btn.style.display = data.next_cursor ? 'inline-block' : 'none';
+                if (empty) empty.style.display = list.children.length ? 'none' : 'block';
+            })
+            .finally(() => loading = false);
+    }
+
+    btn.addEventListener('click', () => loadReviews(false));
+    if (starFilter) starFilter.addEventListener('change', () => loadReviews(true));
+
+    // Tải thêm đánh giá khi cuộn tới cuối danh sách
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(e => e.isIntersecting)) loadReviews(false);
+        }, {rootMargin: '200px'}).observe(btn);
+    }
+});
@@ -0,0 +1,79 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import os
+import unittest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import app, db
+import models
+
+RECEIVER = {"receiver_name": "batman", "receiver_phone": "0912345678", "receiver_address": "HCM"}
+
+
+# Các test này xóa và tạo lại toàn bộ bảng: chỉ chạy trên DB thử nghiệm
+# Ví dụ: DATABASE_URL=sqlite:////tmp/oufood_test.db python -m pytest app/test
+def is_test_database():
+    url = db.engine.url
+    return bool(os.environ.get("DATABASE_URL")) and \
+        (url.get_backend_name() == "sqlite" or (url.database or "").endswith("_test"))
+
+
+class DatabaseTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ctx = app.app_context()
+        cls.ctx.push()
+        if not is_test_database():
+            cls.ctx.pop()
+            raise unittest.SkipTest("DATABASE_URL không trỏ tới DB thử nghiệm")
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        cls.ctx.pop()
+
+    def setUp(self):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+
+    # parameters=True: ghi kèm tham số để chạy lại câu lệnh (ví dụ EXPLAIN)
+    @contextmanager
+    def count_queries(self, parameters=False):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, params, context, executemany):
+            statements.append((statement, params) if parameters else statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    def add_user(self, username="customer", role=models.Role.CUSTOMER):
+        u = models.User(name=username, username=username, password="x", email=f"{username}@example.com",
+                        phone=str(abs(hash(username)) % 10 ** 10).zfill(10), role=role)
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    # Nhà hàng kèm một loại món "Món chính" để thêm món; chỉ flush, test tự commit
+    def add_restaurant(self, manager_id, name="Bún Bò Huế", **values):
+        r = models.Restaurant(name=name, user_id=manager_id, **values)
+        db.session.add(r)
+        db.session.flush()
+        ct = models.CuisineType(name="Món chính", restaurant_id=r.id)
+        db.session.add(ct)
+        db.session.flush()
+        return r, ct
+
+    def add_cuisine(self, cuisine_type_id, name="Bún", price=10000, count=5, **values):
+        c = models.Cuisine(name=name, price=price, count=count, cuisine_type_id=cuisine_type_id, **values)
+        db.session.add(c)
+        db.session.flush()
+        return c
@@ -0,0 +1,34 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import time
+import unittest
+from app import cache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        c = cache.TTLCache(maxsize=2, ttl=60)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertEqual(c.get("a"), 1)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(c.get("c"), 3)
+
+    def test_ttl_expiry(self):
+        c = cache.TTLCache(maxsize=2, ttl=0.01)
+        c.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(c.get("a"))
+        self.assertEqual(c.stats()["misses"], 1)
+
+    def test_bump_data_version(self):
+        v = cache.data_version()
+        self.assertEqual(cache.bump_data_version(), v + 1)
+        self.assertEqual(cache.data_version(), v + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from app import app, db, cart_store, utils
+from models import Cart
+from base import DatabaseTestCase
+
+ITEM = {"id": 1, "name": "Bún bò", "price": 40000, "image": "bun.jpg", "count": 5}
+
+
+class CartStoreCases:
+    def test_item_operations(self):
+        cart_id = self.store.create()
+        self.store.add_item(cart_id, 1, ITEM)
+        self.store.add_item(cart_id, "1", ITEM)
+        self.store.add_item(cart_id, 2, {**ITEM, "id": 2, "price": 10000})
+        self.assertEqual(self.store.update_item(cart_id, 2, quantity=3, note="ít cay"),
+                         {"total_quantity": 5, "total_amount": 110000})
+        self.assertEqual(self.store.update_item(cart_id, 3, quantity=4)["total_quantity"], 5)
+        self.assertEqual(self.store.remove_item(cart_id, 1), {"total_quantity": 3, "total_amount": 30000})
+
+        cart = self.store.get(cart_id)
+        self.assertEqual(cart["order_id"], cart_id)
+        self.assertEqual(list(cart["items"]), ["2"])
+        self.assertEqual(cart["items"]["2"]["note"], "ít cay")
+        self.assertTrue(utils.cart_totals_match(cart))
+        self.assertEqual(self.store.totals(cart_id), utils.cart_totals(cart))
+
+        self.store.delete(cart_id)
+        self.assertIsNone(self.store.get(cart_id))
+
+    def test_locked_after_checkout(self):
+        cart_id = self.store.create()
+        self.store.add_item(cart_id, 1, ITEM)
+        self.store.checkout(cart_id, {"receiver_name": "batman"}, 1)
+        for change in (lambda: self.store.add_item(cart_id, 1, ITEM),
+                       lambda: self.store.update_item(cart_id, 1, quantity=5),
+                       lambda: self.store.remove_item(cart_id, 1)):
+            with self.assertRaises(cart_store.CartLockedError):
+                change()
+        self.assertEqual(self.store.totals(cart_id), {"total_quantity": 1, "total_amount": 40000})
+
+        self.store.reopen(cart_id)
+        self.assertEqual(self.store.add_item(cart_id, 1, ITEM)["total_quantity"], 2)
+
+    def test_import_legacy_cart(self):
+        legacy = {"order_id": "legacy-1", "items": {"1": {**ITEM, "id": "1", "quantity": 3, "note": ""}},
+                  "receiver": {"receiver_name": "batman"}}
+        self.assertEqual(self.store.import_cart(legacy), "legacy-1")
+        cart = self.store.get("legacy-1")
+        self.assertEqual(cart["items"]["1"]["quantity"], 3)
+        self.assertEqual(cart["receiver"], {"receiver_name": "batman"})
+        self.assertEqual(utils.cart_totals(cart), {"total_quantity": 3, "total_amount": 120000})
+
+
+class TestMemoryCartStore(CartStoreCases, unittest.TestCase):
+    def setUp(self):
+        self.store = cart_store.MemoryCartStore()
+
+
+class TestSqlCartStore(CartStoreCases, DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = cart_store.SqlCartStore()
+
+    def test_session_holds_only_cart_id(self):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["cart"] = {"order_id": "legacy-2", "items": {"1": {**ITEM, "id": "1", "quantity": 1, "note": ""}}}
+
+        old_store, cart_store.store = cart_store.store, self.store
+        try:
+            res = client.post("/api/carts", json={**ITEM, "id": 1})
+            self.assertEqual(res.json, 2)
+            with client.session_transaction() as s:
+                self.assertNotIn("cart", s)
+                self.assertEqual(s["cart_id"], "legacy-2")
+        finally:
+            cart_store.store = old_store
+        self.assertEqual(Cart.query.count(), 1)
+
+    def test_recalculate_drifted_totals(self):
+        cart_id = self.store.create()
+        self.store.add_item(cart_id, 1, ITEM)
+        db.session.get(Cart, cart_id).total_quantity = 7
+        db.session.commit()
+        self.assertFalse(utils.cart_totals_match(self.store.get(cart_id)))
+        self.assertEqual(self.store.recalculate(cart_id), {"total_quantity": 1, "total_amount": 40000})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import threading
+import unittest
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from app import app, db, dao, reservation
+from models import Cuisine, Order, OrderDetail, Payment, StockHold, FoodType, Role
+from base import DatabaseTestCase, RECEIVER
+
+
+class TestCheckout(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.add_user("customer")
+        manager = self.add_user("manager", Role.MANAGER)
+        r, ct = self.add_restaurant(manager.id)
+        self.cuisines = [self.add_cuisine(ct.id, f"Bún {i}", 10000 * (i + 1), food_type=FoodType.MAIN)
+                         for i in range(10)]
+        db.session.commit()
+        self.cuisine_ids = [c.id for c in self.cuisines]
+        self.customer_id = self.customer.id
+        self.manager_id = manager.id
+        self.restaurant_id = r.id
+
+    def cart(self, count, quantity=1):
+        return [{"id": str(cid), "quantity": quantity, "note": ""} for cid in self.cuisine_ids[:count]]
+
+    def test_add_order(self):
+        order = dao.add_order(self.customer_id, self.cart(2, 2), RECEIVER, "ref-1")
+        payment = Payment.query.filter_by(order_id=order.id).one()
+        self.assertEqual(payment.total, (10000 + 20000) * 2)
+        self.assertEqual([db.session.get(Cuisine, cid).count for cid in self.cuisine_ids[:2]], [3, 3])
+
+    def test_restaurant_recorded(self):
+        order = dao.add_order(self.customer_id, self.cart(2), RECEIVER, "ref-r1")
+        self.assertEqual(order.restaurant_id, self.restaurant_id)
+        self.assertEqual({d.restaurant_id for d in order.order_details}, {self.restaurant_id})
+
+        other, ct = self.add_restaurant(self.add_user("other", Role.MANAGER).id, "Phở")
+        pho = self.add_cuisine(ct.id, "Phở bò", 50000)
+        db.session.commit()
+        mixed = dao.add_order(self.customer_id, self.cart(1) + [{"id": str(pho.id), "quantity": 1}], RECEIVER, "ref-r2")
+        self.assertIsNone(db.session.get(Order, mixed.id).restaurant_id)
+
+        rows, _ = dao.get_order(self.manager_id)
+        self.assertEqual(sorted((r.id, r.count) for r in rows), [(order.id, 2), (mixed.id, 2)])
+        detail = OrderDetail.query.filter_by(order_id=mixed.id, cuisine_id=pho.id).one()
+        self.assertEqual(dao.get_restaurant(detail.id)[0], other.id)
+
+    def test_validation(self):
+        cart = self.cart(1, 6) + [{"id": "9999", "quantity": 1}]
+        cart[0]["price"] = 1
+        self.assertEqual(len(dao.validate_cart_items(cart)), 3)
+        with self.assertRaises(dao.CheckoutError):
+            dao.add_order(self.customer_id, self.cart(1, 6), RECEIVER, "ref-2")
+        self.assertEqual(OrderDetail.query.count(), 0)
+
+    def test_round_trips_bounded(self):
+        counts = []
+        for i, size in enumerate([1, 10]):
+            db.session.remove()
+            with self.count_queries() as statements:
+                dao.add_order(self.customer_id, self.cart(size), RECEIVER, f"ref-rt-{i}")
+            counts.append(len(statements))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_concurrent_checkout_no_oversell(self):
+        cuisine_id = self.cuisine_ids[0]
+        results = []
+
+        def buy(n):
+            with app.app_context():
+                try:
+                    dao.add_order(self.customer_id, [{"id": str(cuisine_id), "quantity": 1}], RECEIVER, f"ref-c-{n}")
+                    results.append(True)
+                except (dao.CheckoutError, SQLAlchemyError):
+                    results.append(False)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=buy, args=(n,)) for n in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        db.session.remove()
+        sold = db.session.query(func.coalesce(func.sum(OrderDetail.quantity), 0)) \
+            .filter(OrderDetail.cuisine_id == cuisine_id).scalar()
+        remaining = db.session.get(Cuisine, cuisine_id).count
+        self.assertLessEqual(results.count(True), 5)
+        self.assertEqual(sold, results.count(True))
+        self.assertEqual(remaining, 5 - sold)
+        self.assertGreaterEqual(remaining, 0)
+
+    def test_hold_blocks_other_buyers(self):
+        cart = self.cart(1, 4)
+        self.assertEqual(reservation.hold("ref-a", cart), [])
+        self.assertEqual(len(reservation.hold("ref-b", self.cart(1, 2))), 1)
+        cuisine = db.session.get(Cuisine, self.cuisine_ids[0])
+        self.assertEqual(reservation.available([cuisine]), {cuisine.id: 1})
+
+        with self.assertRaises(dao.CheckoutError):
+            dao.add_order(self.customer_id, self.cart(1, 2), RECEIVER, "ref-b")
+
+        dao.add_order(self.customer_id, cart, RECEIVER, "ref-a")
+        self.assertEqual(StockHold.query.count(), 0)
+        self.assertEqual(db.session.get(Cuisine, self.cuisine_ids[0]).count, 1)
+
+    def test_expired_holds_ignored_and_swept(self):
+        self.assertEqual(reservation.hold("ref-a", self.cart(1, 5), ttl=-1), [])
+        self.assertEqual(reservation.hold("ref-b", self.cart(1, 5)), [])
+        self.assertEqual(reservation.sweep(), 1)
+        reservation.release("ref-b")
+        self.assertEqual(StockHold.query.count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import threading
+import time
+import unittest
+from flask import g
+from app import app, db, dao, events, index
+from models import Role
+from base import DatabaseTestCase, RECEIVER
+
+
+class TestBus(unittest.TestCase):
+    def test_channels_and_overflow(self):
+        bus = events.LocalBus(maxsize=2)
+        sub = bus.subscribe([1, 2])
+        other = bus.subscribe([3])
+        for n in range(3):
+            bus.publish(1, {"type": "x", "n": n})
+        self.assertEqual([sub.get(0)["n"], sub.get(0)["n"]], [0, 1])
+        self.assertTrue(sub.lagged)
+        self.assertIsNone(other.get(0))
+
+        bus.unsubscribe(sub)
+        bus.unsubscribe(other)
+        self.assertEqual(bus.subscriber_count(), 0)
+
+    def test_broker_fan_out(self):
+        server = events.BrokerServer(("127.0.0.1", 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            port = server.server_address[1]
+            worker_a = events.BrokerBus("127.0.0.1", port)
+            worker_b = events.BrokerBus("127.0.0.1", port)
+            sub_a, sub_b = worker_a.subscribe([7]), worker_b.subscribe([7])
+            # Worker chỉ đăng ký hàm gọi lại (xóa cache danh tính) cũng nghe broker
+            worker_c = events.BrokerBus("127.0.0.1", port)
+            received = threading.Event()
+            worker_c.listen(events.IDENTITY, lambda event: received.set())
+            while len(server.clients) < 3:
+                time.sleep(0.01)
+            worker_a.publish(7, {"type": "new_order", "order_id": 1})
+            self.assertEqual(sub_b.get(2)["order_id"], 1)
+            self.assertEqual(sub_a.get(2)["order_id"], 1)
+            worker_b.publish(events.IDENTITY, {"type": events.IDENTITY, "user_id": 1})
+            self.assertTrue(received.wait(2))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestOrderEvents(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer_id = self.add_user("customer").id
+        manager = self.add_user("manager", Role.MANAGER)
+        self.manager_id = manager.id
+        r, ct = self.add_restaurant(manager.id)
+        cuisine = self.add_cuisine(ct.id)
+        db.session.commit()
+        self.restaurant_id = r.id
+        self.cuisine_id = cuisine.id
+
+    def test_checkout_and_status_change_published(self):
+        stream = events.stream([self.restaurant_id], heartbeat=0.05)
+        self.assertTrue(next(stream).startswith("retry:"))
+        self.assertEqual(next(stream), ": ping\n\n")
+
+        order = dao.add_order(self.customer_id, [{"id": str(self.cuisine_id), "quantity": 1}], RECEIVER, "ref-1")
+        frame = next(stream)
+        self.assertTrue(frame.startswith("event: new_order\n"))
+        self.assertIn(f'"order_id":{order.id}', frame)
+
+        dao.update_order(order.id, "Processing")
+        self.assertIn('"status":"PROCESSING"', next(stream))
+        stream.close()
+        self.assertEqual(events.bus.subscriber_count(), 0)
+
+    def test_stream_route(self):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["_user_id"] = str(self.manager_id)
+            s["_fresh"] = True
+        g.pop("_login_user", None)
+        heartbeat = app.config["EVENT_HEARTBEAT"]
+        app.config["EVENT_HEARTBEAT"] = 0.05
+        try:
+            res = client.get("/manager/orders/stream")
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.mimetype, "text/event-stream")
+            self.assertEqual(res.headers["Cache-Control"], "no-cache")
+            frames = iter(res.response)
+            self.assertTrue(next(frames).startswith(b"retry:"))
+
+            order = dao.add_order(self.customer_id, [{"id": str(self.cuisine_id), "quantity": 1}], RECEIVER,
+                                  "ref-1")
+            frame = next(frames)
+            while frame == b": ping\n\n":
+                frame = next(frames)
+            self.assertTrue(frame.startswith(b"event: new_order\n"))
+            self.assertIn(f'"order_id":{order.id}'.encode(), frame)
+            res.close()
+            self.assertEqual(events.bus.subscriber_count(), 0)
+        finally:
+            app.config["EVENT_HEARTBEAT"] = heartbeat
+
+        g.pop("_login_user", None)
+        with client.session_transaction() as s:
+            s["_user_id"] = str(self.customer_id)
+        self.assertEqual(client.get("/manager/orders/stream").status_code, 403)
+
+
+if __name__ == "__main__":
+    unittest.main()
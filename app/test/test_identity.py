@@ -0,0 +1,78 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from unittest import mock
+from flask import g
+from app import app, db, identity, index, events
+from models import Role, User
+from base import DatabaseTestCase
+
+
+class TestUserIdentityCache(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        identity.identities.clear()
+        self.admin_id = self.add_user("admin", Role.ADMIN).id
+        self.client = app.test_client()
+        with self.client.session_transaction() as s:
+            s["_user_id"] = str(self.admin_id)
+            s["_fresh"] = True
+
+    def get(self, url):
+        # Request trong test dùng chung app context của lớp test: bỏ user Flask-Login đã gắn vào g
+        g.pop("_login_user", None)
+        return self.client.get(url)
+
+    def test_customer_identity_cached(self):
+        customer_id = self.add_user("customer").id
+        with self.count_queries() as statements:
+            identity.load(customer_id)
+        self.assertEqual(len(statements), 1)
+
+        db.session.remove()
+        with self.count_queries() as statements:
+            self.assertEqual(identity.load(customer_id).role, Role.CUSTOMER)
+        self.assertEqual(statements, [])
+
+    def test_invalidated_on_edit(self):
+        customer_id = self.add_user("customer").id
+        self.assertEqual(identity.load(customer_id).name, "customer")
+        db.session.get(User, customer_id).name = "Khách"
+        db.session.commit()
+        self.assertEqual(identity.load(customer_id).name, "customer")
+
+        identity.invalidate(customer_id)
+        self.assertEqual(identity.load(customer_id).name, "Khách")
+
+    def test_privileged_requests_skip_user_query(self):
+        with self.count_queries() as statements:
+            self.assertEqual(self.get("/api/admin/cache-stats").status_code, 200)
+        self.assertEqual(len(statements), 1)
+
+        db.session.remove()
+        with self.count_queries() as statements:
+            res = self.get("/api/admin/cache-stats")
+        self.assertEqual(statements, [])
+        self.assertGreaterEqual(res.json["users"]["hits"], 1)
+
+    def test_invalidation_broadcast_to_workers(self):
+        with mock.patch.object(events.bus, "publish") as publish:
+            identity.invalidate(self.admin_id)
+        publish.assert_called_once_with(events.IDENTITY, {"type": events.IDENTITY, "user_id": self.admin_id})
+
+        # Worker khác hạ quyền admin: sự kiện tới qua bus xóa danh tính trong cache của worker này
+        self.assertEqual(self.get("/api/admin/cache-stats").status_code, 200)
+        db.session.get(User, self.admin_id).role = Role.CUSTOMER
+        db.session.commit()
+        self.assertEqual(self.get("/api/admin/cache-stats").status_code, 200)
+        events.bus.deliver(events.IDENTITY, {"type": events.IDENTITY, "user_id": self.admin_id})
+        self.assertEqual(self.get("/api/admin/cache-stats").status_code, 403)
+
+    def test_unknown_user(self):
+        self.assertIsNone(identity.load(9999))
+        self.assertIsNone(identity.load("abc"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import io
+import os
+import tempfile
+import unittest
+from werkzeug.datastructures import FileStorage
+from app import app, db, dao, media
+from models import Cuisine, Role, User
+from base import DatabaseTestCase
+
+
+class FlakyStorage:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def save(self, data, filename):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("timeout")
+        return f"https://cdn.example.com/{filename}"
+
+
+def image(name="avatar.png"):
+    return FileStorage(stream=io.BytesIO(b"\x89PNG..."), filename=name)
+
+
+class TestMedia(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backoff = app.config["MEDIA_BACKOFF"]
+        app.config["MEDIA_BACKOFF"] = 0
+
+    def tearDown(self):
+        app.config["MEDIA_BACKOFF"] = self.backoff
+        super().tearDown()
+
+    def test_local_storage(self):
+        with tempfile.TemporaryDirectory() as root:
+            url = media.LocalStorage(root, "/static/uploads/").save(b"abc", "../../evil name.JPG")
+            self.assertTrue(url.startswith("/static/uploads/") and url.endswith(".jpg"))
+            with open(os.path.join(root, url.rsplit("/", 1)[1]), "rb") as f:
+                self.assertEqual(f.read(), b"abc")
+
+    def test_record_saved_then_updated_after_retries(self):
+        manager = self.add_user("manager", Role.MANAGER)
+        _, ct = self.add_restaurant(manager.id)
+        c = self.add_cuisine(ct.id, image=app.config["MEDIA_PLACEHOLDER"])
+        db.session.commit()
+
+        storage = FlakyStorage(failures=2)
+        url = media.upload_later(Cuisine, c.id, "image", image("bun.png"), backend=storage).result(timeout=5)
+        self.assertEqual((url, storage.calls), ("https://cdn.example.com/bun.png", 3))
+        db.session.remove()
+        self.assertEqual(db.session.get(Cuisine, c.id).image, url)
+
+    def test_failed_upload_keeps_placeholder(self):
+        user_id = dao.add_user("Khách", "khach", None, "khach@example.com", "0900000000")
+        default_avatar = db.session.get(User, user_id).avatar
+        future = media.upload_later(User, user_id, "avatar", image(),
+                                    backend=FlakyStorage(failures=app.config["MEDIA_RETRIES"] + 1))
+        with self.assertRaises(ConnectionError):
+            future.result(timeout=5)
+        db.session.remove()
+        self.assertEqual(db.session.get(User, user_id).avatar, default_avatar)
+
+    def test_placeholder_served_locally(self):
+        placeholder = app.config["MEDIA_PLACEHOLDER"]
+        self.assertTrue(placeholder.startswith("/static/"))
+        self.assertEqual(app.test_client().get(placeholder).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
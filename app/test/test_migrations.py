@@ -0,0 +1,64 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from sqlalchemy import text
+from app import db, migrations
+from models import SchemaVersion, Review, Role
+from base import DatabaseTestCase
+
+
+# DB dựng lại đúng schema của bản đã phát hành trước đó rồi chạy upgrade như khi triển khai
+class TestUpgradeFromOldSchema(DatabaseTestCase):
+    def mark_applied(self, *versions):
+        for version in versions:
+            db.session.add(SchemaVersion(version=version, description="old"))
+        db.session.commit()
+
+    def test_cart_totals_from_version_2(self):
+        manager = self.add_user("manager", Role.MANAGER)
+        _, ct = self.add_restaurant(manager.id)
+        cuisine = self.add_cuisine(ct.id, price=10000)
+        db.session.commit()
+
+        # Bảng cart trước migration 3/4: chưa có cột tổng và trạng thái
+        db.session.execute(text("DROP TABLE cart"))
+        db.session.execute(text("CREATE TABLE cart (id VARCHAR(36) PRIMARY KEY, receiver JSON, "
+                                "created_date DATETIME, updated_date DATETIME)"))
+        db.session.execute(text("INSERT INTO cart (id) VALUES ('cart-1')"))
+        db.session.execute(text("INSERT INTO cart_item (cart_id, cuisine_id, name, price, count, quantity) "
+                                "VALUES ('cart-1', :cuisine_id, 'Bún', 10000, 5, 3)"), {"cuisine_id": cuisine.id})
+        self.mark_applied(1, 2)
+
+        applied = [version for version, _ in migrations.upgrade()]
+        self.assertEqual(applied[0], 3)
+        self.assertEqual(db.session.execute(text("SELECT total_quantity, total_amount, status FROM cart")).one(),
+                         (3, 30000, "OPEN"))
+
+    def test_rating_summary_from_version_0(self):
+        manager = self.add_user("manager", Role.MANAGER)
+        customer = self.add_user("customer")
+        first, _ = self.add_restaurant(manager.id)
+        second, _ = self.add_restaurant(manager.id, "Phở")
+        for rate in (5, 2):
+            db.session.add(Review(content="ngon", rate=rate, user_id=customer.id, restaurant_id=first.id))
+        db.session.commit()
+
+        # Bảng tổng hợp trước migration 1: chưa có avg_rate, số liệu cũ bị lệch
+        db.session.execute(text("DROP TABLE restaurant_rating"))
+        db.session.execute(text("CREATE TABLE restaurant_rating (restaurant_id INTEGER PRIMARY KEY, "
+                                "count INTEGER NOT NULL, total INTEGER NOT NULL, star_1 INTEGER NOT NULL, "
+                                "star_2 INTEGER NOT NULL, star_3 INTEGER NOT NULL, star_4 INTEGER NOT NULL, "
+                                "star_5 INTEGER NOT NULL, created_date DATETIME, updated_date DATETIME)"))
+        db.session.execute(text("INSERT INTO restaurant_rating VALUES (:id, 9, 9, 0, 0, 0, 0, 0, NULL, NULL)"),
+                           {"id": first.id})
+        db.session.commit()
+
+        self.assertEqual([version for version, _ in migrations.upgrade()][0], 1)
+        rows = db.session.execute(text("SELECT restaurant_id, count, total, star_2, star_5, avg_rate "
+                                       "FROM restaurant_rating ORDER BY restaurant_id")).all()
+        self.assertEqual(rows, [(first.id, 2, 7, 1, 1, 3.5), (second.id, 0, 0, 0, 0, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import os
+import threading
+import time
+import unittest
+from app import app, momo
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
+from fake_momo import serve
+
+
+class TestMomoClient(unittest.TestCase):
+    def start(self, **kwargs):
+        server = serve(0, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}/v2/gateway/api/create"
+
+    def setUp(self):
+        app.config.update(MOMO_ACCESS_KEY="test", MOMO_SECRET_KEY="test", MOMO_RETURN_URL="http://localhost/")
+        self.ctx = app.app_context()
+        self.ctx.push()
+        self.addCleanup(self.ctx.pop)
+
+    def test_pay_url(self):
+        client = momo.MomoClient(self.start(latency=0))
+        self.assertTrue(client.get_payment_url("order-1", 10000).startswith("http://localhost/fake-momo/pay/"))
+
+    def test_timeout_bounded(self):
+        client = momo.MomoClient(self.start(hang_rate=1, hang=5), read_timeout=0.2, retries=1, backoff=0)
+        start = time.perf_counter()
+        with self.assertRaises(momo.MomoError):
+            client.get_payment_url("order-2", 10000)
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_gateway_errors(self):
+        client = momo.MomoClient(self.start(latency=0, fail_rate=1), retries=1, backoff=0)
+        with self.assertRaises(momo.MomoError):
+            client.get_payment_url("order-3", 10000)
+
+
+if __name__ == "__main__":
+    unittest.main()
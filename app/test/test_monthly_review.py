@@ -0,0 +1,50 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from datetime import datetime
+from app import db, dao
+from models import Restaurant, Review, MonthlyReview, Role
+from base import DatabaseTestCase
+
+
+class TestMonthlyReview(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer_id = self.add_user("customer").id
+        self.manager_id = self.add_user("manager", Role.MANAGER).id
+        self.restaurant_ids = []
+        for name in ["Bún Bò Huế", "Phở"]:
+            r = Restaurant(name=name, user_id=self.manager_id)
+            db.session.add(r)
+            db.session.flush()
+            dao.ensure_rating_summary(r.id)
+            self.restaurant_ids.append(r.id)
+        db.session.commit()
+
+    def test_rollup_matches_rebuild(self):
+        first, second = self.restaurant_ids
+        dao.add_review(first, 5, "Ngon", self.customer_id)
+        dao.add_review(first, 3, "Tạm", self.customer_id)
+        dao.add_review(second, 4, "Ổn", self.customer_id)
+        # Đánh giá cũ chỉ có trong bảng Review: phải thêm qua lần tính lại
+        db.session.add(Review(content="Cũ", rate=1, user_id=self.customer_id, restaurant_id=first,
+                              created_date=datetime(2024, 1, 15)))
+        db.session.commit()
+
+        month = datetime.now().date().replace(day=1)
+        m = db.session.get(MonthlyReview, (first, month))
+        self.assertEqual((m.count, m.total, m.star_5, m.star_3), (2, 8, 1, 1))
+
+        self.assertEqual(dao.rebuild_monthly_review(), 3)
+        rows = dao.get_review(self.manager_id)
+        self.assertEqual([(r.month, round(r.avg_rate, 2)) for r in rows],
+                         [(datetime(2024, 1, 1).date(), 1), (month, 4)])
+
+        dao.update_review_rollups(first, datetime(2024, 1, 15), 1, delta=-1)
+        db.session.commit()
+        self.assertEqual([r.month for r in dao.get_review(self.manager_id)], [month])
+
+
+if __name__ == "__main__":
+    unittest.main()
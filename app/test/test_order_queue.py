@@ -0,0 +1,62 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from datetime import datetime, timedelta
+from flask import g
+from app import app, db, dao, identity, index
+from models import Order, OrderDetail, Payment, OrderStatus, PaymentStatus, Role
+from base import DatabaseTestCase
+
+
+class TestOrderQueue(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        identity.identities.clear()
+        customer = self.add_user("customer")
+        manager = self.add_user("manager", Role.MANAGER)
+        self.manager_id = manager.id
+        r, ct = self.add_restaurant(manager.id)
+        cuisine = self.add_cuisine(ct.id)
+
+        self.start = datetime(2024, 5, 1, 12)
+        statuses = [OrderStatus.NEWORDER, OrderStatus.PROCESSING, OrderStatus.COMPLETE]
+        for i in range(9):
+            o = Order(user_id=customer.id, restaurant_id=r.id, status=statuses[i % 3], receiver_name="a",
+                      receiver_phone="1", receiver_address="HCM", created_date=self.start + timedelta(days=i))
+            db.session.add(o)
+            db.session.flush()
+            db.session.add(OrderDetail(order_id=o.id, cuisine_id=cuisine.id, restaurant_id=r.id))
+            db.session.add(Payment(order_id=o.id, total=10000, status=PaymentStatus.PAID, payment_ref=f"ref-{i}"))
+        db.session.commit()
+
+    def test_defaults_to_open_orders_newest_first(self):
+        orders, next_cursor = dao.get_order(self.manager_id, page_size=4)
+        self.assertEqual([o.status for o in orders], [OrderStatus.PROCESSING, OrderStatus.NEWORDER] * 2)
+        self.assertEqual(orders[0].created_date, self.start + timedelta(days=7))
+
+        rest, last_cursor = dao.get_order(self.manager_id, cursor=next_cursor, page_size=4)
+        self.assertEqual(len(rest), 2)
+        self.assertIsNone(last_cursor)
+        self.assertFalse({o.id for o in orders} & {o.id for o in rest})
+
+    def test_status_and_date_filters(self):
+        orders, _ = dao.get_order(self.manager_id, statuses=[OrderStatus.COMPLETE],
+                                  from_date=self.start.replace(hour=0) + timedelta(days=3),
+                                  to_date=self.start.replace(hour=0) + timedelta(days=5))
+        self.assertEqual([o.created_date.day for o in orders], [6])
+
+    def test_json_variant(self):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s["_user_id"] = str(self.manager_id)
+            s["_fresh"] = True
+        g.pop("_login_user", None)
+        res = client.get("/api/manager/orders?status=COMPLETE&status=BOGUS")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({o["status"] for o in res.json["orders"]}, {"COMPLETE"})
+        self.assertEqual(len(res.json["orders"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
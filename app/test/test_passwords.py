@@ -0,0 +1,121 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import hashlib
+import threading
+import time
+import unittest
+from unittest import mock
+from flask import g
+from app import app, db, dao, passwords, index, migrations
+from models import User
+from base import DatabaseTestCase
+
+
+class TestPasswords(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        app.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:1000"
+
+    def tearDown(self):
+        app.config["PASSWORD_HASH_METHOD"] = self.method
+        super().tearDown()
+
+    def test_md5_rehashed_on_login(self):
+        u = self.add_user("legacy")
+        u.password = hashlib.md5("123456".encode("utf-8")).hexdigest()
+        db.session.commit()
+
+        self.assertIsNone(dao.auth_user("legacy", "wrong"))
+        self.assertTrue(passwords.is_legacy(db.session.get(User, u.id).password))
+        self.assertEqual(dao.auth_user("legacy", "123456").id, u.id)
+        stored = db.session.get(User, u.id).password
+        self.assertTrue(stored.startswith("pbkdf2:sha256:1000$"))
+        self.assertEqual(dao.auth_user("legacy", "123456").password, stored)
+
+    def test_new_users_and_passwordless(self):
+        dao.add_user(name="A", username="a", password="secret", email="a@x.com", phone="0900000001")
+        dao.add_user(name="G", username="g@x.com", password=None, email="g@x.com", phone="0900000002")
+        self.assertIsNotNone(dao.auth_user("a", "secret"))
+        self.assertEqual(db.session.query(User.password).filter_by(username="g@x.com").scalar(),
+                         passwords.UNUSABLE_PASSWORD)
+        for attempt in ("", "!", "123456"):
+            self.assertIsNone(dao.auth_user("g@x.com", attempt))
+        self.assertIsNone(dao.auth_user("nobody", "secret"))
+
+    def test_busy_slot_held_until_hash_finishes(self):
+        passwords._pool()
+        slots, timeout = passwords._slots, app.config["PASSWORD_HASH_TIMEOUT"]
+        passwords._slots = threading.BoundedSemaphore(1)
+        app.config["PASSWORD_HASH_TIMEOUT"] = 0.05
+        done = threading.Event()
+        try:
+            with self.assertRaises(passwords.PasswordBusy):
+                passwords._run(done.wait)
+            # Phép băm trước còn chạy: hết slot, báo bận ngay không chờ
+            started = time.monotonic()
+            with self.assertRaises(passwords.PasswordBusy):
+                passwords._run(lambda: 1)
+            self.assertLess(time.monotonic() - started, 0.05)
+
+            done.set()
+            for _ in range(100):
+                if passwords._slots.acquire(blocking=False):
+                    passwords._slots.release()
+                    break
+                time.sleep(0.01)
+            self.assertEqual(passwords._run(lambda: 1), 1)
+        finally:
+            done.set()
+            passwords._slots = slots
+            app.config["PASSWORD_HASH_TIMEOUT"] = timeout
+
+
+class TestGoogleLogin(DatabaseTestCase):
+    def login(self, **user_info):
+        info = {"name": "Google", "email": "g@x.com", "email_verified": True, **user_info}
+        google = mock.MagicMock()
+        google.get.return_value.json.return_value = info
+        g.pop("_login_user", None)
+        client = app.test_client()
+        with mock.patch.object(index, "google", google):
+            res = client.get("/auth")
+        with client.session_transaction() as s:
+            return res, s.get("_user_id")
+
+    def test_creates_and_reuses_google_account(self):
+        res, user_id = self.login()
+        self.assertEqual(res.location, "/")
+        u = dao.get_user_by_email("g@x.com")
+        self.assertEqual((user_id, u.password), (str(u.id), passwords.UNUSABLE_PASSWORD))
+        self.assertEqual(self.login()[1], str(u.id))
+
+    def test_unverified_email_rejected(self):
+        res, user_id = self.login(email_verified=False)
+        self.assertEqual((res.location, user_id), ("/login", None))
+        self.assertIsNone(dao.get_user_by_email("g@x.com"))
+
+    def test_password_account_not_linked(self):
+        dao.add_user(name="A", username="a", password="secret", email="g@x.com", phone="0900000001")
+        res, user_id = self.login()
+        self.assertEqual((res.location, user_id), ("/login", None))
+
+    def test_legacy_google_account_migrated(self):
+        # Tài khoản do đăng nhập Google cũ tạo: mật khẩu MD5 của "123456", username là email
+        u = self.add_user("g@x.com")
+        u.email = "g@x.com"
+        u.password = hashlib.md5("123456".encode("utf-8")).hexdigest()
+        db.session.commit()
+        self.assertEqual(self.login()[1], None)
+
+        migrations.disable_legacy_google_passwords()
+        db.session.commit()
+        self.assertIsNone(dao.auth_user("g@x.com", "123456"))
+        self.assertEqual(db.session.get(User, u.id).password, passwords.UNUSABLE_PASSWORD)
+        res, user_id = self.login()
+        self.assertEqual((res.location, user_id), ("/", str(u.id)))
+
+
+if __name__ == "__main__":
+    unittest.main()
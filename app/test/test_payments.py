@@ -0,0 +1,156 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from flask import g
+from app import app, db, cart_store, payments, reservation, momo, index
+from app.vnpay import canonical_query, signer
+from models import Cuisine, Payment, Order, FoodType, Role
+from base import DatabaseTestCase, RECEIVER
+
+SECRET = "IPNSECRET"
+
+
+class TestPaymentFinalization(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        app.config["VNPAY_HASH_SECRET_KEY"] = SECRET
+        self.client = app.test_client()
+        customer = self.add_user("customer")
+        manager = self.add_user("manager", Role.MANAGER)
+        _, ct = self.add_restaurant(manager.id)
+        cuisine = self.add_cuisine(ct.id, "Bún bò", 40000, 3, food_type=FoodType.MAIN)
+        db.session.commit()
+        self.cuisine_id, self.customer_id = cuisine.id, customer.id
+
+    def pending_cart(self, quantity=2):
+        order_id = cart_store.store.create()
+        cart_store.store.add_item(order_id, self.cuisine_id, {"name": "Bún bò", "price": 40000, "count": 3})
+        cart_store.store.update_item(order_id, self.cuisine_id, quantity=quantity)
+        cart_store.store.checkout(order_id, RECEIVER, self.customer_id)
+        return order_id
+
+    def ipn(self, order_id, amount, secret=SECRET):
+        params = {"vnp_TxnRef": order_id, "vnp_Amount": str(int(amount * 100)), "vnp_ResponseCode": "00",
+                  "vnp_TransactionStatus": "00"}
+        params["vnp_SecureHash"] = signer(secret).sign(canonical_query(params))
+        res = self.client.get("/vnpay_ipn", query_string=params)
+        future = payments._inflight.get(order_id)
+        if future:
+            future.result(timeout=10)
+        return res.json["RspCode"]
+
+    def login(self):
+        with self.client.session_transaction() as s:
+            s["_user_id"] = str(self.customer_id)
+            s["_fresh"] = True
+        g.pop("_login_user", None)
+
+    def vnpay_return(self, order_id, amount, code="00"):
+        params = {"vnp_TxnRef": order_id, "vnp_Amount": str(int(amount * 100)), "vnp_ResponseCode": code}
+        params["vnp_SecureHash"] = signer(SECRET).sign(canonical_query(params))
+        res = self.client.get("/vnpay_payment_return", query_string=params)
+        future = payments._inflight.get(order_id)
+        if future:
+            future.result(timeout=10)
+        return res
+
+    def test_finalize_idempotent(self):
+        order_id = self.pending_cart()
+        self.assertEqual(payments.status(order_id), payments.PENDING)
+        self.assertEqual(payments.finalize(order_id), payments.DONE)
+        self.assertEqual(payments.finalize(order_id), payments.DONE)
+        self.assertEqual(Payment.query.filter_by(payment_ref=order_id).count(), 1)
+        self.assertEqual(Order.query.count(), 1)
+        self.assertIsNone(cart_store.store.get(order_id))
+
+    def test_replayed_return_is_one_cached_read(self):
+        order_id = self.pending_cart()
+        futures = {payments.submit(order_id) for _ in range(5)}
+        for f in futures:
+            self.assertEqual(f.result(timeout=10), payments.DONE)
+        self.assertEqual(Order.query.count(), 1)
+
+        payments.paid_orders.clear()
+        db.session.remove()
+        with self.count_queries() as statements:
+            self.assertEqual(payments.status(order_id), payments.DONE)
+        self.assertEqual(len(statements), 1)
+        with self.count_queries() as statements:
+            for _ in range(3):
+                self.assertEqual(payments.status(order_id), payments.DONE)
+        self.assertEqual(statements, [])
+
+    def test_ipn_creates_order_once(self):
+        order_id = self.pending_cart()
+        self.assertEqual(self.ipn(order_id, 80000, secret="WRONG"), "97")
+        self.assertEqual(self.ipn(order_id, 1000), "04")
+        self.assertEqual(self.ipn(order_id, 80000), "00")
+        self.assertEqual(self.ipn(order_id, 80000), "02")
+        self.assertEqual(self.ipn("unknown", 80000), "01")
+        db.session.remove()
+        self.assertEqual(payments.status(order_id), payments.DONE)
+        self.assertEqual(db.session.get(Cuisine, self.cuisine_id).count, 1)
+
+    def test_out_of_stock_marked_failed(self):
+        order_id = self.pending_cart(quantity=5)
+        self.assertEqual(payments.finalize(order_id), payments.FAILED)
+        self.assertEqual(payments.status(order_id), payments.FAILED)
+        self.assertEqual(len(cart_store.store.get(order_id)["errors"]), 1)
+
+    def test_cart_locked_after_checkout(self):
+        app.config.update(VNPAY_PAYMENT_URL="https://sandbox.vnpay.vn/pay", VNPAY_TMN_CODE="TMN")
+        self.login()
+        item = {"id": self.cuisine_id, "name": "Bún bò", "price": 40000, "count": 3}
+        self.client.post("/api/carts", json=item)
+        with self.client.session_transaction() as s:
+            order_id = s["cart_id"]
+
+        res = self.client.post("/payment", data={"pay": "vnpay", "person": "batman", "phone": "0912345678",
+                                                 "address": "HCM"})
+        self.assertEqual(res.status_code, 302)
+        with self.client.session_transaction() as s:
+            self.assertNotIn("cart_id", s)
+        with self.assertRaises(cart_store.CartLockedError):
+            cart_store.store.add_item(order_id, self.cuisine_id, item)
+
+        # Thêm món sau khi sang cổng thanh toán: vào giỏ mới, đơn đã trả 40.000 vẫn chỉ có 1 món
+        for _ in range(4):
+            self.client.post("/api/carts", json=item)
+        self.assertEqual(cart_store.store.totals(order_id)["total_amount"], 40000)
+
+        self.vnpay_return(order_id, 40000)
+        db.session.remove()
+        self.assertEqual(payments.status(order_id), payments.DONE)
+        self.assertEqual(db.session.get(Cuisine, self.cuisine_id).count, 2)
+
+    def test_amount_must_match_cart(self):
+        order_id = self.pending_cart()
+        self.assertEqual(payments.finalize(order_id, amount=40000), payments.FAILED)
+        self.assertEqual(cart_store.store.get(order_id)["errors"], [payments.AMOUNT_MISMATCH])
+        self.assertEqual(Order.query.count(), 0)
+
+    def test_cancel_reopens_cart(self):
+        self.login()
+        order_id = self.pending_cart()
+        self.vnpay_return(order_id, 80000, code="24")
+        with self.client.session_transaction() as s:
+            self.assertEqual(s["cart_id"], order_id)
+        self.assertEqual(cart_store.store.get(order_id)["status"], cart_store.OPEN)
+
+    def test_momo_return_needs_signature_to_release(self):
+        app.config.update(MOMO_ACCESS_KEY="ACCESS", MOMO_SECRET_KEY="MOMOSECRET")
+        order_id = self.pending_cart()
+        reservation.hold(order_id, list(cart_store.store.get(order_id)["items"].values()))
+        data = {"orderId": order_id, "amount": "80000", "resultCode": "1006", "partnerCode": "MOMO"}
+
+        self.client.get("/momo_payment_return", query_string={**data, "signature": "forged"})
+        self.assertEqual(reservation.held_quantities([self.cuisine_id]), {self.cuisine_id: 2})
+
+        data["signature"] = momo.sign({**data, "accessKey": "ACCESS"}, "MOMOSECRET", momo.RESULT_SIGNATURE_FIELDS)
+        self.client.get("/momo_payment_return", query_string=data)
+        self.assertEqual(reservation.held_quantities([self.cuisine_id]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from datetime import date, timedelta
+from app import db, dao, identity, payments, reservation, cart_store
+from models import OrderDetail, FoodType, Role
+from base import DatabaseTestCase, RECEIVER
+
+
+# Dòng kế hoạch bị coi là quét toàn bảng, theo từng loại DB
+def full_scans(statement, parameters):
+    conn = db.session.connection()
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        # "SCAN t" (không kèm chỉ mục) là đọc hết bảng; "SCAN t USING INDEX" vẫn là đọc hết chỉ mục
+        return [row[-1] for row in plan if row[-1].startswith("SCAN ") and "CONSTANT ROW" not in row[-1]]
+    if dialect == "mysql":
+        rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+        return [f"{r['table']} ({r['type']})" for r in rows if r["type"] in ("ALL", "index")]
+    raise unittest.SkipTest(f"Chưa hỗ trợ EXPLAIN cho {dialect}")
+
+
+class TestQueryPlans(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        customer = self.add_user("customer")
+        self.customer_id = customer.id
+        self.manager_id = self.add_user("manager", Role.MANAGER).id
+        other_manager = self.add_user("other", Role.MANAGER)
+
+        self.restaurant_ids, cuisine_ids = [], []
+        for i in range(3):
+            r, ct = self.add_restaurant(self.manager_id if i < 2 else other_manager.id, f"Nhà hàng {i}",
+                                        type="Bún" if i % 2 else "Phở", location="HCM")
+            dao.ensure_rating_summary(r.id)
+            for j in range(3):
+                cuisine_ids.append(self.add_cuisine(ct.id, f"Món {i}-{j}", 10000, 50, food_type=FoodType.MAIN).id)
+            self.restaurant_ids.append(r.id)
+        db.session.commit()
+
+        for n, cuisine_id in enumerate(cuisine_ids):
+            dao.add_order(self.customer_id, [{"id": str(cuisine_id), "quantity": 1}], RECEIVER, f"ref-{n}")
+        for restaurant_id in self.restaurant_ids:
+            dao.add_review(restaurant_id, 4, "ngon", self.customer_id)
+        self.cuisine_ids = cuisine_ids
+        self.order_detail_id = db.session.query(OrderDetail.id).first()[0]
+        self.cart_id = cart_store.store.create()
+        identity.identities.clear()
+        payments.paid_orders.clear()
+        db.session.remove()
+
+    def test_hot_queries_use_indexes(self):
+        restaurant_id = self.restaurant_ids[0]
+        today = date.today()
+        hot_queries = {
+            "get_restaurants type": lambda: dao.get_restaurants(type_filter="Bún"),
+            "get_restaurants location": lambda: dao.get_restaurants(location="HCM", cursor=None),
+            "get_restaurants cuisine type": lambda: dao.get_restaurants(cuisine_type_id=1),
+            "get_restaurant_with_rating": lambda: dao.get_restaurant_with_rating(restaurant_id),
+            "get_menu": lambda: dao.get_menu(restaurant_id),
+            "get_reviews": lambda: dao.get_reviews(restaurant_id),
+            "get_reviews star": lambda: dao.get_reviews(restaurant_id, star=4),
+            "get_order": lambda: dao.get_order(self.manager_id),
+            "get_order_detail": lambda: dao.get_order_detail(1),
+            "get_order_history": lambda: dao.get_order_history(self.customer_id),
+            "get_cuisine": lambda: dao.get_cuisine(self.manager_id),
+            "get_cuisine_type": lambda: dao.get_cuisine_type(restaurant_id),
+            "get_review": lambda: dao.get_review(self.manager_id),
+            "get_daily_revenue": lambda: dao.get_daily_revenue(restaurant_id, today - timedelta(days=6), today),
+            "get_restaurant": lambda: dao.get_restaurant(self.order_detail_id),
+            "get_restaurant_ids": lambda: dao.get_restaurant_ids(self.manager_id),
+            "get_rating_summary_by_owner": lambda: dao.get_rating_summary_by_owner(self.manager_id),
+            "load_cart_cuisines": lambda: dao.load_cart_cuisines([{"id": str(c), "quantity": 1}
+                                                                  for c in self.cuisine_ids[:3]]),
+            "cuisine_restaurants": lambda: dao.cuisine_restaurants(self.cuisine_ids[:3]),
+            "held_quantities": lambda: reservation.held_quantities(self.cuisine_ids[:3]),
+            "paid_order_id": lambda: payments.paid_order_id("ref-1"),
+            "identity.load": lambda: identity.load(self.customer_id),
+            "cart get": lambda: cart_store.store.get(self.cart_id),
+        }
+
+        problems = []
+        for name, call in hot_queries.items():
+            with self.count_queries(parameters=True) as statements:
+                call()
+            statements = [(s, p) for s, p in statements if s.lstrip().upper().startswith("SELECT")]
+            self.assertTrue(statements, name)
+            for statement, parameters in statements:
+                scans = full_scans(statement, parameters)
+                if scans:
+                    problems.append(f"{name}: {', '.join(scans)}\n    {' '.join(statement.split())}")
+            db.session.remove()
+        self.assertEqual(problems, [], "\n" + "\n".join(problems))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from app import app, db, dao, admin, index
+from models import Restaurant, Review, RestaurantRating, Role
+from base import DatabaseTestCase
+
+
+def summary(restaurant_id):
+    db.session.expire_all()
+    r = db.session.get(RestaurantRating, restaurant_id)
+    return r and (r.count, r.total, r.star_1, r.star_3, r.star_5, round(r.avg_rate, 2))
+
+
+class TestRatingSummary(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer_id = self.add_user("customer").id
+        manager_id = self.add_user("manager", Role.MANAGER).id
+        self.restaurant_ids = []
+        for name in ["Bún Bò Huế", "Phở"]:
+            r = Restaurant(name=name, user_id=manager_id)
+            db.session.add(r)
+            db.session.flush()
+            self.restaurant_ids.append(r.id)
+        db.session.commit()
+        self.view = next(v for v in admin.admin._views if isinstance(v, admin.ReviewAdminView))
+
+    def test_insert_without_summary_row(self):
+        first, _ = self.restaurant_ids
+        # Chưa có dòng tổng hợp: upsert tạo dòng, lần sau cộng dồn
+        dao.update_rating_summary(first, 5)
+        dao.update_rating_summary(first, 3)
+        db.session.commit()
+        self.assertEqual(summary(first), (2, 8, 0, 1, 1, 4))
+
+        dao.add_review(first, 1, "Dở", self.customer_id)
+        self.assertEqual(summary(first), (3, 9, 1, 1, 1, 3))
+
+    def test_admin_edit_and_delete(self):
+        first, second = self.restaurant_ids
+        dao.add_review(first, 5, "Ngon", self.customer_id)
+        dao.add_review(first, 3, "Tạm", self.customer_id)
+        review = Review.query.filter(Review.rate == 5).one()
+        other = db.session.get(Restaurant, second)
+
+        # Như form admin: gán giá trị mới rồi gọi hook trước khi flush.
+        # Đổi số sao và nhà hàng: trừ ở nhà hàng cũ, cộng ở nhà hàng mới
+        review.rate = 1
+        review.restaurant = other
+        self.view.on_model_change(None, review, False)
+        db.session.commit()
+        self.assertEqual(summary(first), (1, 3, 0, 1, 0, 3))
+        self.assertEqual(summary(second), (1, 1, 1, 0, 0, 1))
+
+        review = db.session.get(Review, review.id)
+        self.view.on_model_delete(review)
+        db.session.delete(review)
+        db.session.commit()
+        self.assertEqual(summary(second), (0, 0, 0, 0, 0, 0))
+
+        review = Review(content="Mới", rate=5, user_id=self.customer_id, restaurant_id=second)
+        db.session.add(review)
+        db.session.flush()
+        self.view.on_model_change(None, review, True)
+        db.session.commit()
+        self.assertEqual(summary(second), (1, 5, 0, 0, 1, 5))
+
+    def test_rebuild_command(self):
+        first, second = self.restaurant_ids
+        dao.add_review(first, 5, "Ngon", self.customer_id)
+        # Đánh giá thêm thẳng vào bảng Review: bảng tổng hợp lệch cho tới khi tính lại
+        db.session.add(Review(content="Cũ", rate=3, user_id=self.customer_id, restaurant_id=first))
+        db.session.query(RestaurantRating).filter(RestaurantRating.restaurant_id == first) \
+            .update({RestaurantRating.total: 100})
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(index.rebuild_ratings)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(summary(first), (2, 8, 0, 1, 1, 4))
+        self.assertEqual(summary(second), (0, 0, 0, 0, 0, 0))
+
+    def test_owner_summary_spans_restaurants(self):
+        first, second = self.restaurant_ids
+        dao.add_review(first, 5, "Ngon", self.customer_id)
+        dao.add_review(first, 4, "Được", self.customer_id)
+        dao.add_review(second, 1, "Dở", self.customer_id)
+        manager_id = db.session.get(Restaurant, first).user_id
+
+        rating = dao.get_rating_summary_by_owner(manager_id)
+        self.assertEqual((rating.count, rating.total, rating.histogram, rating.average),
+                         (3, 10, [1, 0, 0, 1, 1], 3.3))
+        self.assertEqual(dao.get_rating_summary_by_owner(self.customer_id).count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
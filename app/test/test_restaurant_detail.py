@@ -0,0 +1,114 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from app import app, db, dao, index, search
+from models import Restaurant, CuisineType, Cuisine, Review, FoodType, BeverageType, Role
+from base import DatabaseTestCase
+
+
+class TestRestaurantDetail(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = app.test_client()
+        self.manager = self.add_user("manager", Role.MANAGER)
+        self.restaurant = Restaurant(name="Bún Bò Huế", user_id=self.manager.id)
+        db.session.add(self.restaurant)
+        db.session.commit()
+        self.restaurant_id = self.restaurant.id
+
+    def add_menu(self, categories, dishes_per_category, reviews):
+        for i in range(categories):
+            ct = CuisineType(name=f"Loại {i}", restaurant_id=self.restaurant_id)
+            db.session.add(ct)
+            db.session.flush()
+            for j in range(dishes_per_category):
+                if j % 2:
+                    db.session.add(Cuisine(name=f"Trà {i}-{j}", price=10000, cuisine_type_id=ct.id,
+                                           beverage_type=BeverageType.JUICE, count=5))
+                else:
+                    db.session.add(Cuisine(name=f"Bún {i}-{j}", price=40000, cuisine_type_id=ct.id,
+                                           food_type=FoodType.MAIN, count=5))
+        for i in range(reviews):
+            u = self.add_user(f"reviewer{db.session.query(Review).count()}")
+            dao.add_review(self.restaurant_id, i % 5 + 1, "ngon", u.id)
+        db.session.commit()
+        search.catalog.invalidate()
+
+    def render_query_count(self, url):
+        # Dựng chỉ mục tìm kiếm trước, không tính vào số truy vấn của trang
+        search.catalog.rebuild()
+        db.session.remove()
+        with self.count_queries() as statements:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(statements)
+
+    def test_query_count_constant(self):
+        url = f"/restaurant/{self.restaurant_id}"
+        self.add_menu(1, 2, 1)
+        small = self.render_query_count(url)
+        self.add_menu(10, 10, 30)
+        large = self.render_query_count(url)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 4)
+
+    def test_filters_in_sql(self):
+        self.add_menu(2, 4, 0)
+        foods, beverages = dao.get_menu(self.restaurant_id, food_type="MAIN")
+        self.assertEqual(len(foods), 4)
+        self.assertEqual(len(beverages), 4)
+
+        foods, beverages = dao.get_menu(self.restaurant_id, keyword="tra")
+        self.assertEqual(foods, [])
+        self.assertEqual(len(beverages), 4)
+
+        foods, beverages = dao.get_menu(self.restaurant_id, food_type="UNKNOWN", beverage_type="COFFEE")
+        self.assertEqual((foods, beverages), ([], []))
+
+    def test_review_feed_pages(self):
+        self.add_menu(0, 0, 12)
+        seen, cursor = [], None
+        while True:
+            res = self.client.get(f"/api/restaurants/{self.restaurant_id}/reviews",
+                                  query_string={"cursor": cursor} if cursor else {})
+            seen += [r["id"] for r in res.json["reviews"]]
+            cursor = res.json["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(set(seen)))
+        self.assertEqual(len(seen), 12)
+
+        res = self.client.get(f"/api/restaurants/{self.restaurant_id}/reviews?star=5")
+        self.assertTrue(all(r["rate"] == 5 for r in res.json["reviews"]))
+        self.assertEqual(len(res.json["reviews"]), 2)
+
+    def test_review_date_required(self):
+        # Form admin để trống ngày: lấy giờ hiện tại, con trỏ và API của feed không gặp review.date = None
+        user = self.add_user("reviewer")
+        review = Review(content="ngon", rate=5, user_id=user.id, restaurant_id=self.restaurant_id, date=None)
+        db.session.add(review)
+        db.session.commit()
+        self.assertIsNotNone(review.date)
+        self.assertFalse(Review.__table__.c.date.nullable)
+
+    def test_home_cache_holds_plain_data(self):
+        index.home_cache.clear()
+        first = self.client.get("/api/restaurants").json
+        with app.test_request_context("/api/restaurants"):
+            cached = index.load_restaurant_page(index.home_filters())
+        self.assertIsInstance(cached['restaurants'][0], dict)
+
+        # Lần sau lấy từ cache sau khi session đã đóng: không chạm DB, không lỗi DetachedInstanceError
+        db.session.remove()
+        with self.count_queries() as statements:
+            again = self.client.get("/api/restaurants").json
+        self.assertEqual(again, first)
+        self.assertEqual(statements, [])
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get("/restaurant/9999").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
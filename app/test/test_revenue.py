@@ -0,0 +1,49 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import unittest
+from datetime import date, timedelta
+from app import db, dao
+from models import Cuisine, DailyRevenue, Role
+from base import DatabaseTestCase, RECEIVER
+
+
+class TestDailyRevenue(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer_id = self.add_user("customer").id
+        manager = self.add_user("manager", Role.MANAGER)
+        self.restaurant_ids, self.cuisine_ids = [], []
+        for name, price in [("Bún Bò Huế", 45000), ("Phở", 50000)]:
+            r, ct = self.add_restaurant(manager.id, name)
+            c = self.add_cuisine(ct.id, name, price, 10)
+            self.restaurant_ids.append(r.id)
+            self.cuisine_ids.append(c.id)
+        db.session.commit()
+
+    def rows(self):
+        return sorted((r.restaurant_id, r.revenue, r.order_count) for r in DailyRevenue.query.all())
+
+    def test_rollup_maintained_and_rebuilt(self):
+        bun, pho = self.cuisine_ids
+        dao.add_order(self.customer_id, [{"id": str(bun), "quantity": 2}], RECEIVER, "ref-1")
+        dao.add_order(self.customer_id, [{"id": str(bun), "quantity": 1}, {"id": str(pho), "quantity": 1}],
+                      RECEIVER, "ref-2")
+        expected = [(self.restaurant_ids[0], 135000, 2), (self.restaurant_ids[1], 50000, 1)]
+        self.assertEqual(self.rows(), expected)
+
+        # Giá đổi sau khi đặt không làm đổi doanh thu đã ghi
+        db.session.get(Cuisine, bun).price = 1
+        db.session.commit()
+        self.assertEqual(dao.rebuild_daily_revenue(), 2)
+        self.assertEqual(self.rows(), expected)
+
+        today = date.today()
+        stats = dao.get_daily_revenue(self.restaurant_ids[0], today - timedelta(days=6), today)
+        self.assertEqual([(s.date, s.revenue) for s in stats], [(today, 135000)])
+        self.assertEqual(dao.get_daily_revenue(self.restaurant_ids[0], today + timedelta(days=1),
+                                               today + timedelta(days=7)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import os
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import app, db, dao, routing, payments, index
+from models import Restaurant, Role, User
+from base import DatabaseTestCase
+
+
+# Hai DB SQLite cục bộ: DB thử nghiệm làm primary, một file tạm làm replica (cùng schema, dữ liệu khác)
+class TestReplicaRouting(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        manager = self.add_user("manager", Role.MANAGER)
+        db.session.add(Restaurant(name="primary", user_id=manager.id))
+        db.session.commit()
+
+        fd, self.replica_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.replica = create_engine(f"sqlite:///{self.replica_path}")
+        db.metadata.create_all(self.replica)
+        with Session(self.replica) as s:
+            s.add(User(id=manager.id, name="m", username="m", password="x", email="m@x", phone="1"))
+            s.add(Restaurant(name="replica", user_id=manager.id))
+            s.commit()
+        db.engines["replica_test"] = self.replica
+        db.session.remove()
+
+    def tearDown(self):
+        db.engines.pop("replica_test", None)
+        self.replica.dispose()
+        os.remove(self.replica_path)
+        super().tearDown()
+
+    def names(self):
+        return [r.name for r in dao.get_restaurants()[0]]
+
+    def test_reads_go_to_replica_writes_to_primary(self):
+        self.assertEqual(self.names(), ["replica"])
+        self.assertEqual([r.name for r in Restaurant.query.all()], ["primary"])
+
+    def test_read_your_writes_in_session(self):
+        self.assertEqual(self.names(), ["replica"])
+        db.session.get(Restaurant, 1).type = "Bún"
+        db.session.commit()
+        self.assertEqual(self.names(), ["primary"])
+
+        db.session.remove()
+        self.assertEqual(self.names(), ["replica"])
+
+    def test_sticky_after_checkout(self):
+        # IPN đã tạo đơn ở request khác: trang trả về phải giữ người mua trên primary
+        payments.paid_orders.set("ref-1", 1)
+        try:
+            with app.test_request_context():
+                self.assertEqual(self.names(), ["replica"])
+                state, _ = index.finish_checkout("ref-1", 10000)
+                self.assertEqual(state, payments.DONE)
+                db.session.remove()
+                self.assertEqual(self.names(), ["primary"])
+        finally:
+            payments.paid_orders.clear()
+
+        db.session.remove()
+        with app.test_request_context():
+            self.assertEqual(self.names(), ["replica"])
+
+    def test_replica_binds_from_env(self):
+        self.assertEqual(routing.replica_binds("mysql://a/x, mysql://b/x,"),
+                         {"replica_0": "mysql://a/x", "replica_1": "mysql://b/x"})
+
+
+if __name__ == "__main__":
+    unittest.main()
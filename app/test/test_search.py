@@ -0,0 +1,112 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from sqlalchemy import event
+from app import db, dao, search
+from models import Restaurant, Review, Role
+from base import DatabaseTestCase
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.index = search.InvertedIndex()
+        self.index.add(1, [("Bún Bò Huế", search.NAME_WEIGHT), ("Đặc sản Huế", search.TEXT_WEIGHT)])
+        self.index.add(2, [("Cơm Tấm Ba Ghiền", search.NAME_WEIGHT), ("Có bún", search.TEXT_WEIGHT)])
+        self.index.add(3, [("Đậu hũ", search.NAME_WEIGHT)])
+
+    def test_fold(self):
+        self.assertEqual(search.fold("Bún Bò Đặc Biệt"), "bun bo dac biet")
+
+    def test_accent_insensitive(self):
+        self.assertEqual([d for d, _ in self.index.search("bun bo")], [1])
+        self.assertEqual([d for d, _ in self.index.search("dau")], [3])
+
+    def test_rank_name_above_description(self):
+        self.assertEqual([d for d, _ in self.index.search("bún")], [1, 2])
+
+    def test_prefix_last_token(self):
+        self.assertEqual([d for d, _ in self.index.search("com t")], [2])
+
+    def test_remove(self):
+        self.index.remove(1)
+        self.assertEqual([d for d, _ in self.index.search("bun")], [2])
+        self.assertNotIn("hue", self.index.postings)
+
+
+class CountingCatalog(search.CatalogSearch):
+    def __init__(self):
+        super().__init__(rebuild_interval=60)
+        self.builds = 0
+
+    def rebuild(self):
+        with self._build_lock:
+            self.builds += 1
+            time.sleep(0.05)
+            self._built_at = time.monotonic()
+
+
+class TestCatalog(DatabaseTestCase):
+    def test_concurrent_requests_rebuild_once(self):
+        catalog = CountingCatalog()
+        threads = [threading.Thread(target=catalog._ensure_built) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(catalog.builds, 1)
+
+    def test_update_during_rebuild_is_kept(self):
+        manager = self.add_user("manager", Role.MANAGER)
+        db.session.add(Restaurant(name="Bún Bò Huế", user_id=manager.id))
+        db.session.commit()
+        catalog = search.CatalogSearch(rebuild_interval=60)
+
+        # Nhà hàng được thêm sau khi rebuild đã đọc DB nhưng trước khi thay chỉ mục
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if "FROM cuisine" in statement:
+                catalog.index_restaurant(SimpleNamespace(id=99, name="Phở Hà Nội", introduce=None))
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            catalog.rebuild()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        self.assertEqual(catalog.search_restaurants("pho"), [99])
+        self.assertEqual(len(catalog.search_restaurants("bun")), 1)
+
+    def test_keyword_pages_with_score_cursor(self):
+        manager = self.add_user("manager", Role.MANAGER)
+        for i in range(5):
+            db.session.add(Restaurant(name=f"Bún {i}", introduce="bún" if i % 2 else None, user_id=manager.id))
+        db.session.commit()
+        search.catalog.invalidate()
+
+        first, cursor = dao.get_restaurants(keyword="bun", page_size=2)
+        # Nhà hàng mới khớp từ khóa và điểm cao nhất: không làm trang sau lặp lại hay bỏ sót
+        new = Restaurant(name="Bún bún bún", introduce="bún", user_id=manager.id)
+        db.session.add(new)
+        db.session.commit()
+        search.index_model(new)
+
+        seen = [r.id for r in first]
+        while cursor:
+            page, cursor = dao.get_restaurants(keyword="bun", cursor=cursor, page_size=2)
+            seen += [r.id for r in page]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        self.assertNotIn(new.id, seen)
+
+    def test_review_does_not_invalidate(self):
+        catalog = search.catalog
+        catalog.rebuild()
+        search.index_model(Review(rate=5))
+        search.remove_model(Review(rate=5))
+        self.assertTrue(catalog._fresh())
+
+
+if __name__ == "__main__":
+    unittest.main()
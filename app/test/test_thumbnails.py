@@ -0,0 +1,140 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from app import app, thumbnails, index
+
+
+class TestDiskCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as root:
+            cache = thumbnails.DiskCache(root, max_bytes=10)
+            cache.put("a", b"1234")
+            cache.put("b", b"1234")
+            self.assertIsNotNone(cache.get("a"))
+            cache.put("c", b"1234")
+
+            self.assertIsNone(cache.get("b"))
+            self.assertFalse(os.path.exists(os.path.join(root, "b")))
+            self.assertIsNotNone(cache.get("a"))
+            self.assertEqual(cache.size(), 8)
+
+            # Tiến trình mới quét lại thư mục
+            self.assertEqual(thumbnails.DiskCache(root, max_bytes=10).size(), 8)
+
+
+class TestThumbnailRoute(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = thumbnails.disk_cache
+        thumbnails.disk_cache = thumbnails.DiskCache(self.tmp.name, 10 * 1024 * 1024)
+
+        uploads = os.path.join(app.static_folder, "uploads")
+        os.makedirs(uploads, exist_ok=True)
+        self.source = os.path.join(uploads, "thumb-test.png")
+        Image.new("RGBA", (1000, 500), (200, 30, 30, 128)).save(self.source)
+        self.src = "/static/uploads/thumb-test.png"
+        self.client = app.test_client()
+        thumbnails.failures.clear()
+
+    def tearDown(self):
+        thumbnails.disk_cache = self.cache
+        thumbnails.failures.clear()
+        os.remove(self.source)
+        self.tmp.cleanup()
+
+    def test_srcset(self):
+        with app.test_request_context():
+            srcset = thumbnails.srcset(self.src, "jpeg")
+            self.assertEqual([part.rsplit(" ", 1)[1] for part in srcset.split(", ")],
+                             [f"{w}w" for w in app.config["THUMB_WIDTHS"]])
+            self.assertEqual(thumbnails.srcset(None), "")
+            self.assertEqual(thumbnails.thumb_url("data:image/png;base64,xx", 320), "data:image/png;base64,xx")
+
+    def test_resized_cached_and_conditional(self):
+        with app.test_request_context():
+            url = thumbnails.thumb_url(self.src, 320, "webp")
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "image/webp")
+        self.assertEqual(Image.open(io.BytesIO(res.data)).size, (320, 160))
+        self.assertFalse(res.headers["ETag"].startswith("W/"))
+        self.assertIn("immutable", res.headers["Cache-Control"])
+        self.assertEqual(res.cache_control.max_age, app.config["THUMB_MAX_AGE"])
+
+        # Lần sau đọc từ cache, không đọc lại ảnh gốc
+        os.remove(self.source)
+        Image.new("RGB", (10, 10)).save(self.source)
+        again = self.client.get(url)
+        self.assertEqual(again.data, res.data)
+
+        not_modified = self.client.get(url, headers={"If-None-Match": res.headers["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b"")
+
+    def test_jpeg_flattens_alpha(self):
+        with app.test_request_context():
+            url = thumbnails.thumb_url(self.src, 160, "jpeg")
+        img = Image.open(io.BytesIO(self.client.get(url).data))
+        self.assertEqual((img.format, img.mode, img.size), ("JPEG", "RGB", (160, 80)))
+
+    def test_rejects_unsigned_or_unknown_sizes(self):
+        with app.test_request_context():
+            url = thumbnails.thumb_url(self.src, 320, "webp")
+        self.assertEqual(self.client.get(url.replace("/320.", "/321.")).status_code, 404)
+        self.assertEqual(self.client.get(url.replace(".webp", ".gif")).status_code, 404)
+        forged = url.replace("thumb-test.png", "other.png")
+        self.assertEqual(self.client.get(forged).status_code, 404)
+
+    def test_failures_cached_briefly(self):
+        src = "/static/uploads/thumb-missing.png"
+        with app.test_request_context():
+            url = thumbnails.thumb_url(src, 320, "webp")
+        res = self.client.get(url)
+        self.assertEqual((res.status_code, res.location), (302, src))
+
+        # Ảnh xuất hiện sau đó: vẫn trả lỗi đã nhớ cho tới khi hết hạn
+        path = os.path.join(app.static_folder, "uploads", "thumb-missing.png")
+        Image.new("RGB", (400, 200)).save(path)
+        try:
+            self.assertEqual(self.client.get(url).status_code, 302)
+            thumbnails.failures.clear()
+            self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            os.remove(path)
+
+    def test_remote_redirect_not_followed(self):
+        requested = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requested.append(self.path)
+                self.send_response(302)
+                self.send_header("Location", "/internal.png")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            src = f"http://127.0.0.1:{server.server_address[1]}/photo.png"
+            with self.assertRaises(thumbnails.ThumbnailError):
+                thumbnails.get_thumbnail(src, 320, "webp")
+            self.assertEqual(requested, ["/photo.png"])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import sys
+sys.path.append(r"C:\ProgramData\Jenkins\.jenkins\workspace\OUFood\app")
+
+import hashlib
+import hmac
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl, quote_plus
+from app.vnpay import VnpayRequest, VnpayResponse, canonical_query
+
+SECRET = "SECRETKEY"
+PARAMS = {"vnp_Version": "2.1.0", "vnp_Amount": 5000000, "vnp_TxnRef": "order-1",
+          "vnp_OrderInfo": "Thanh toán đơn hàng #1", "vnp_ReturnUrl": "http://localhost/vnpay_payment_return"}
+
+
+class TestVnpay(unittest.TestCase):
+    def test_matches_reference_signature(self):
+        query = "&".join(f"{k}={v}" for k, v in sorted(
+            (k, quote_plus(str(v))) for k, v in PARAMS.items()))
+        self.assertEqual(canonical_query(PARAMS), query)
+        url = VnpayRequest(PARAMS).get_payment_url("https://pay.example", SECRET)
+        self.assertTrue(url.endswith(hmac.new(SECRET.encode(), query.encode(), hashlib.sha512).hexdigest()))
+
+    def test_round_trip_and_tamper(self):
+        url = VnpayRequest(PARAMS, vnp_BankCode="").get_payment_url("https://pay.example", SECRET)
+        args = dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+        self.assertNotIn("vnp_BankCode", args)
+        self.assertTrue(VnpayResponse(args).validate(SECRET))
+        self.assertFalse(VnpayResponse({**args, "vnp_Amount": "1"}).validate(SECRET))
+        self.assertFalse(VnpayResponse(args).validate("OTHER"))
+
+    def test_immutable_per_request(self):
+        req = VnpayRequest(PARAMS)
+        with self.assertRaises(AttributeError):
+            req.params = {}
+        with self.assertRaises(TypeError):
+            req.params["vnp_TxnRef"] = "x"
+        self.assertEqual(req.with_params(vnp_TxnRef="order-2").params["vnp_TxnRef"], "order-2")
+        self.assertEqual(req.params["vnp_TxnRef"], "order-1")
+
+    def test_concurrent_requests_do_not_share_state(self):
+        def sign(i):
+            url = VnpayRequest(PARAMS, vnp_TxnRef=f"order-{i}").get_payment_url("https://pay.example", SECRET)
+            args = dict(parse_qsl(urlsplit(url).query))
+            return args["vnp_TxnRef"] == f"order-{i}" and VnpayResponse(args).validate(SECRET)
+
+        with ThreadPoolExecutor(8) as pool:
+            self.assertTrue(all(pool.map(sign, range(200))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,231 @@
+import hashlib
+import hmac
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import requests
+from PIL import Image, ImageOps
+from flask import url_for
+from werkzeug.security import safe_join
+from app import app, cache
+
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# Đổi khi đổi cách nén: ảnh cũ trong cache/trình duyệt có ETag khác nên không bị dùng lại
+VERSION = 1
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+# Cache ảnh thu nhỏ trên đĩa, giới hạn tổng dung lượng, bỏ ảnh lâu không dùng nhất khi đầy.
+# Thứ tự LRU giữ trong bộ nhớ; mtime của file được cập nhật khi đọc để tiến trình khác quét lại vẫn đúng thứ tự
+class DiskCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def get(self, name):
+        path = os.path.join(self.root, name)
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                return None
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Tiến trình khác đã xóa file
+                self._size -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+        return path
+
+    def put(self, name, data):
+        path = os.path.join(self.root, name)
+        with self._lock:
+            self._load()
+        tmp = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+        return path
+
+    def size(self):
+        with self._lock:
+            self._load()
+            return self._size
+
+
+disk_cache = DiskCache(app.config["THUMB_CACHE_DIR"], app.config["THUMB_CACHE_BYTES"])
+
+_inflight = {}
+_lock = threading.Lock()
+
+# Ảnh nguồn lỗi (không tải được, không phải ảnh) được nhớ một lúc: request sau trả lỗi ngay,
+# không tải/giải mã lại mỗi lần trang được mở
+failures = cache.TTLCache(maxsize=app.config["THUMB_FAILURE_CACHE_SIZE"], ttl=app.config["THUMB_FAILURE_TTL"])
+
+
+def signature(src):
+    return hmac.new(app.secret_key.encode('utf-8'), src.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def verify(src, sig):
+    return hmac.compare_digest(signature(src), str(sig))
+
+
+def _is_local(src):
+    return src.startswith("/static/")
+
+
+def supported(src):
+    if not src:
+        return False
+    if _is_local(src):
+        return True
+    return urlsplit(src).scheme in ("http", "https")
+
+
+# Ảnh nguồn không đổi nội dung theo URL (Cloudinary có version, ảnh local tên ngẫu nhiên)
+# nên khóa cache cũng là ETag mạnh
+def cache_key(src, width, fmt):
+    raw = f"{VERSION}|{app.config['THUMB_QUALITY']}|{src}|{width}|{fmt}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def thumb_url(src, width, fmt="webp"):
+    if not supported(src):
+        return src
+    return url_for("thumbnail", sig=signature(src), width=width, fmt=fmt, src=src)
+
+
+def srcset(src, fmt="webp"):
+    if not supported(src):
+        return ""
+    return ", ".join(f"{thumb_url(src, w, fmt)} {w}w" for w in app.config["THUMB_WIDTHS"])
+
+
+def _read_source(src):
+    limit = app.config["THUMB_MAX_SOURCE_BYTES"]
+    if _is_local(src):
+        path = safe_join(app.static_folder, src[len("/static/"):])
+        if path is None or not os.path.isfile(path):
+            raise ThumbnailError(f"Không tìm thấy ảnh {src}")
+        if os.path.getsize(path) > limit:
+            raise ThumbnailError(f"Ảnh {src} quá lớn")
+        with open(path, "rb") as f:
+            return f.read()
+
+    # Không theo chuyển hướng: chữ ký chỉ bảo đảm URL gốc, đích chuyển hướng có thể là địa chỉ nội bộ
+    try:
+        with requests.get(src, stream=True, timeout=app.config["THUMB_FETCH_TIMEOUT"], allow_redirects=False) as res:
+            if res.is_redirect:
+                raise ThumbnailError(f"Ảnh {src} bị chuyển hướng")
+            res.raise_for_status()
+            data = res.raw.read(limit + 1, decode_content=True)
+    except requests.RequestException as e:
+        raise ThumbnailError(f"Không tải được ảnh {src}") from e
+    if len(data) > limit:
+        raise ThumbnailError(f"Ảnh {src} quá lớn")
+    return data
+
+
+def render(data, width, fmt):
+    pil_format, _ = FORMATS[fmt]
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEG giải mã thẳng ở tỉ lệ nhỏ hơn, đỡ tốn CPU với ảnh gốc lớn
+        img.draft("RGB", (width, width))
+        img = ImageOps.exif_transpose(img)
+
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        if has_alpha and pil_format == "JPEG":
+            # JPEG không có kênh trong suốt: lót nền trắng
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if has_alpha else "RGB")
+
+        # Không phóng to ảnh nhỏ hơn bề rộng yêu cầu
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ThumbnailError("Ảnh nguồn không hợp lệ") from e
+
+    out = io.BytesIO()
+    if pil_format == "JPEG":
+        img.save(out, pil_format, quality=app.config["THUMB_QUALITY"], optimize=True, progressive=True)
+    else:
+        img.save(out, pil_format, quality=app.config["THUMB_QUALITY"], method=4)
+    return out.getvalue()
+
+
+# Trả đường dẫn file ảnh thu nhỏ, chỉ tạo một lần: nhiều request cùng ảnh chờ chung một lần tạo
+def get_thumbnail(src, width, fmt):
+    key = cache_key(src, width, fmt)
+    name = f"{key}.{fmt}"
+    path = disk_cache.get(name)
+    if path:
+        return path
+
+    error = failures.get(src)
+    if error is not None:
+        raise ThumbnailError(error)
+
+    with _lock:
+        lock = _inflight.setdefault(name, threading.Lock())
+    try:
+        with lock:
+            path = disk_cache.get(name)
+            if path:
+                return path
+            error = failures.get(src)
+            if error is not None:
+                raise ThumbnailError(error)
+            try:
+                data = render(_read_source(src), width, fmt)
+            except ThumbnailError as e:
+                failures.set(src, str(e))
+                raise
+            return disk_cache.put(name, data)
+    finally:
+        with _lock:
+            if _inflight.get(name) is lock and not lock.locked():
+                del _inflight[name]
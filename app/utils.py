@@ -1,3 +1,7 @@
+import base64
+import json
+
+
 def stats_cart_quantity(cart):
     total_quantity = 0
 
@@ -30,3 +34,40 @@ def stats_cart(cart):
         "total_quantity": total_quantity,
         "total_amount": total_amount
     }
+
+
+# Giỏ hàng mang sẵn tổng cộng dồn: đọc hai số, không duyệt lại các món
+def cart_totals(cart):
+    if not cart:
+        return {"total_quantity": 0, "total_amount": 0}
+
+    return {
+        "total_quantity": cart['total_quantity'],
+        "total_amount": cart['total_amount']
+    }
+
+
+def cart_totals_match(cart):
+    expected = stats_cart(cart)
+    totals = cart_totals(cart)
+    return expected['total_quantity'] == totals['total_quantity'] and \
+        abs(expected['total_amount'] - totals['total_amount']) < 0.5
+
+
+# Con trỏ phân trang dạng keyset: ["loại", giá trị...] mã hóa base64
+def encode_cursor(kind, *values):
+    raw = json.dumps([kind, *values], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, kind, *types):
+    if not cursor:
+        return None
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types) + 1 or values[0] != kind:
+            return None
+        return [t(v) for t, v in zip(types, values[1:])]
+    except (ValueError, TypeError):
+        return None
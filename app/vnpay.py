@@ -1,52 +1,91 @@
 import hashlib
 import hmac
-import urllib.parse
+import re
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import quote_plus
 
+HASH_PARAMS = ('vnp_SecureHash', 'vnp_SecureHashType')
+_SAFE = re.compile(r'[A-Za-z0-9_.~-]*')
 
-class vnpay:
-    requestData = {}
-    responseData = {}
+
+# Giá trị lặp lại giữa các request (mã TMN, URL trả về, ...) chỉ mã hóa một lần
+@lru_cache(maxsize=1024)
+def _quote_cached(value):
+    return quote_plus(value)
+
+
+def _quote(value):
+    value = str(value)
+    return value if _SAFE.fullmatch(value) else _quote_cached(value)
+
+
+# Chuỗi ký của VNPay: tham số sắp theo tên, giá trị mã hóa quote_plus, nối một lượt
+def canonical_query(params):
+    return "&".join([f"{k}={_quote(v)}" for k, v in sorted(params.items())])
+
+
+class Signer:
+    def __init__(self, secret_key):
+        # Trạng thái HMAC đã nạp khóa, mỗi lần ký chỉ copy() thay vì băm lại khóa
+        self._mac = hmac.new(secret_key.encode('utf-8'), digestmod=hashlib.sha512)
+
+    def sign(self, data):
+        mac = self._mac.copy()
+        mac.update(data.encode('utf-8'))
+        return mac.hexdigest()
+
+    def verify(self, data, secure_hash):
+        return hmac.compare_digest(self.sign(data), (secure_hash or '').lower())
+
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+
+def signer(secret_key):
+    s = _signers.get(secret_key)
+    if s is None:
+        with _signers_lock:
+            s = _signers.setdefault(secret_key, Signer(secret_key))
+    return s
+
+
+# Mỗi request một đối tượng bất biến; with_params trả về bản mới nên không có dữ liệu dùng chung giữa các luồng
+class VnpayRequest:
+    __slots__ = ('params',)
+
+    def __init__(self, params=None, **kwargs):
+        merged = {**(params or {}), **kwargs}
+        object.__setattr__(self, 'params', MappingProxyType({k: v for k, v in merged.items()
+                                                             if v is not None and v != ''}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("VnpayRequest là bất biến, dùng with_params")
+
+    def with_params(self, **kwargs):
+        return VnpayRequest(self.params, **kwargs)
 
     def get_payment_url(self, vnpay_payment_url, secret_key):
-        inputData = sorted(self.requestData.items())
-        queryString = ''
-        hasData = ''
-        seq = 0
-        for key, val in inputData:
-            if seq == 1:
-                queryString = queryString + "&" + key + '=' + urllib.parse.quote_plus(str(val))
-            else:
-                seq = 1
-                queryString = key + '=' + urllib.parse.quote_plus(str(val))
-
-        hashValue = self.__hmacsha512(secret_key, queryString)
-        return vnpay_payment_url + "?" + queryString + '&vnp_SecureHash=' + hashValue
-
-    def validate_response(self, secret_key):
-        vnp_SecureHash = self.responseData['vnp_SecureHash']
-        # Remove hash params
-        if 'vnp_SecureHash' in self.responseData.keys():
-            self.responseData.pop('vnp_SecureHash')
-
-        if 'vnp_SecureHashType' in self.responseData.keys():
-            self.responseData.pop('vnp_SecureHashType')
-
-        inputData = sorted(self.responseData.items())
-        hasData = ''
-        seq = 0
-        for key, val in inputData:
-            if str(key).startswith('vnp_'):
-                if seq == 1:
-                    hasData = hasData + "&" + str(key) + '=' + urllib.parse.quote_plus(str(val))
-                else:
-                    seq = 1
-                    hasData = str(key) + '=' + urllib.parse.quote_plus(str(val))
-        hashValue = self.__hmacsha512(secret_key, hasData)
-
-        return vnp_SecureHash == hashValue
-
-    @staticmethod
-    def __hmacsha512(key, data):
-        byteKey = key.encode('utf-8')
-        byteData = data.encode('utf-8')
-        return hmac.new(byteKey, byteData, hashlib.sha512).hexdigest()
+        query = canonical_query(self.params)
+        return f"{vnpay_payment_url}?{query}&vnp_SecureHash={signer(secret_key).sign(query)}"
+
+
+class VnpayResponse:
+    __slots__ = ('params', 'secure_hash')
+
+    def __init__(self, args):
+        args = dict(args)
+        object.__setattr__(self, 'secure_hash', args.get('vnp_SecureHash'))
+        object.__setattr__(self, 'params', MappingProxyType({k: v for k, v in args.items()
+                                                             if k.startswith('vnp_') and k not in HASH_PARAMS}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("VnpayResponse là bất biến")
+
+    def get(self, key, default=None):
+        return self.params.get(key, default)
+
+    def validate(self, secret_key):
+        return signer(secret_key).verify(canonical_query(self.params), self.secure_hash)